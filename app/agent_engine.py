@@ -0,0 +1,380 @@
+"""
+Agent auto-swipe engine.
+
+Each run goes over every active agent and right-swipes, on its owner's
+behalf, the best few users the owner hasn't swiped on yet. The swipes get
+the same bookkeeping as POST /swipes/{id}: a match when the target already
+liked the owner, and an entry on the agent's matchmaker queue.
+
+Scoring is vectorized with numpy. Every profile is loaded once, with a
+column-projected select, into arrays: codes for gender, location, education
+and industry, and a bit-packed user x tag matrix over the
+AGENT_ENGINE_MAX_TAGS most common tags (32 bytes a user for 256 tags). Users
+are also bucketed by gender and AGE_BAND-year age band. Agents are sorted by
+their hard filters and scored in blocks of AGENT_ENGINE_BLOCK_SIZE against
+only the users in buckets some agent in the block can pick from, and each
+block's picks are written in one transaction. A run costs a few queries per
+block, instead of one per agent and candidate. An agent with no gender or
+age filter still sees every user, so the arithmetic is bounded by agents x
+users, but it runs in numpy.
+
+Preferences come from Agent.notes, as "key: value" pairs separated by ";"
+or newlines:
+
+    gender: female, other; age: 25-35; tags: hiking, coffee; location: Sydney
+
+gender and age are hard filters. Tags, location and age closeness score the
+candidates, and fall back to the owner's own tags, location and age. A shared
+education or industry adds a little. Picks scoring below
+AGENT_ENGINE_MIN_SCORE are skipped.
+
+Run it from cron, or keep it running:
+  python -m app.agent_engine
+  python -m app.agent_engine --every 3600
+"""
+import argparse
+import os
+import re
+import time
+from collections import Counter
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import Row, select
+from sqlalchemy.orm import Session
+
+from app import matchmaker_queue, models, sharding, versions
+from app.database import insert_ignore
+from app.sharding import ShardRouter, SwipeStore
+
+AGENT_ENGINE_PICKS = int(os.getenv("AGENT_ENGINE_PICKS", "10"))  # right swipes per agent per run
+AGENT_ENGINE_MIN_SCORE = float(os.getenv("AGENT_ENGINE_MIN_SCORE", "0.3"))
+# Agents scored together; each block holds a float32 score per (agent, user).
+AGENT_ENGINE_BLOCK_SIZE = int(os.getenv("AGENT_ENGINE_BLOCK_SIZE", "64"))
+AGENT_ENGINE_MAX_TAGS = int(os.getenv("AGENT_ENGINE_MAX_TAGS", "256"))
+
+WEIGHTS = {"tags": 0.5, "age": 0.2, "location": 0.2, "education": 0.05, "industry": 0.05}
+AGE_SPREAD = 10.0  # years from the wanted age at which the age score reaches 0
+AGE_BAND = 5  # years per candidate bucket
+TAG_CHUNK = 16384  # candidates whose tags are unpacked at a time
+
+USER_COLUMNS = (
+    models.User.id, models.User.gender, models.User.age, models.User.location, models.User.tags,
+    models.User.education, models.User.industry,
+)
+GENDERS = list(models.GenderEnum)
+EDUCATIONS = {e: i for i, e in enumerate(models.EducationEnum)}
+INDUSTRIES = {e: i for i, e in enumerate(models.IndustryEnum)}
+
+
+class Preferences(NamedTuple):
+    genders: Optional[frozenset] = None
+    min_age: Optional[int] = None
+    max_age: Optional[int] = None
+    tags: tuple[str, ...] = ()
+    location: Optional[str] = None
+
+
+def split_tags(tags: Optional[str]) -> list[str]:
+    return [t for t in (tag.strip().lower() for tag in (tags or "").split(",")) if t]
+
+
+def parse_notes(notes: Optional[str]) -> Preferences:
+    """Preferences from Agent.notes; unknown keys and malformed values are ignored."""
+    values = {}
+    for part in re.split(r"[;\n]", notes or ""):
+        key, sep, value = part.partition(":")
+        key, value = key.strip().lower(), value.strip()
+        if not sep or not value:
+            continue
+        if key == "gender":
+            genders = frozenset(g for g in GENDERS if g.value in {v.strip().lower() for v in value.split(",")})
+            if genders:
+                values["genders"] = genders
+        elif key == "age":
+            match = re.fullmatch(r"(\d+)\s*(?:(-)\s*(\d+)|(\+))?", value)
+            if match:
+                low, dash, high, plus = match.groups()
+                values["min_age"] = int(low)
+                if not plus:
+                    values["max_age"] = int(high) if dash else int(low)
+        elif key == "tags":
+            values["tags"] = tuple(split_tags(value))
+        elif key == "location":
+            values["location"] = value.lower()
+    return Preferences(**values)
+
+
+def _codes(values: Sequence, mapping: dict) -> np.ndarray:
+    return np.fromiter((mapping.get(v, -1) for v in values), dtype=np.int16, count=len(values))
+
+
+class Population:
+    """Every user's scoring attributes as arrays, in id order."""
+
+    def __init__(self, rows: Sequence[Row], max_tags: int = 256):
+        n = len(rows)
+        self.ids = np.fromiter((r.id for r in rows), dtype=np.int64, count=n)
+        self.genders = _codes([r.gender for r in rows], {g: i for i, g in enumerate(GENDERS)})
+        self.ages = np.fromiter((r.age for r in rows), dtype=np.float32, count=n)
+        self.educations = _codes([r.education for r in rows], EDUCATIONS)
+        self.industries = _codes([r.industry for r in rows], INDUSTRIES)
+
+        names: dict[str, int] = {}
+        self.locations = np.fromiter(
+            (names.setdefault(r.location.strip().lower(), len(names)) if r.location else -1 for r in rows),
+            dtype=np.int32, count=n,
+        )
+        self.location_names = list(names)
+        self._location_matches: dict[str, np.ndarray] = {}
+
+        tag_lists = [split_tags(r.tags) for r in rows]
+        counts = Counter(tag for tags in tag_lists for tag in set(tags))
+        self.vocabulary = {tag: i for i, (tag, _) in enumerate(counts.most_common(max_tags))}
+        # One bit per (user, tag), in np.packbits order.
+        self.tags = np.zeros((n, (len(self.vocabulary) + 7) // 8), dtype=np.uint8)
+        cells = [(row, self.vocabulary[tag]) for row, tags in enumerate(tag_lists)
+                 for tag in set(tags) if tag in self.vocabulary]
+        if cells:
+            users, tags = np.array(cells, dtype=np.int64).T
+            np.bitwise_or.at(self.tags, (users, tags // 8), (128 >> (tags % 8)).astype(np.uint8))
+
+        # Rows ordered by (gender, age band), so a bucket range is one slice.
+        bands = np.clip(self.ages // AGE_BAND, 0, None).astype(np.int64)
+        self._bands = int(bands.max()) + 1 if n else 1
+        keys = self.genders.astype(np.int64) * self._bands + bands
+        self._bucket_order = np.argsort(keys, kind="stable")
+        self._bucket_keys = keys[self._bucket_order]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def positions(self, user_ids) -> np.ndarray:
+        """Row of each user id, -1 for ids not loaded."""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(user_ids), -1)
+        found = np.searchsorted(self.ids, user_ids).clip(0, len(self.ids) - 1)
+        return np.where(self.ids[found] == user_ids, found, -1)
+
+    def location_matches(self, wanted: str) -> np.ndarray:
+        """Per location code (plus a trailing False for -1), whether it contains ``wanted``."""
+        if wanted not in self._location_matches:
+            self._location_matches[wanted] = np.array([wanted in name for name in self.location_names] + [False])
+        return self._location_matches[wanted]
+
+    def tag_matrix(self, rows: np.ndarray) -> np.ndarray:
+        """The users' tags as a dense (rows x tags) 0/1 matrix."""
+        return np.unpackbits(self.tags[rows], axis=1, count=len(self.vocabulary)).astype(np.float32)
+
+    def candidates(self, preferences: Sequence[Preferences]) -> np.ndarray:
+        """Sorted rows of the users in any gender and age bucket one of ``preferences`` allows."""
+        if any(prefs.genders is None and prefs.min_age is None for prefs in preferences):
+            return np.arange(len(self))
+        slices = []
+        for prefs in preferences:
+            low = prefs.min_age // AGE_BAND if prefs.min_age is not None else 0
+            high = prefs.max_age // AGE_BAND if prefs.max_age is not None else self._bands
+            for gender in prefs.genders or GENDERS:
+                base = GENDERS.index(gender) * self._bands
+                start = np.searchsorted(self._bucket_keys, base + low, side="left")
+                stop = np.searchsorted(self._bucket_keys, base + min(high, self._bands - 1), side="right")
+                slices.append(self._bucket_order[start:stop])
+        return np.unique(np.concatenate(slices))
+
+
+def score_block(population: Population, owners: np.ndarray, preferences: Sequence[Preferences],
+                cols: Optional[np.ndarray] = None) -> np.ndarray:
+    """(owners x cols) scores in [0, 1]; -inf where a hard filter rules the pair out.
+
+    ``cols`` are the sorted candidate rows to score, by default every user.
+    """
+    pop = population
+    cols = np.arange(len(pop)) if cols is None else cols
+    b = len(owners)
+    ages, genders, locations = pop.ages[cols], pop.genders[cols], pop.locations[cols]
+    query = pop.tag_matrix(owners)
+    target_age = pop.ages[owners].copy()
+    min_age = np.zeros(b, dtype=np.float32)
+    max_age = np.full(b, np.inf, dtype=np.float32)
+    allowed = np.ones((b, len(GENDERS)), dtype=bool)
+    location = np.zeros((b, len(cols)), dtype=np.float32)
+    for row, (owner, prefs) in enumerate(zip(owners, preferences)):
+        if prefs.tags:
+            query[row] = 0.0
+            query[row, [pop.vocabulary[t] for t in prefs.tags if t in pop.vocabulary]] = 1.0
+        if prefs.min_age is not None:
+            min_age[row] = prefs.min_age
+            max_age[row] = prefs.max_age if prefs.max_age is not None else np.inf
+            target_age[row] = (prefs.min_age + prefs.max_age) / 2 if prefs.max_age is not None else prefs.min_age
+        if prefs.genders:
+            allowed[row] = [g in prefs.genders for g in GENDERS]
+        if prefs.location:
+            location[row] = pop.location_matches(prefs.location)[locations]
+        elif pop.locations[owner] >= 0:
+            location[row] = locations == pop.locations[owner]
+
+    scores = np.empty((b, len(cols)), dtype=np.float32)
+    for start in range(0, len(cols), TAG_CHUNK):
+        chunk = cols[start:start + TAG_CHUNK]
+        scores[:, start:start + len(chunk)] = query @ pop.tag_matrix(chunk).T
+    scores *= WEIGHTS["tags"] / np.maximum(query.sum(axis=1, keepdims=True), 1.0)
+    scores += WEIGHTS["age"] * np.clip(1.0 - np.abs(ages - target_age[:, None]) / AGE_SPREAD, 0.0, 1.0)
+    scores += WEIGHTS["location"] * location
+    for name, codes in (("education", pop.educations), ("industry", pop.industries)):
+        own = codes[owners][:, None]
+        scores += WEIGHTS[name] * ((codes[cols] == own) & (own >= 0))
+
+    ok = allowed[:, genders] & (ages >= min_age[:, None]) & (ages <= max_age[:, None])
+    scores[~ok] = -np.inf
+    if len(cols):
+        found = np.searchsorted(cols, owners).clip(0, len(cols) - 1)
+        own = cols[found] == owners
+        scores[np.flatnonzero(own), found[own]] = -np.inf
+    return scores
+
+
+def top_picks(scores: np.ndarray, k: int, min_score: float) -> list[np.ndarray]:
+    """Per row, the columns of its ``k`` best scores of at least ``min_score``, best first."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return [np.empty(0, dtype=np.int64) for _ in range(len(scores))]
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    best = np.take_along_axis(best, order, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    return [cols[row_scores >= min_score] for cols, row_scores in zip(best, best_scores)]
+
+
+def _filter_key(prefs: Preferences) -> tuple:
+    genders = sorted(GENDERS.index(g) for g in prefs.genders) if prefs.genders else []
+    return (genders, prefs.min_age or 0, prefs.max_age if prefs.max_age is not None else float("inf"))
+
+
+def _by_session(store: SwipeStore, user_ids) -> list[tuple[Session, list[int]]]:
+    groups: dict[int, tuple[Session, list[int]]] = {}
+    for user_id in user_ids:
+        session = store.session_for(user_id)
+        groups.setdefault(id(session), (session, []))[1].append(user_id)
+    return list(groups.values())
+
+
+def swiped_pairs(store: SwipeStore, user_ids: Sequence[int]) -> list[tuple[int, int]]:
+    """(user id, target id) of every swipe the users made, read from their shards."""
+    pairs = []
+    for session, ids in _by_session(store, user_ids):
+        pairs.extend(session.execute(
+            select(models.Swipe.user_id, models.Swipe.target_user_id).where(models.Swipe.user_id.in_(ids))
+        ).all())
+    return pairs
+
+
+def submit(store: SwipeStore, picks: Sequence[tuple[Row, int]]) -> int:
+    """Right-swipe (agent row, target id) ``picks`` in one transaction; returns the matches made."""
+    db = store.db
+    owners = sorted({agent.user_id for agent, _ in picks})
+    for session, ids in _by_session(store, owners):
+        ids = set(ids)
+        session.execute(insert_ignore(session.get_bind(), models.Swipe), [
+            {"user_id": agent.user_id, "target_user_id": target, "direction": models.SwipeDirectionEnum.right}
+            for agent, target in picks if agent.user_id in ids
+        ])
+
+    liked = set()
+    for session, ids in _by_session(store, sorted({target for _, target in picks})):
+        liked.update(session.execute(
+            select(models.Swipe.user_id, models.Swipe.target_user_id).where(
+                models.Swipe.user_id.in_(ids), models.Swipe.target_user_id.in_(owners),
+                models.Swipe.direction == models.SwipeDirectionEnum.right,
+            )
+        ).all())
+    matched = sorted({tuple(sorted((agent.user_id, target))) for agent, target in picks
+                      if (target, agent.user_id) in liked})
+    if matched:
+        db.execute(insert_ignore(db.get_bind(), models.Match),
+                   [{"user1_id": u1, "user2_id": u2} for u1, u2 in matched])
+
+    matchmaker_queue.enqueue_many(db, [(agent.id, target) for agent, target in picks])
+    versions.touch(db, [(versions.SWIPES, owner) for owner in owners])
+    versions.touch(db, [(versions.LIKES, user_id) for agent, target in picks for user_id in (agent.user_id, target)])
+    versions.touch(db, [(versions.MATCHES, user_id) for pair in matched for user_id in pair])
+    store.commit()
+    return len(matched)
+
+
+def run(db: Session, shard_router: ShardRouter = sharding.router, picks: int = AGENT_ENGINE_PICKS,
+        min_score: float = AGENT_ENGINE_MIN_SCORE, block_size: int = AGENT_ENGINE_BLOCK_SIZE,
+        max_tags: int = AGENT_ENGINE_MAX_TAGS, dry_run: bool = False) -> dict[str, float]:
+    """Score and swipe for every active agent; returns counts and the time taken."""
+    started = time.perf_counter()
+    stats = {"agents": 0, "users": 0, "swipes": 0, "matches": 0}
+    agents = db.execute(
+        select(models.Agent.id, models.Agent.user_id, models.Agent.notes)
+        .where(models.Agent.status == models.AgentStatusEnum.active)
+        .order_by(models.Agent.id)
+    ).all()
+    if agents:
+        population = Population(db.execute(select(*USER_COLUMNS).order_by(models.User.id)).all(), max_tags)
+        stats["users"] = len(population)
+        owner_rows = population.positions([agent.user_id for agent in agents])
+        agents = [agent for agent, row in zip(agents, owner_rows) if row >= 0]
+        # Agents with the same hard filters share blocks, and so share candidate buckets.
+        preferences = {agent.id: parse_notes(agent.notes) for agent in agents}
+        agents.sort(key=lambda agent: _filter_key(preferences[agent.id]))
+        store = SwipeStore(db, shard_router)
+        try:
+            for start in range(0, len(agents), block_size):
+                block = agents[start:start + block_size]
+                owners = population.positions([agent.user_id for agent in block])
+                block_prefs = [preferences[agent.id] for agent in block]
+                cols = population.candidates(block_prefs)
+                scores = score_block(population, owners, block_prefs, cols)
+
+                swiped = swiped_pairs(store, [agent.user_id for agent in block])
+                if swiped and len(cols):
+                    block_row = {agent.user_id: row for row, agent in enumerate(block)}
+                    users, targets = zip(*swiped)
+                    target_rows = population.positions(targets)
+                    found = np.searchsorted(cols, target_rows).clip(0, len(cols) - 1)
+                    seen = cols[found] == target_rows
+                    rows = np.fromiter((block_row[u] for u in users), dtype=np.int64, count=len(users))
+                    scores[rows[seen], found[seen]] = -np.inf
+
+                chosen = [(agent, int(population.ids[cols[col]]))
+                          for agent, picked in zip(block, top_picks(scores, picks, min_score)) for col in picked]
+                stats["agents"] += len(block)
+                stats["swipes"] += len(chosen)
+                if chosen and not dry_run:
+                    stats["matches"] += submit(store, chosen)
+        finally:
+            store.close()
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--every", type=float, default=0, help="run again every N seconds (default: once)")
+    parser.add_argument("--picks", type=int, default=AGENT_ENGINE_PICKS, help="right swipes per agent per run")
+    parser.add_argument("--min-score", type=float, default=AGENT_ENGINE_MIN_SCORE)
+    parser.add_argument("--block-size", type=int, default=AGENT_ENGINE_BLOCK_SIZE, help="agents scored together")
+    parser.add_argument("--dry-run", action="store_true", help="score and count picks without swiping")
+    args = parser.parse_args()
+
+    from app.database import SessionLocal
+
+    while True:
+        with SessionLocal() as db:
+            stats = run(db, picks=args.picks, min_score=args.min_score, block_size=args.block_size,
+                        dry_run=args.dry_run)
+        verb = "Would swipe" if args.dry_run else "Swiped"
+        print(f"{verb} {stats['swipes']} for {stats['agents']} agents over {stats['users']} users "
+              f"({stats['matches']} matches) in {stats['seconds']:.1f}s.")
+        if args.every <= 0:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -40,3 +40,31 @@ def decode_token(token: str) -> Optional[int]:
         return int(user_id_str)
     except JWTError:
         return None
+
+
+UPLOAD_TOKEN_EXPIRE_SECONDS = 15 * 60
+
+
+def create_upload_token(key: str, content_hash: str, size: int, content_type: str) -> str:
+    """Signed permission to PUT exactly these bytes to ``key`` on local storage."""
+    expire = datetime.now(timezone.utc) + timedelta(seconds=UPLOAD_TOKEN_EXPIRE_SECONDS)
+    payload = {
+        "key": key,
+        "sha256": content_hash,
+        "size": size,
+        "content_type": content_type,
+        "exp": expire,
+        "iss": "tinderido",
+        "aud": "tinderido-upload",
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def decode_upload_token(token: str) -> Optional[dict]:
+    try:
+        return jwt.decode(
+            token, SECRET_KEY, algorithms=[ALGORITHM],
+            audience="tinderido-upload", issuer="tinderido",
+        )
+    except JWTError:
+        return None
@@ -0,0 +1,71 @@
+"""
+BlurHash encoder (https://blurha.sh): a photo squeezed into ~30 ASCII chars
+that clients decode into a blurred preview while the real image loads.
+
+Pure Python; callers downscale to a few dozen pixels first, which is all the
+handful of cosine components below can represent anyway.
+"""
+import math
+
+BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+_SRGB_TO_LINEAR = [
+    v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+    for v in (i / 255 for i in range(256))
+]
+
+
+def _base83(value: int, length: int) -> str:
+    return "".join(BASE83[value // 83 ** (length - 1 - i) % 83] for i in range(length))
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = min(max(value, 0.0), 1.0)
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exp: float) -> float:
+    return math.copysign(abs(value) ** exp, value)
+
+
+def encode(rgb: bytes, width: int, height: int, x_components: int = 4, y_components: int = 3) -> str:
+    """Hash of packed row-major 8-bit RGB pixels (``Image.tobytes()`` of an RGB image)."""
+    if not (1 <= x_components <= 9 and 1 <= y_components <= 9):
+        raise ValueError("BlurHash supports 1-9 components per axis")
+
+    table = _SRGB_TO_LINEAR
+    linear = [(table[rgb[k]], table[rgb[k + 1]], table[rgb[k + 2]]) for k in range(0, width * height * 3, 3)]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            r = g = b = 0.0
+            for y in range(height):
+                cy = cos_y[j][y]
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[i][x] * cy
+                    pr, pg, pb = linear[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = (1 if i == j == 0 else 2) / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        quantised = max(0, min(82, int(max(abs(v) for f in ac for v in f) * 166 - 0.5)))
+        max_ac = (quantised + 1) / 166
+    else:
+        quantised, max_ac = 0, 1.0
+    result += _base83(quantised, 1)
+    result += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+    for f in ac:
+        r, g, b = (max(0, min(18, int(_sign_pow(v / max_ac, 0.5) * 9 + 9.5))) for v in f)
+        result += _base83(r * 19 * 19 + g * 19 + b, 2)
+    return result
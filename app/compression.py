@@ -0,0 +1,128 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+Compresses complete JSON and text bodies of at least COMPRESSION_MIN_SIZE
+bytes, with brotli when the client accepts it and the ``brotli`` package is
+installed, gzip otherwise. Bodies of COMPRESSION_THREAD_SIZE bytes or more
+are compressed in the threadpool so a large swipe history doesn't stall the
+event loop; zlib and brotli both release the GIL while they work.
+
+Streamed responses (photos, anything sent in several chunks) and responses
+that already carry a Content-Encoding pass through untouched.
+"""
+import gzip
+import os
+from typing import Optional
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_THREAD_SIZE = int(os.getenv("COMPRESSION_THREAD_SIZE", str(64 * 1024)))
+GZIP_LEVEL = 6
+# Brotli's dynamic-content sweet spot: close to gzip's speed, noticeably smaller.
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE_TYPES = (
+    "application/json", "application/msgpack", "text/", "application/javascript", "image/svg+xml",
+)
+
+
+def accept_qvalues(header: str) -> dict[str, float]:
+    """Lower-cased values of an Accept or Accept-Encoding header mapped to their q."""
+    accepted = {}
+    for part in header.split(","):
+        value, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, number = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        if value:
+            accepted[value.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """"br", "gzip" or None for an Accept-Encoding header value."""
+    accepted = accept_qvalues(accept_encoding)
+
+    def ok(coding: str) -> bool:
+        return accepted.get(coding, accepted.get("*", 0.0)) > 0
+
+    if brotli is not None and ok("br"):
+        return "br"
+    if ok("gzip"):
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, min_size: int = COMPRESSION_MIN_SIZE,
+                 thread_size: int = COMPRESSION_THREAD_SIZE):
+        self.app = app
+        self.min_size = min_size
+        self.thread_size = thread_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if not content_type.startswith(COMPRESSIBLE_TYPES) or "content-encoding" in headers:
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message  # held until we know whether the body is compressed
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if more or encoding is None or len(body) < self.min_size:
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) >= self.thread_size:
+                body = await anyio.to_thread.run_sync(compress, body, encoding)
+            else:
+                body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            passthrough = True
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,16 +1,100 @@
 import os
-from sqlalchemy import create_engine
+import threading
+from typing import Optional
+
+from sqlalchemy import Engine, Insert, create_engine, insert
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./tinder_ido.db")
 
-connect_args = {}
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    connect_args["check_same_thread"] = False
+# Comma-separated read-only replicas, e.g. "sqlite:///./replica1.db,sqlite:///./replica2.db"
+REPLICA_DATABASE_URLS = [
+    url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()
+]
+
+# Comma-separated databases holding the swipes table, one per shard. Order matters:
+# a user's shard is chosen by position, so append new shards and run reshard_swipes.py.
+SWIPE_SHARD_URLS = [
+    url.strip() for url in os.getenv("SWIPE_SHARD_URLS", "").split(",") if url.strip()
+]
+
+
+def connect_args_for(url: str) -> dict:
+    connect_args = {}
+    if url.startswith("sqlite"):
+        connect_args["check_same_thread"] = False
+    return connect_args
+
+
+# Engines are built on first use rather than at import, so importing the app
+# never loads a DB driver or touches the database.
+_engine: Optional[Engine] = None
+_replica_engines: Optional[list[Engine]] = None
+_swipe_shard_engines: Optional[list[Engine]] = None
+_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = create_engine(
+                    SQLALCHEMY_DATABASE_URL, connect_args=connect_args_for(SQLALCHEMY_DATABASE_URL),
+                )
+    return _engine
+
+
+def get_replica_engines() -> list[Engine]:
+    global _replica_engines
+    if _replica_engines is None:
+        with _lock:
+            if _replica_engines is None:
+                _replica_engines = [
+                    create_engine(url, connect_args=connect_args_for(url)) for url in REPLICA_DATABASE_URLS
+                ]
+    return _replica_engines
+
+
+def get_swipe_shard_engines() -> list[Engine]:
+    global _swipe_shard_engines
+    if _swipe_shard_engines is None:
+        with _lock:
+            if _swipe_shard_engines is None:
+                _swipe_shard_engines = [
+                    create_engine(url, connect_args=connect_args_for(url)) for url in SWIPE_SHARD_URLS
+                ]
+    return _swipe_shard_engines
+
+
+# Dialects whose INSERT can skip rows that hit a unique constraint.
+INSERT_IGNORE_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def insert_ignore(bind: Engine, table) -> Insert:
+    """INSERT into ``table`` that skips duplicate rows; a plain INSERT on other dialects."""
+    dialect_insert = INSERT_IGNORE_DIALECTS.get(bind.dialect.name)
+    if dialect_insert is None:
+        return insert(table)
+    return dialect_insert(table).on_conflict_do_nothing()
+
+
+def __getattr__(name: str):
+    # Keeps `from app.database import engine` working for scripts.
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _LazySessionmaker(sessionmaker):
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None and local_kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = _LazySessionmaker(autocommit=False, autoflush=False)
 
 
 class Base(DeclarativeBase):
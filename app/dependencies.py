@@ -1,13 +1,14 @@
-from typing import Generator
-from fastapi import Depends, HTTPException, status
+from typing import Callable, Generator, Optional
+from fastapi import Depends, HTTPException, Query, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 
 from app.database import SessionLocal
-from app import auth, models
+from app import auth, models, pagination, profiling, replicas, serialization, sharding, versions
 
 
 def get_db() -> Generator[Session, None, None]:
+    profiling.enlist()
     db = SessionLocal()
     try:
         yield db
@@ -18,26 +19,151 @@ def get_db() -> Generator[Session, None, None]:
 bearer_scheme = HTTPBearer()
 
 
-def get_current_user(
+def get_read_db(
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
     db: Session = Depends(get_db),
-) -> models.User:
-    token = credentials.credentials
-    user_id = auth.decode_token(token)
+) -> Generator[Session, None, None]:
+    """Session for read-only endpoints: a replica unless the caller wrote recently."""
+    router = replicas.router
+    user_id = auth.decode_token(credentials.credentials)
+    if not router.enabled or (user_id is not None and router.recently_wrote(user_id)):
+        yield db
+        return
+
+    replica = router.session()
+    try:
+        yield replica
+    finally:
+        replica.close()
+
 
+def get_swipe_store(db: Session = Depends(get_db)) -> Generator[sharding.SwipeStore, None, None]:
+    store = sharding.SwipeStore(db, sharding.router)
+    try:
+        yield store
+    finally:
+        store.close()
+
+
+def get_read_swipe_store(
+    db: Session = Depends(get_read_db),
+) -> Generator[sharding.SwipeStore, None, None]:
+    store = sharding.SwipeStore(db, sharding.router)
+    try:
+        yield store
+    finally:
+        store.close()
+
+
+def _token_user_id(credentials: HTTPAuthorizationCredentials) -> int:
+    user_id = auth.decode_token(credentials.credentials)
     if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return user_id
+
+
+def _user_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="User not found",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: Session = Depends(get_db),
+) -> models.User:
+    user_id = _token_user_id(credentials)
 
     user = db.get(models.User, user_id)
     if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _user_not_found()
 
+    replicas.track_writes(db, user.id)
     return user
+
+
+def get_current_read_user(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: Session = Depends(get_read_db),
+    primary: Session = Depends(get_db),
+) -> models.User:
+    user_id = _token_user_id(credentials)
+
+    user = db.get(models.User, user_id)
+    if user is None and db is not primary:
+        # The account may not have replicated yet.
+        user = primary.get(models.User, user_id)
+    if user is None:
+        raise _user_not_found()
+
+    return user
+
+
+def _all_fields() -> None:
+    return None
+
+
+def profile_fields(
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated profile fields to return, e.g. `id,name,thumbnail_url`. "
+                    "`id` is always included. Default: all.",
+    ),
+) -> Optional[tuple[str, ...]]:
+    try:
+        return serialization.parse_fields(fields)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
+
+def page_cursor(
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page."),
+) -> Optional[pagination.Cursor]:
+    if cursor is None:
+        return None
+    try:
+        return pagination.decode_cursor(cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
+
+def conditional_get(scope: str, sparse: bool = False) -> Callable[..., Optional[versions.Snapshot]]:
+    """Dependency answering If-None-Match for the caller's ``scope`` from memory.
+
+    The caller is looked up first, so a deleted account gets 401 rather than
+    304; that primary key lookup is the only query a 304 runs. Yields the
+    snapshot to pass to ``versions.response_headers``, or None when the
+    version can't be known up front (ETags off, or a matchmaker queue whose
+    agent id isn't cached yet). Each representation
+    (MessagePack or JSON, and each set of query parameters such as ?fields=
+    or a page cursor) gets its own ETag.
+    """
+    def check(
+        request: Request,
+        current_user: models.User = Depends(get_current_read_user),
+        fields: Optional[tuple[str, ...]] = Depends(profile_fields if sparse else _all_fields),
+    ) -> Optional[versions.Snapshot]:
+        tracker = versions.tracker
+        if not tracker.enabled:
+            return None
+        user_id = current_user.id
+        key_id = tracker.agent_for(user_id) if scope == versions.MATCHMAKER else user_id
+        if key_id is None:
+            return None
+        snapshot = tracker.snapshot((scope, key_id), variant=serialization.representation(request, fields))
+        if versions.etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+            raise versions.NotModified(snapshot.etag)
+        return snapshot
+
+    return check
+
+
+def replica_stale_window() -> float:
+    """How far back a replica read may miss writes, for ``versions.response_headers``."""
+    return replicas.router.read_your_writes_seconds if replicas.router.enabled else 0.0
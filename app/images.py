@@ -0,0 +1,174 @@
+"""
+Resized photo variants, generated off the request path, and the BlurHash
+placeholders shown while they load.
+
+After upload_photos commits, each new photo is queued on ``pipeline``; a
+worker renders the variants below as WebP next to the original blob and
+records their keys on ``UserPhoto.variants``. Until that lands, the variant
+URLs fall back to the original. Variants are keyed by content, so a blob
+shared by several photos is only rendered once.
+
+Placeholders are cheap (a reduced-scale decode of a 32px image) and are
+computed during the upload itself so the upload response already has them.
+
+Backfill photos uploaded before the pipeline existed with:
+  python -m app.images
+"""
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Optional
+
+from PIL import Image, ImageOps
+from sqlalchemy import Engine, select
+from sqlalchemy.orm import Session
+
+from app import blurhash, models, photo_store
+from app.storage import StorageBackend
+
+# Longest edge in pixels for each variant.
+VARIANTS = {"thumb": 160, "card": 640, "full": 1440}
+VARIANT_FORMAT = "webp"
+VARIANT_QUALITY = 80
+PLACEHOLDER_EDGE = 32
+
+logger = logging.getLogger(__name__)
+
+# Pillow releases the GIL while decoding, resizing and encoding, so threads scale.
+# 0 processes photos inline in the submitting thread.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+
+def variant_filename(filename: str, variant: str) -> str:
+    stem = filename.rsplit(".", 1)[0]
+    return f"{stem}_{variant}.{VARIANT_FORMAT}"
+
+
+def render_variants(storage: StorageBackend, filename: str) -> dict[str, str]:
+    """Write any missing variant of ``filename`` into the store; returns name -> key."""
+    rendered = {variant: variant_filename(filename, variant) for variant in VARIANTS}
+    missing = [v for v, key in rendered.items() if not storage.exists(key)]
+    if not missing:
+        return rendered
+
+    with storage.open(filename) as f, Image.open(f) as source:
+        source.seek(0)  # first frame of animated GIF/WebP
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+    for variant in missing:
+        resized = image.copy()
+        resized.thumbnail((VARIANTS[variant], VARIANTS[variant]), Image.Resampling.LANCZOS)
+        staged = storage.staging_path()
+        resized.save(staged, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+        storage.put_file(staged, rendered[variant])
+    return rendered
+
+
+def make_placeholder(f: BinaryIO) -> Optional[str]:
+    """BlurHash of an image file, or None if Pillow can't decode it."""
+    try:
+        with Image.open(f) as source:
+            source.draft("RGB", (PLACEHOLDER_EDGE * 4, PLACEHOLDER_EDGE * 4))  # JPEG: decode at 1/2-1/8 scale
+            image = ImageOps.exif_transpose(source).convert("RGB")
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    image.thumbnail((PLACEHOLDER_EDGE, PLACEHOLDER_EDGE), Image.Resampling.BOX)
+    width, height = image.size
+    x_components, y_components = (4, 3) if width >= height else (3, 4)
+    return blurhash.encode(image.tobytes(), width, height, x_components, y_components)
+
+
+def process_photo(photo_id: int, bind: Engine, storage: StorageBackend) -> Optional[dict[str, str]]:
+    with Session(bind) as db:
+        photo = db.get(models.UserPhoto, photo_id)
+        if photo is None:
+            return None  # deleted before we got to it
+        filename, content_hash = photo.filename, photo.content_hash
+        placeholder = photo.placeholder
+
+    variants = render_variants(storage, filename)
+    if placeholder is None:
+        with storage.open(filename) as f:
+            placeholder = make_placeholder(f)
+
+    with Session(bind) as db:
+        photo = db.get(models.UserPhoto, photo_id)
+        if photo is None:
+            # The last reference may have gone while we rendered.
+            photo_store.release(db, storage, filename, content_hash)
+            return None
+        photo.variants = variants
+        photo.placeholder = placeholder
+        db.commit()
+    return variants
+
+
+class ImagePipeline:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: set[Future] = set()
+        self._lock = threading.Lock()
+
+    def submit(self, photo_id: int, bind: Engine, storage: StorageBackend) -> Future:
+        if self.workers == 0:
+            future = Future()
+            try:
+                future.set_result(process_photo(photo_id, bind, storage))
+            except Exception as exc:
+                future.set_exception(exc)
+            self._done(future)
+            return future
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="image")
+            future = self._executor.submit(process_photo, photo_id, bind, storage)
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Photo processing failed", exc_info=future.exception())
+
+    def drain(self) -> None:
+        """Block until every queued photo is processed; re-raises worker errors."""
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                return
+            for future in pending:
+                future.result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+pipeline = ImagePipeline(IMAGE_WORKERS)
+
+
+def backfill(bind: Engine, storage: StorageBackend) -> int:
+    with Session(bind) as db:
+        ids = db.scalars(select(models.UserPhoto.id).where(
+            models.UserPhoto.variants.is_(None) | models.UserPhoto.placeholder.is_(None)
+        )).all()
+    for photo_id in ids:
+        pipeline.submit(photo_id, bind, storage)
+    pipeline.drain()
+    pipeline.shutdown()
+    return len(ids)
+
+
+if __name__ == "__main__":
+    from app.database import get_engine
+    from app.storage import get_storage
+
+    print(f"Processed {backfill(get_engine(), get_storage())} photos.")
@@ -0,0 +1,10 @@
+import os
+
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+# Load tests drive many sessions from one address; they set RATE_LIMIT_ENABLED=0.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# One limiter shared by the app and the route decorators.
+limiter = Limiter(key_func=get_remote_address, enabled=RATE_LIMIT_ENABLED)
@@ -1,44 +1,112 @@
 import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-from fastapi.staticfiles import StaticFiles
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from slowapi.errors import RateLimitExceeded
-from app.database import engine, Base
-from app.routers import auth, candidates, swipes, agent, users
+from sqlalchemy import text
+
+from app import database, images, matchmaker_queue, metrics, profiling, replicas, sharding, similarity, versions
+from app.compression import CompressionMiddleware
+from app.limits import limiter
+from app.routers import auth, candidates, swipes, agent, users, photos, storage as storage_routes
+from app.schema import create_schema
+from app.storage import STORAGE_BACKEND, UPLOAD_DIR
+
+# Schema creation is a deploy step (python -m app.schema); this is for local dev.
+AUTO_CREATE_SCHEMA = os.getenv("AUTO_CREATE_SCHEMA", "").lower() in ("1", "true", "yes")
+# Connections opened per engine at startup so the first requests skip connect latency.
+POOL_WARMUP_CONNECTIONS = int(os.getenv("POOL_WARMUP_CONNECTIONS", "1"))
+
 
-Base.metadata.create_all(bind=engine)
+def warm_pool(engine, connections: int) -> None:
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = engine.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in opened:
+            conn.close()
 
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-limiter = Limiter(key_func=get_remote_address)
+def _startup() -> None:
+    if STORAGE_BACKEND == "local":
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+    if AUTO_CREATE_SCHEMA:
+        create_schema()
+    metrics.instrument(database.get_engine(), "primary")
+    for i, engine in enumerate(replicas.router.engines):
+        metrics.instrument(engine, f"replica{i}")
+    for i, engine in enumerate(sharding.router.engines):
+        metrics.instrument(engine, f"shard{i}")
+    if POOL_WARMUP_CONNECTIONS > 0:
+        engines = [database.get_engine(), *replicas.router.engines, *sharding.router.engines]
+        for engine in engines:
+            warm_pool(engine, POOL_WARMUP_CONNECTIONS)
+    if similarity.SIMILARITY_WARMUP and similarity.np is not None:
+        with database.SessionLocal() as db:
+            similarity.get_index(db)
 
-app = FastAPI(
-    title="Tinder IDO API",
-    version="0.1.0",
-    description="MVP matchmaking backend with Agent/Matchmaker placeholders",
-    root_path=os.getenv("ROOT_PATH", ""),
-)
 
-app.state.limiter = limiter
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(_startup)
+    matchmaker_queue.pool.start(database.get_engine())
+    yield
+    await run_in_threadpool(matchmaker_queue.pool.stop)
+    await run_in_threadpool(images.pipeline.shutdown)
 
 
-@app.exception_handler(RateLimitExceeded)
 async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
     return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded. Try again later."})
 
 
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+async def not_modified_handler(request: Request, exc: versions.NotModified):
+    return Response(status_code=304, headers={"ETag": exc.etag, "Cache-Control": "private, no-cache"})
 
-app.include_router(auth.router)
-app.include_router(candidates.router)
-app.include_router(swipes.router)
-app.include_router(agent.router)
-app.include_router(users.router)
 
-
-@app.get("/health", tags=["health"])
 def health_check():
     return {"status": "ok"}
+
+
+def create_app() -> FastAPI:
+    """Build the API. Nothing here touches the database or the filesystem;
+    connections, pool warm-up and the uploads directory wait for the lifespan."""
+    app = FastAPI(
+        title="Tinder IDO API",
+        version="0.1.0",
+        description="MVP matchmaking backend with Agent/Matchmaker placeholders",
+        root_path=os.getenv("ROOT_PATH", ""),
+        lifespan=lifespan,
+    )
+
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, rate_limit_handler)
+    app.add_exception_handler(versions.NotModified, not_modified_handler)
+    app.add_middleware(CompressionMiddleware)
+    if metrics.METRICS_ENABLED:
+        # Outermost, so request latency includes compression.
+        app.add_middleware(metrics.MetricsMiddleware)
+    if profiling.enabled():
+        # Outside metrics, so writing a profile isn't counted as request latency.
+        app.add_middleware(profiling.ProfilingMiddleware)
+
+    app.include_router(auth.router)
+    app.include_router(candidates.router)
+    app.include_router(swipes.router)
+    app.include_router(agent.router)
+    app.include_router(users.router)
+    app.include_router(photos.router)
+    app.include_router(storage_routes.router)
+
+    app.add_api_route("/health", health_check, methods=["GET"], tags=["health"])
+    if metrics.METRICS_ENABLED:
+        app.add_api_route("/metrics", metrics.metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+    return app
+
+
+app = create_app()
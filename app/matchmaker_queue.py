@@ -0,0 +1,328 @@
+"""
+Durable work queue over the matchmakers table.
+
+A right swipe by a user with an agent enqueues (agent, target) in the
+swipe's own transaction. Enqueueing is idempotent: the pair is unique and a
+repeat insert is dropped with ON CONFLICT DO NOTHING, so retried requests
+don't pile up duplicates. Workers then process the queue off the request
+path:
+
+1. ``claim`` leases a batch of ready rows to a fresh claim token with one
+   ``UPDATE ... WHERE id IN (SELECT ... LIMIT n)``. On Postgres the subquery
+   locks FOR UPDATE SKIP LOCKED, so concurrent workers take disjoint batches
+   without waiting on each other; SQLite runs one writer at a time, which
+   makes the same UPDATE atomic. A row is ready when it is pending, under
+   its attempt limit, past its retry time and not under a live lease.
+2. The handler runs for each job and ``complete`` records the outcome in
+   the same transaction, but only while the job's token still holds the
+   lease. A worker that stalled past its lease finds the token gone and
+   rolls back, so a job's result is written once however often it is
+   claimed.
+3. A failed job is put back with exponential backoff. After
+   MATCHMAKER_MAX_ATTEMPTS claims it stays pending with its last_error and
+   is no longer claimed.
+
+Run the pool inside the API with MATCHMAKER_WORKERS=N, or drain a backlog
+with ``python -m app.matchmaker_queue``. Status changes made by a separate
+process don't bump this process's ETags (see app.versions).
+"""
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from sqlalchemy import Engine, case, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app import models, versions
+from app.database import INSERT_IGNORE_DIALECTS, insert_ignore
+
+logger = logging.getLogger(__name__)
+
+# Worker threads started with the API; 0 leaves the queue to `python -m app.matchmaker_queue`.
+MATCHMAKER_WORKERS = int(os.getenv("MATCHMAKER_WORKERS", "0"))
+MATCHMAKER_BATCH_SIZE = int(os.getenv("MATCHMAKER_BATCH_SIZE", "50"))
+# Longer than a batch takes to process, or its jobs are claimed twice.
+MATCHMAKER_LEASE_SECONDS = float(os.getenv("MATCHMAKER_LEASE_SECONDS", "60"))
+MATCHMAKER_MAX_ATTEMPTS = int(os.getenv("MATCHMAKER_MAX_ATTEMPTS", "5"))
+MATCHMAKER_RETRY_BASE_SECONDS = float(os.getenv("MATCHMAKER_RETRY_BASE_SECONDS", "5"))
+MATCHMAKER_RETRY_MAX_SECONDS = float(os.getenv("MATCHMAKER_RETRY_MAX_SECONDS", "3600"))
+MATCHMAKER_POLL_SECONDS = float(os.getenv("MATCHMAKER_POLL_SECONDS", "2"))
+
+
+class Job(NamedTuple):
+    id: int
+    agent_id: int
+    target_user_id: int
+    contact_notes: Optional[str]
+    attempts: int  # including this claim
+    token: str
+
+
+JOB_COLUMNS = (
+    models.Matchmaker.id, models.Matchmaker.agent_id, models.Matchmaker.target_user_id,
+    models.Matchmaker.contact_notes, models.Matchmaker.attempts,
+)
+
+Handler = Callable[[Session, Job], tuple[models.MatchmakerStatusEnum, Optional[str]]]
+
+
+def enqueue_many(db: Session, pairs: Iterable[tuple[int, int]]) -> None:
+    """Queue (agent id, target user id) pairs as pending in ``db``'s transaction, skipping queued ones."""
+    rows = [{"agent_id": agent_id, "target_user_id": target_user_id,
+             "status": models.MatchmakerStatusEnum.pending, "attempts": 0} for agent_id, target_user_id in pairs]
+    if not rows:
+        return
+    bind = db.get_bind()
+    if bind.dialect.name in INSERT_IGNORE_DIALECTS:
+        db.execute(insert_ignore(bind, models.Matchmaker), rows)
+    else:
+        for row in rows:
+            if db.scalar(select(models.Matchmaker.id).filter_by(
+                    agent_id=row["agent_id"], target_user_id=row["target_user_id"])) is None:
+                db.add(models.Matchmaker(**row))
+    versions.touch(db, {(versions.MATCHMAKER, row["agent_id"]) for row in rows})
+
+
+def enqueue(db: Session, agent_id: int, target_user_id: int) -> None:
+    """Queue (agent, target) as pending in ``db``'s transaction; a no-op if it is queued already."""
+    enqueue_many(db, [(agent_id, target_user_id)])
+
+
+def introduce(db: Session, job: Job) -> tuple[models.MatchmakerStatusEnum, Optional[str]]:
+    """Placeholder agent step: matched if the two users already match, contacted otherwise."""
+    user_id = db.scalar(select(models.Agent.user_id).where(models.Agent.id == job.agent_id))
+    user1_id, user2_id = sorted((user_id, job.target_user_id))
+    matched = db.scalar(select(models.Match.id).filter_by(user1_id=user1_id, user2_id=user2_id))
+    if matched is not None:
+        return models.MatchmakerStatusEnum.matched, job.contact_notes
+    return models.MatchmakerStatusEnum.contacted, job.contact_notes
+
+
+class MatchmakerQueue:
+    def __init__(self, batch_size: int = 50, lease_seconds: float = 60.0, max_attempts: int = 5,
+                 retry_base_seconds: float = 5.0, retry_max_seconds: float = 3600.0,
+                 clock: Callable[[], datetime] = models.utcnow):
+        self.batch_size = batch_size
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._clock = clock
+
+    def _ready(self, now: datetime):
+        m = models.Matchmaker
+        return (
+            (m.status == models.MatchmakerStatusEnum.pending)
+            & (m.attempts < self.max_attempts)
+            & or_(m.available_at.is_(None), m.available_at <= now)
+            & or_(m.claim_token.is_(None), m.leased_until <= now)
+        )
+
+    def claim(self, db: Session, limit: Optional[int] = None) -> list[Job]:
+        """Lease up to ``limit`` ready jobs; commit before processing them."""
+        m = models.Matchmaker
+        now = self._clock()
+        token = uuid.uuid4().hex
+        ready = (
+            select(m.id).where(self._ready(now)).order_by(m.id).limit(limit or self.batch_size)
+            .with_for_update(skip_locked=True)  # not rendered on SQLite
+        )
+        db.execute(
+            update(m).where(m.id.in_(ready))
+            .values(claim_token=token, leased_until=now + self.lease, attempts=m.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        rows = db.execute(select(*JOB_COLUMNS).where(m.claim_token == token).order_by(m.id))
+        return [Job(*row, token) for row in rows]
+
+    def complete(self, db: Session, job: Job, status: models.MatchmakerStatusEnum,
+                 contact_notes: Optional[str] = None) -> bool:
+        """Record ``job``'s outcome; False (roll back) if its lease was lost to another worker."""
+        m = models.Matchmaker
+        done = db.execute(
+            update(m).where(m.id == job.id, m.claim_token == job.token)
+            .values(status=status, contact_notes=contact_notes, claim_token=None, leased_until=None,
+                    last_error=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        if done:
+            versions.touch(db, [(versions.MATCHMAKER, job.agent_id)])
+        return done
+
+    def backoff(self, attempts: int) -> float:
+        """Seconds before attempt ``attempts + 1``: doubling, capped, with jitter."""
+        delay = min(self.retry_base_seconds * 2 ** (attempts - 1), self.retry_max_seconds)
+        return delay * random.uniform(0.5, 1.0)
+
+    def retry(self, db: Session, job: Job, error: BaseException) -> bool:
+        """Put a failed job back; False when it has used up its attempts."""
+        m = models.Matchmaker
+        db.execute(
+            update(m).where(m.id == job.id, m.claim_token == job.token)
+            .values(claim_token=None, leased_until=None,
+                    available_at=self._clock() + timedelta(seconds=self.backoff(job.attempts)),
+                    last_error=f"{type(error).__name__}: {error}"[:2000])
+            .execution_options(synchronize_session=False)
+        )
+        return job.attempts < self.max_attempts
+
+    def backlog(self, db: Session) -> dict[str, int]:
+        """Pending rows by state: ready, leased, waiting (to retry) and failed (out of attempts)."""
+        m = models.Matchmaker
+        now = self._clock()
+        leased = (m.claim_token.is_not(None)) & (m.leased_until > now)
+        failed = m.attempts >= self.max_attempts
+        state = case((failed, "failed"), (leased, "leased"), (self._ready(now), "ready"), else_="waiting")
+        counts = dict(db.execute(
+            select(state, func.count()).where(m.status == models.MatchmakerStatusEnum.pending).group_by(state)
+        ).all())
+        return {name: counts.get(name, 0) for name in ("ready", "leased", "waiting", "failed")}
+
+
+class QueueMetrics:
+    COUNTERS = ("batches", "claimed", "completed", "retried", "failed", "lost")
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.started = self._clock()
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+        self.busy_seconds = 0.0
+
+    def add(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += n
+
+    def add_busy(self, seconds: float) -> None:
+        with self._lock:
+            self.busy_seconds += seconds
+
+    def snapshot(self) -> dict[str, float]:
+        """Counters since the last reset, with completed jobs per second of wall and busy time."""
+        with self._lock:
+            elapsed = self._clock() - self.started
+            busy = self.busy_seconds
+            result = dict(self.counts)
+        result["elapsed_seconds"] = elapsed
+        result["jobs_per_second"] = result["completed"] / elapsed if elapsed > 0 else 0.0
+        result["jobs_per_busy_second"] = result["completed"] / busy if busy > 0 else 0.0
+        return result
+
+
+class WorkerPool:
+    """``concurrency`` threads, each claiming and processing one batch at a time."""
+
+    def __init__(self, queue: MatchmakerQueue, concurrency: int, handler: Handler = introduce,
+                 poll_seconds: float = 2.0):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.handler = handler
+        self.poll_seconds = poll_seconds
+        self.metrics = QueueMetrics()
+        self._threads: list[threading.Thread] = []
+        self._stop = threading.Event()
+
+    def _process(self, bind: Engine, job: Job) -> None:
+        with Session(bind) as db:
+            try:
+                status, notes = self.handler(db, job)
+                if self.queue.complete(db, job, status, notes):
+                    db.commit()
+                    self.metrics.add("completed")
+                else:
+                    db.rollback()
+                    self.metrics.add("lost")
+                return
+            except Exception as exc:
+                db.rollback()
+                error = exc
+            logger.warning("Matchmaker job %s failed (attempt %s)", job.id, job.attempts, exc_info=error)
+            retried = self.queue.retry(db, job, error)
+            db.commit()
+            self.metrics.add("retried" if retried else "failed")
+
+    def run_once(self, bind: Engine) -> int:
+        """Claim and process one batch; returns how many jobs it had."""
+        with Session(bind) as db:
+            jobs = self.queue.claim(db)
+            db.commit()
+        if not jobs:
+            return 0
+        started = time.monotonic()
+        self.metrics.add("batches")
+        self.metrics.add("claimed", len(jobs))
+        for job in jobs:
+            self._process(bind, job)
+        self.metrics.add_busy(time.monotonic() - started)
+        return len(jobs)
+
+    def _loop(self, bind: Engine, until_empty: bool) -> None:
+        while not self._stop.is_set():
+            try:
+                claimed = self.run_once(bind)
+            except Exception:
+                logger.exception("Matchmaker worker failed to claim a batch")
+                claimed = 0
+            if not claimed:
+                if until_empty:
+                    return
+                self._stop.wait(self.poll_seconds)
+
+    def _spawn(self, bind: Engine, until_empty: bool) -> list[threading.Thread]:
+        threads = [
+            threading.Thread(target=self._loop, args=(bind, until_empty), name=f"matchmaker-{i}", daemon=True)
+            for i in range(max(self.concurrency, 1))
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def start(self, bind: Engine) -> None:
+        """Process the queue in the background until ``stop``; does nothing with concurrency 0."""
+        if self.concurrency <= 0 or self._threads:
+            return
+        self._stop.clear()
+        self._threads = self._spawn(bind, until_empty=False)
+
+    def stop(self) -> None:
+        self._stop.set()
+        threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join()
+
+    def drain(self, bind: Engine) -> dict[str, float]:
+        """Process until nothing is ready, with at least one thread; returns the metrics."""
+        self._stop.clear()
+        for thread in self._spawn(bind, until_empty=True):
+            thread.join()
+        return self.metrics.snapshot()
+
+
+queue = MatchmakerQueue(
+    batch_size=MATCHMAKER_BATCH_SIZE, lease_seconds=MATCHMAKER_LEASE_SECONDS,
+    max_attempts=MATCHMAKER_MAX_ATTEMPTS, retry_base_seconds=MATCHMAKER_RETRY_BASE_SECONDS,
+    retry_max_seconds=MATCHMAKER_RETRY_MAX_SECONDS,
+)
+pool = WorkerPool(queue, MATCHMAKER_WORKERS, poll_seconds=MATCHMAKER_POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    from app.database import get_engine
+
+    engine = get_engine()
+    with Session(engine) as session:
+        print(f"Backlog: {queue.backlog(session)}")
+    stats = pool.drain(engine)
+    print(f"Processed {stats['completed']} jobs in {stats['elapsed_seconds']:.1f}s "
+          f"({stats['jobs_per_second']:.1f}/s): {stats['retried']} retried, {stats['failed']} failed, "
+          f"{stats['lost']} lost leases.")
+    with Session(engine) as session:
+        print(f"Backlog: {queue.backlog(session)}")
@@ -0,0 +1,288 @@
+"""
+Prometheus metrics and the slow-query log.
+
+GET /metrics serves, in the Prometheus text format:
+
+  http_request_duration_seconds  histogram by method, route template and status
+  http_request_sql_statements    histogram of SQL statements per request, by route
+  http_request_db_seconds        histogram of time spent in SQL per request, by route
+  db_query_duration_seconds      histogram of every statement, on or off the request path
+  db_pool_wait_seconds           histogram of the time to get a pooled connection, by engine
+  db_pool_*                      checked-out, size and overflow gauges, by engine
+  threadpool_*                   busy and maximum worker threads, and tasks waiting for one
+  matchmaker_*                   the matchmaker worker pool's counters (app.matchmaker_queue)
+
+MetricsMiddleware keeps each request's figures in a context variable. Sync
+endpoints and dependencies run in the threadpool, which copies the context,
+so SQL run there is counted against the request's route. Statements are
+timed by event hooks on every Engine. Pool waits are timed only for engines
+passed to ``instrument``: the primary, replicas and shards, at startup.
+
+Statements that take SLOW_QUERY_SECONDS or longer are logged at WARNING to
+the "app.slow_query" logger, with the route that ran them.
+
+Figures are per process, like app.versions, so scrape every worker. /metrics
+has no authentication: keep it off the public network. METRICS_ENABLED=0
+turns all of this off.
+"""
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Iterable, Optional, Sequence
+
+import anyio.to_thread
+from sqlalchemy import Engine, event
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import matchmaker_queue
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.25"))  # 0 turns the log off
+SLOW_QUERY_MAX_CHARS = 2000
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+UNMATCHED = "unmatched"  # route label for requests no route handled
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+slow_query_log = logging.getLogger("app.slow_query")
+
+Sample = tuple[tuple[str, ...], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        self.name, self.help = name, help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> per-bucket counts (the last one is +Inf), sum, count
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = {labels: (list(counts), total, n) for labels, (counts, total, n) in self._series.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labels, (counts, total, n) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (_number(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {n}")
+        return lines
+
+
+class Collector:
+    """A gauge or counter family read from ``collect`` at scrape time."""
+
+    def __init__(self, name: str, kind: str, help: str, labelnames: Sequence[str],
+                 collect: Callable[[], Iterable[Sample]]):
+        self.name, self.kind, self.help = name, kind, help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        try:
+            samples = list(self.collect())
+        except RuntimeError:  # e.g. threadpool figures outside the event loop
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in samples)
+        return lines
+
+
+class RequestStats:
+    __slots__ = ("scope", "statements", "db_seconds")
+
+    def __init__(self, scope: Scope):
+        self.scope = scope
+        self.statements = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        return route_label(self.scope)
+
+
+def route_label(scope: Scope) -> str:
+    """The matched route's path template, so /users/7 and /users/8 share a series."""
+    return getattr(scope.get("route"), "path", UNMATCHED)
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+request_seconds = Histogram("http_request_duration_seconds", "Time to a complete response.",
+                            ("method", "route", "status"), LATENCY_BUCKETS)
+request_statements = Histogram("http_request_sql_statements", "SQL statements run per request.",
+                               ("route",), STATEMENT_BUCKETS)
+request_db_seconds = Histogram("http_request_db_seconds", "Time spent in SQL per request.",
+                               ("route",), LATENCY_BUCKETS)
+query_seconds = Histogram("db_query_duration_seconds", "Time per SQL statement.", (), QUERY_BUCKETS)
+pool_wait_seconds = Histogram("db_pool_wait_seconds", "Time to check a connection out of the pool.",
+                              ("engine",), QUERY_BUCKETS)
+
+_engines: dict[str, Engine] = {}
+
+
+def _pool_gauge(method: str) -> Callable[[], Iterable[Sample]]:
+    def collect() -> Iterable[Sample]:
+        for name, engine in list(_engines.items()):
+            read = getattr(engine.pool, method, None)  # QueuePool has all three; other pools may not
+            if read is not None:
+                yield (name,), read()
+    return collect
+
+
+def _threadpool() -> Iterable[Sample]:
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    stats = limiter.statistics()
+    return [(("busy",), stats.borrowed_tokens), (("max",), limiter.total_tokens),
+            (("waiting",), stats.tasks_waiting)]
+
+
+def _matchmaker(names: Sequence[str]) -> Callable[[], Iterable[Sample]]:
+    def collect() -> Iterable[Sample]:
+        snapshot = matchmaker_queue.pool.metrics.snapshot()
+        return [((name,), snapshot[name]) for name in names]
+    return collect
+
+
+registry: list = [
+    request_seconds, request_statements, request_db_seconds, query_seconds, pool_wait_seconds,
+    Collector("db_pool_checked_out", "gauge", "Connections in use.", ("engine",), _pool_gauge("checkedout")),
+    Collector("db_pool_size", "gauge", "Connections the pool keeps.", ("engine",), _pool_gauge("size")),
+    Collector("db_pool_overflow", "gauge", "Connections open beyond the pool size.", ("engine",),
+              _pool_gauge("overflow")),
+    Collector("threadpool_threads", "gauge", "Threadpool workers busy, the maximum, and tasks waiting for one.",
+              ("state",), _threadpool),
+    Collector("matchmaker_jobs_total", "counter", "Matchmaker queue jobs, by what happened to them.",
+              ("event",), _matchmaker(matchmaker_queue.QueueMetrics.COUNTERS)),
+]
+
+
+def render() -> str:
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+async def metrics_endpoint() -> Response:
+    # async, so the threadpool gauges are read on the event loop.
+    return Response(render(), media_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """Records each HTTP request's latency, SQL statements and SQL time by route."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            _current.reset(token)
+            route = stats.route
+            request_seconds.observe(time.perf_counter() - started, scope["method"], route, str(status))
+            request_statements.observe(stats.statements, route)
+            request_db_seconds.observe(stats.db_seconds, route)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+    query_seconds.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += elapsed
+    if SLOW_QUERY_SECONDS and elapsed >= SLOW_QUERY_SECONDS:
+        slow_query_log.warning("%.3fs %s %s", elapsed, stats.route if stats is not None else "-",
+                               statement[:SLOW_QUERY_MAX_CHARS])
+
+
+def _failed(exception_context) -> None:
+    started = exception_context.connection.info.get("metrics_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+if METRICS_ENABLED:
+    event.listen(Engine, "before_cursor_execute", _before_execute)
+    event.listen(Engine, "after_cursor_execute", _after_execute)
+    event.listen(Engine, "handle_error", _failed)
+
+
+def instrument(engine: Engine, name: str) -> None:
+    """Time pool checkouts of ``engine`` and report its pool gauges, labelled engine=``name``."""
+    if not METRICS_ENABLED:
+        return
+    if name not in _engines:
+        # dispose() swaps in a new pool; time that one too.
+        event.listen(engine, "engine_disposed", lambda e: _time_checkouts(e, name))
+    _engines[name] = engine
+    _time_checkouts(engine, name)
+
+
+def _time_checkouts(engine: Engine, name: str) -> None:
+    pool = engine.pool
+    if "connect" in vars(pool):
+        return
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            pool_wait_seconds.observe(time.perf_counter() - started, name)
+
+    pool.connect = timed_connect
@@ -1,7 +1,17 @@
 import enum
-from sqlalchemy import Column, Integer, String, Enum, DateTime, ForeignKey, Text, UniqueConstraint, func
+from datetime import datetime, timezone
+
+from sqlalchemy import (
+    Column, Integer, String, Enum, DateTime, ForeignKey, Index, LargeBinary, Text, UniqueConstraint, JSON, func,
+)
 from sqlalchemy.orm import relationship
 from app.database import Base
+from app.storage import get_storage
+
+
+def utcnow() -> datetime:
+    """Naive UTC, like the server_default timestamps."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 
 class GenderEnum(str, enum.Enum):
@@ -94,28 +104,59 @@ class UserPhoto(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    filename = Column(String(255), nullable=False)
+    filename = Column(String(255), nullable=False)  # photo store key, see app.photo_store
+    content_hash = Column(String(64), nullable=True, index=True)  # sha256; shared blobs are refcounted by it
     display_order = Column(Integer, default=0)
+    variants = Column(JSON(none_as_null=True), nullable=True)  # variant name -> filename, set by app.images
+    placeholder = Column(String(64), nullable=True)  # BlurHash, see app.images.make_placeholder
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
     user = relationship("User", back_populates="photos")
 
     @property
     def url(self) -> str:
-        return f"/uploads/{self.filename}"
+        return get_storage().url(self.filename)
+
+    def variant_url(self, variant: str) -> str:
+        filename = (self.variants or {}).get(variant)
+        return get_storage().url(filename) if filename else self.url
+
+    @property
+    def thumbnail_url(self) -> str:
+        return self.variant_url("thumb")
+
+    @property
+    def card_url(self) -> str:
+        return self.variant_url("card")
+
+    @property
+    def full_url(self) -> str:
+        return self.variant_url("full")
+
+
+class ProfileVector(Base):
+    """A user's profile as a float16 vector, for "similar profiles" (see app.similarity)."""
+    __tablename__ = "profile_vectors"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    vector = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow, nullable=False)
 
 
 class Swipe(Base):
     __tablename__ = "swipes"
     __table_args__ = (
         UniqueConstraint("user_id", "target_user_id", name="uq_swipe_user_target"),
+        # GET /swipes/likes-received pages a user's inbound right swipes, newest first.
+        Index("ix_swipes_target_direction_swiped", "target_user_id", "direction", "swiped_at", "user_id"),
     )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    target_user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    target_user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     direction = Column(Enum(SwipeDirectionEnum), nullable=False)
-    swiped_at = Column(DateTime, server_default=func.now(), nullable=False)
+    # Set client-side too, for the pagination cursor (see Matchmaker.created_at).
+    swiped_at = Column(DateTime, default=utcnow, server_default=func.now(), nullable=False)
 
     user = relationship("User", foreign_keys=[user_id], back_populates="swipes_made")
     target_user = relationship("User", foreign_keys=[target_user_id])
@@ -151,14 +192,29 @@ class Agent(Base):
 
 
 class Matchmaker(Base):
+    """One agent's work item for a target user; also the agent work queue (see app.matchmaker_queue)."""
     __tablename__ = "matchmakers"
+    __table_args__ = (
+        UniqueConstraint("agent_id", "target_user_id", name="uq_matchmaker_agent_target"),
+        Index("ix_matchmakers_status_id", "status", "id"),  # claim scans pending rows in id order
+        # GET /matchmaker pages, newest first, with and without ?status=
+        Index("ix_matchmakers_agent_status_created", "agent_id", "status", "created_at", "id"),
+        Index("ix_matchmakers_agent_created", "agent_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    agent_id = Column(Integer, ForeignKey("agents.id", ondelete="CASCADE"), nullable=False, index=True)
+    agent_id = Column(Integer, ForeignKey("agents.id", ondelete="CASCADE"), nullable=False)
     target_user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     status = Column(Enum(MatchmakerStatusEnum), nullable=False, default=MatchmakerStatusEnum.pending)
     contact_notes = Column(Text, nullable=True)
-    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    # Set client-side too: SQLite's CURRENT_TIMESTAMP drops the microseconds the pagination cursor compares.
+    created_at = Column(DateTime, default=utcnow, server_default=func.now(), nullable=False)
+    # Queue bookkeeping, all UTC. A row is leased while claim_token is set and leased_until is ahead.
+    claim_token = Column(String(32), nullable=True, index=True)
+    leased_until = Column(DateTime, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    available_at = Column(DateTime, nullable=True)  # retry not before; NULL is ready now
+    last_error = Column(Text, nullable=True)
 
     agent = relationship("Agent", back_populates="matchmakers")
     target_user = relationship("User", foreign_keys=[target_user_id])
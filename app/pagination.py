@@ -0,0 +1,53 @@
+"""
+Keyset pagination, newest first.
+
+A page is ``WHERE (ts, id) < (:ts, :id) ORDER BY ts DESC, id DESC LIMIT n``
+over an index ending in (ts, id), so every page costs the same however deep
+it is, unlike OFFSET. The cursor is the last row's key, base64url-encoded;
+clients treat it as opaque and send it back as ?cursor=. Endpoints return
+the next page's cursor in the X-Next-Cursor header and omit it on the last
+page. Where a count is cheap enough, the first page carries it in
+X-Total-Count.
+"""
+import base64
+from datetime import datetime
+from typing import Callable, NamedTuple, Optional, Sequence
+
+from sqlalchemy import Select, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+
+class Cursor(NamedTuple):
+    at: datetime
+    id: int
+
+
+def encode_cursor(at: datetime, id: int) -> str:
+    return base64.urlsafe_b64encode(f"{at.isoformat()}|{id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(value: str) -> Cursor:
+    """ValueError for anything ``encode_cursor`` didn't make."""
+    try:
+        at, _, id = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode().partition("|")
+        return Cursor(datetime.fromisoformat(at), int(id))
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def paginate(stmt: Select, at_column, id_column, cursor: Optional[Cursor], limit: int) -> Select:
+    """``stmt`` cut to the page after ``cursor``, with one extra row to tell if more follow."""
+    if cursor is not None:
+        stmt = stmt.where(tuple_(at_column, id_column) < tuple_(cursor.at, cursor.id))
+    return stmt.order_by(at_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+def split_page(rows: Sequence, limit: int,
+               key: Callable = lambda row: (row.created_at, row.id)) -> tuple[list, Optional[str]]:
+    """The page's rows and the next page's cursor, for rows of a ``paginate`` query."""
+    if len(rows) <= limit:
+        return list(rows), None
+    rows = list(rows[:limit])
+    return rows, encode_cursor(*key(rows[-1]))
@@ -0,0 +1,208 @@
+"""
+Content-addressed photo blobs.
+
+Each distinct image is stored once, under a key derived from its SHA-256:
+``ab/cd/abcd...ef.png``. The two directory levels cap any one directory at a
+few thousand entries even with millions of blobs. UserPhoto rows reference a
+blob by key (``filename``) and hash (``content_hash``); files derived from a
+blob (resized variants) sit next to it as ``<hash>_<name>.<ext>``. The bytes
+themselves live in whichever app.storage backend is configured.
+
+A blob is only removed once no UserPhoto references it. Adding a reference
+and removing the blob both happen under ``blob_lock``, so an upload either
+commits its row before the reference check or puts the blob back after the
+delete. Flat uploads/ directories from before this layout are moved over by
+migrate_photo_store.py.
+"""
+import hashlib
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Iterator, NamedTuple, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from app import models
+from app.storage import StorageBackend
+
+HASH_CHUNK = 1024 * 1024
+LOCK_STRIPES = 64
+
+
+class StoredPhoto(NamedTuple):
+    content_hash: str
+    filename: str
+    placeholder: Optional[str] = None
+    staged: Optional[str] = None  # file to put under ``filename`` when the row is saved
+
+
+def new_hasher():
+    return hashlib.sha256()
+
+
+def blob_key(content_hash: str, ext: str) -> str:
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.{ext}"
+
+
+_BLOB_KEY = re.compile(r"^([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})\.([a-z0-9]+)$")
+
+
+def parse_blob_key(key: str) -> Optional[tuple[str, str]]:
+    """(content_hash, ext) for a well-formed blob key, else None."""
+    match = _BLOB_KEY.match(key)
+    return (match.group(3), match.group(4)) if match else None
+
+
+_STORED_KEY = re.compile(r"^([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60}(?:_[a-z0-9]+)?)\.[a-z0-9]+$")
+
+
+def fingerprint(key: str) -> Optional[str]:
+    """Content fingerprint of a blob or variant key ("<hash>" / "<hash>_thumb").
+
+    None for keys outside the store (flat files from before it), whose bytes
+    may change under the same name.
+    """
+    match = _STORED_KEY.match(key)
+    return match.group(3) if match else None
+
+
+def hash_file(path: str) -> str:
+    hasher = new_hasher()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def put_bytes(storage: StorageBackend, data: bytes, ext: str) -> StoredPhoto:
+    content_hash = hashlib.sha256(data).hexdigest()
+    key = blob_key(content_hash, ext)
+    source = storage.staging_path()
+    with open(source, "wb") as f:
+        f.write(data)
+    storage.put_file(source, key)
+    return StoredPhoto(content_hash, key)
+
+
+def remove(storage: StorageBackend, key: str) -> None:
+    """Delete a blob and every file derived from it."""
+    storage.delete(key)
+    storage.delete_prefix(key.rsplit(".", 1)[0] + "_")
+
+
+def references(db: Session, key: str, content_hash: Optional[str]) -> int:
+    """UserPhoto rows pointing at a blob. Rows predating the store have no hash."""
+    if content_hash is not None:
+        clause = models.UserPhoto.content_hash == content_hash
+    else:
+        clause = models.UserPhoto.filename == key
+    return db.scalar(select(func.count()).select_from(models.UserPhoto).where(clause))
+
+
+_stripes = [threading.RLock() for _ in range(LOCK_STRIPES)]
+
+
+def _lock_id(name: str) -> int:
+    return int(hashlib.sha256(name.encode()).hexdigest()[:15], 16)  # fits a signed bigint
+
+
+@contextmanager
+def blob_lock(db: Session, *names: str) -> Iterator[None]:
+    """Serialize reference changes to the blobs ``names`` (content hashes, or keys for old rows).
+
+    Held in this process for the block and in the database until ``db``'s
+    transaction ends, so commit inside the block; an exception rolls it back.
+    PostgreSQL takes an advisory lock per blob; SQLite, which has a single
+    writer, takes the database write lock.
+    """
+    ids = sorted({_lock_id(name) for name in names})
+    stripes = sorted({i % LOCK_STRIPES for i in ids})  # one order everywhere, so no deadlocks
+    for i in stripes:
+        _stripes[i].acquire()
+    try:
+        dialect = db.get_bind().dialect.name
+        if dialect == "postgresql":
+            for lock_id in ids:
+                db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": lock_id})
+        elif dialect == "sqlite":
+            db.execute(text("UPDATE user_photos SET id = id WHERE 0"))
+        yield
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        for i in reversed(stripes):
+            _stripes[i].release()
+
+
+def release(db: Session, storage: StorageBackend, key: str, content_hash: Optional[str]) -> bool:
+    """Remove the blob if nothing references it any more; call after the delete commits."""
+    with blob_lock(db, content_hash or key):
+        unused = not references(db, key, content_hash)
+        if unused:
+            remove(storage, key)
+        db.commit()
+    return unused
+
+
+def migrate_flat(db: Session, upload_dir: str, storage: StorageBackend, dry_run: bool = False) -> dict[str, int]:
+    """Move photos stored under their old flat names in ``upload_dir`` into the store.
+
+    Rows sharing a file are migrated together. Each file is copied in, its
+    rows committed, and only then is the old file removed, so an interrupted
+    run can simply be started again.
+    """
+    from app.uploads import SNIFF_BYTES, sniff_image_type  # uploads imports this module
+
+    photos = db.scalars(
+        select(models.UserPhoto).where(models.UserPhoto.content_hash.is_(None)).order_by(models.UserPhoto.id)
+    ).all()
+    by_file: dict[str, list[models.UserPhoto]] = {}
+    for photo in photos:
+        by_file.setdefault(photo.filename, []).append(photo)
+
+    counts = dict.fromkeys(("files", "photos", "deduplicated", "missing"), 0)
+    for filename, group in by_file.items():
+        path = os.path.join(upload_dir, filename)
+        if not os.path.exists(path):
+            counts["missing"] += len(group)
+            continue
+
+        content_hash = hash_file(path)
+        with open(path, "rb") as f:
+            ext = sniff_image_type(f.read(SNIFF_BYTES)) or filename.rsplit(".", 1)[-1].lower()
+        key = blob_key(content_hash, ext)
+        counts["files"] += 1
+        counts["photos"] += len(group)
+        if storage.exists(key):
+            counts["deduplicated"] += 1
+        if dry_run:
+            continue
+
+        moves = [(path, key)]
+        old_stem, new_stem = filename.rsplit(".", 1)[0], key.rsplit(".", 1)[0]
+        variants = None
+        if group[0].variants:
+            variants = {}
+            for name, old_key in group[0].variants.items():
+                new_key = new_stem + old_key[len(old_stem):]
+                if os.path.exists(os.path.join(upload_dir, old_key)):
+                    moves.append((os.path.join(upload_dir, old_key), new_key))
+                    variants[name] = new_key
+            variants = variants or None
+
+        for old_path, new_key in moves:
+            copy = storage.staging_path()
+            shutil.copyfile(old_path, copy)
+            storage.put_file(copy, new_key)
+        for photo in group:
+            photo.filename = key
+            photo.content_hash = content_hash
+            photo.variants = variants
+        db.commit()
+        for old_path, _ in moves:
+            os.remove(old_path)
+    return counts
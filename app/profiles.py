@@ -0,0 +1,96 @@
+"""
+Profile card read model.
+
+Lists of other users (search, swipe history, matches, matchmaker queues) only
+need the public profile: no email, password hash or timestamps, and nothing
+that has to live in the session's identity map. Cards are loaded with
+column-projected selects into small ``__slots__`` objects, and their photos
+with one query per batch of users rather than a join or a lazy load per user.
+app.serialization turns them into ProfileResponse payloads.
+"""
+from typing import Iterable, Sequence
+
+from sqlalchemy import Select, select
+from sqlalchemy.orm import Session
+
+from app import models
+
+CARD_COLUMNS = (
+    models.User.id, models.User.name, models.User.gender, models.User.age, models.User.location,
+    models.User.bio, models.User.tags, models.User.income_range, models.User.education,
+    models.User.industry,
+)
+PHOTO_COLUMNS = (
+    models.UserPhoto.user_id, models.UserPhoto.id, models.UserPhoto.filename, models.UserPhoto.variants,
+    models.UserPhoto.placeholder, models.UserPhoto.display_order,
+)
+# Bound parameters per IN (...) query; SQLite allows 32766, older builds 999.
+BATCH_SIZE = 900
+
+
+class PhotoRow:
+    __slots__ = ("id", "filename", "variants", "placeholder", "display_order")
+
+    def __init__(self, id, filename, variants, placeholder, display_order):
+        self.id = id
+        self.filename = filename
+        self.variants = variants
+        self.placeholder = placeholder
+        self.display_order = display_order
+
+
+class ProfileCard:
+    __slots__ = tuple(c.key for c in CARD_COLUMNS) + ("photos",)
+
+    def __init__(self, id, name, gender, age, location, bio, tags, income_range, education, industry):
+        self.id = id
+        self.name = name
+        self.gender = gender
+        self.age = age
+        self.location = location
+        self.bio = bio
+        self.tags = tags
+        self.income_range = income_range
+        self.education = education
+        self.industry = industry
+        self.photos: list[PhotoRow] = []
+
+
+def card_query() -> Select:
+    """SELECT of CARD_COLUMNS from users; add filters and pass it to ``cards``."""
+    return select(*CARD_COLUMNS)
+
+
+def _batches(ids: Sequence[int]) -> Iterable[Sequence[int]]:
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def attach_photos(db: Session, cards: Iterable[ProfileCard]) -> None:
+    by_id = {card.id: card for card in cards}
+    ids = list(by_id)
+    for batch in _batches(ids):
+        rows = db.execute(
+            select(*PHOTO_COLUMNS)
+            .where(models.UserPhoto.user_id.in_(batch))
+            .order_by(models.UserPhoto.user_id, models.UserPhoto.display_order, models.UserPhoto.id)
+        )
+        for user_id, *photo in rows:
+            by_id[user_id].photos.append(PhotoRow(*photo))
+
+
+def cards(db: Session, stmt: Select) -> list[ProfileCard]:
+    """Cards for the rows of ``stmt`` (built on ``card_query()``), in its order."""
+    result = [ProfileCard(*row) for row in db.execute(stmt)]
+    attach_photos(db, result)
+    return result
+
+
+def cards_by_id(db: Session, user_ids: Iterable[int]) -> dict[int, ProfileCard]:
+    ids = sorted(set(user_ids))
+    result: dict[int, ProfileCard] = {}
+    for batch in _batches(ids):
+        for row in db.execute(card_query().where(models.User.id.in_(batch))):
+            result[row.id] = ProfileCard(*row)
+    attach_photos(db, result.values())
+    return result
@@ -0,0 +1,268 @@
+"""
+On-demand request profiling.
+
+A profiled request is sampled every PROFILE_INTERVAL_SECONDS by a background
+thread. Each sample records the Python stack of every thread working on the
+request. Statements running at that instant appear as a leaf frame,
+"SQL <statement>", so time spent in the database shows up in the call tree.
+The samples are written in the collapsed-stack ("folded") format read by
+flamegraph.pl, speedscope and inferno, one line per distinct stack:
+
+  GET /candidates/search;run (threading.py:982);...;SQL SELECT users.id ... 12
+
+Which requests are profiled:
+
+  X-Debug-Profile: <PROFILE_TOKEN>   this request; its file's name comes back in X-Profile-File
+  X-Debug-Profile-Output: inline     with the header above: the response body is the profile
+                                     instead (text/plain); the real status is in X-Profiled-Status
+  PROFILE_SAMPLE_RATE                a random fraction of all requests, e.g. 0.001
+
+Files go to PROFILE_DIR as <time>-<method>-<route>-<id>.folded; every profile
+is also logged to "app.profiling" with its SQL totals. With no PROFILE_TOKEN
+and a zero sample rate, the default, the middleware isn't installed at all.
+
+A thread joins the request's profile when it opens the request's database
+session (app.dependencies.get_db) or runs its SQL, both of which happen in
+the threadpool for sync endpoints and dependencies. The event loop thread is
+not sampled: it is shared by every request in flight. A worker thread keeps
+being sampled while it is busy until the request ends, so under load a
+profile can include the odd stack from a concurrent request.
+"""
+import functools
+import hmac
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+import anyio
+import anyio.to_thread
+from sqlalchemy import Engine, event
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import metrics
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")  # empty: the header is ignored
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_HEADER = "X-Debug-Profile"
+OUTPUT_HEADER = "X-Debug-Profile-Output"
+SQL_FRAME_MAX_CHARS = 120
+
+logger = logging.getLogger("app.profiling")
+
+# A worker thread whose stack is only these files is idle, waiting for a task.
+_IDLE_FILES = (threading.__file__, queue.__file__)
+_IDLE_DIRS = (os.path.dirname(anyio.__file__) + os.sep,)
+
+
+def enabled() -> bool:
+    return bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+@functools.lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    """``filename`` relative to the sys.path entry it was imported from."""
+    for entry in sorted((p for p in sys.path if p), key=len, reverse=True):
+        prefix = os.path.join(os.path.abspath(entry), "")
+        if filename.startswith(prefix):
+            return filename[len(prefix):]
+    return filename
+
+
+def _frame_label(code) -> str:
+    # The first line, not the current one, so samples anywhere in a function share a frame.
+    return f"{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _sql_label(statement: str) -> str:
+    return "SQL " + " ".join(statement.split())[:SQL_FRAME_MAX_CHARS].replace(";", ",")
+
+
+def _is_idle(filename: str) -> bool:
+    return filename in _IDLE_FILES or filename.startswith(_IDLE_DIRS)
+
+
+class Profile:
+    """The samples of one request, taken by a thread between ``start`` and ``stop``."""
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval or PROFILE_INTERVAL_SECONDS
+        self.threads: set[int] = set()
+        self.sql: dict[int, str] = {}  # thread -> the statement it is running
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.samples = 0
+        self.seconds = 0.0
+        self._stopped = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    def enlist(self) -> None:
+        self.threads.add(threading.get_ident())
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._sampler.join()
+        self.seconds = time.perf_counter() - self._started
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        frames = sys._current_frames()
+        for ident in tuple(self.threads):
+            frame = frames.get(ident)
+            stack, busy = [], False
+            while frame is not None:
+                code = frame.f_code
+                busy = busy or not _is_idle(code.co_filename)
+                stack.append(_frame_label(code))
+                frame = frame.f_back
+            if not busy:
+                continue
+            stack.reverse()
+            statement = self.sql.get(ident)
+            if statement is not None:
+                stack.append(_sql_label(statement))
+            self.stacks[tuple(stack)] += 1
+        self.samples += 1
+
+    def folded(self, root: str = "") -> str:
+        """The collapsed stacks, heaviest first; ``root`` becomes every stack's outermost frame."""
+        prefix = (root.replace(";", ",") + ";") if root else ""
+        return "".join(f"{prefix}{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+
+_current: ContextVar[Optional[Profile]] = ContextVar("profile", default=None)
+
+
+def enlist() -> None:
+    """Sample the calling thread as part of the current request's profile, if it has one."""
+    profile = _current.get()
+    if profile is not None:
+        profile.enlist()
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    profile = _current.get()
+    if profile is not None:
+        ident = threading.get_ident()
+        profile.threads.add(ident)
+        profile.sql[ident] = statement
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    profile = _current.get()
+    if profile is not None:
+        profile.sql.pop(threading.get_ident(), None)
+        profile.statements += 1
+        profile.sql_seconds += time.perf_counter() - conn.info["profile_started"].pop()
+
+
+def _failed(exception_context) -> None:
+    profile = _current.get()
+    if profile is not None:
+        profile.sql.pop(threading.get_ident(), None)
+        started = exception_context.connection.info.get("profile_started") if exception_context.connection else None
+        if started:
+            started.pop()
+
+
+event.listen(Engine, "before_cursor_execute", _before_execute)
+event.listen(Engine, "after_cursor_execute", _after_execute)
+event.listen(Engine, "handle_error", _failed)
+
+
+def _file_name(scope: Scope) -> str:
+    route = re.sub(r"[^A-Za-z0-9]+", "_", metrics.route_label(scope)).strip("_") or "root"
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{scope['method']}-{route}-{uuid.uuid4().hex[:8]}.folded"
+
+
+def _write(name: str, body: str) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+        f.write(body)
+
+
+class ProfilingMiddleware:
+    """Profiles requests that carry the debug header, and a sampled fraction of the rest."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    def _mode(self, scope: Scope) -> Optional[str]:
+        """"file" or "inline" for a request with the debug header, "sampled", or None."""
+        headers = Headers(scope=scope)
+        token = headers.get(PROFILE_HEADER)
+        if token is not None and PROFILE_TOKEN and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+            return "inline" if headers.get(OUTPUT_HEADER, "").lower() == "inline" else "file"
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        mode = self._mode(scope) if scope["type"] == "http" else None
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile()
+        name = None
+        status = 500
+
+        async def send_profiled(message: Message) -> None:
+            nonlocal name, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if mode == "file":
+                    # Named now that routing has happened; only the caller who asked is told.
+                    name = _file_name(scope)
+                    message.setdefault("headers", []).append((b"x-profile-file", name.encode()))
+            if mode != "inline":
+                await send(message)
+
+        token = _current.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            _current.reset(token)
+            profile.stop()
+            root = f"{scope['method']} {metrics.route_label(scope)}"
+            body = profile.folded(root)
+            if mode != "inline":
+                name = name or _file_name(scope)
+                await anyio.to_thread.run_sync(_write, name, body)
+            logger.info("%s %s in %.3fs: %d samples, %d SQL statements in %.3fs, %s",
+                        root, status, profile.seconds, profile.samples, profile.statements,
+                        profile.sql_seconds, name or "inline")
+
+        if mode == "inline":
+            content = body.encode()
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(content)).encode()),
+                (b"x-profiled-status", str(status).encode()),
+                (b"x-profile-sql-statements", str(profile.statements).encode()),
+                (b"x-profile-sql-seconds", f"{profile.sql_seconds:.6f}".encode()),
+            ]})
+            await send({"type": "http.response.body", "body": content})
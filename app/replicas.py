@@ -0,0 +1,128 @@
+import functools
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence, Union
+
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import get_replica_engines
+
+REPLICA_STRATEGY = os.getenv("REPLICA_STRATEGY", "round_robin")
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+STRATEGIES = ("round_robin", "least_connections")
+
+
+def _checked_out(engine: Engine) -> int:
+    checkedout = getattr(engine.pool, "checkedout", None)
+    return checkedout() if checkedout else 0
+
+
+class ReplicaRouter:
+    """Picks a replica for read-only sessions and remembers who wrote recently.
+
+    A user whose own write committed less than ``read_your_writes_seconds`` ago
+    keeps reading from the primary so replication lag never hides their change.
+
+    Writes are remembered per process, so the guarantee holds within one
+    worker: a write handled by another uvicorn worker or host isn't seen here.
+    Route a user's requests to the same worker (sticky sessions) if that matters.
+    """
+
+    def __init__(
+        self,
+        engines: Union[Sequence[Engine], Callable[[], Sequence[Engine]]],
+        strategy: str = "round_robin",
+        read_your_writes_seconds: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown replica strategy '{strategy}'. Use: {', '.join(STRATEGIES)}")
+        self._engines = engines
+        self.strategy = strategy
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self._clock = clock
+        self._counter = itertools.count()
+        # Oldest write first; entries past the window are pruned as new writes arrive.
+        self._last_write: OrderedDict[int, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def engines(self) -> list[Engine]:
+        return list(self._engines() if callable(self._engines) else self._engines)
+
+    @functools.cached_property
+    def _sessionmakers(self) -> list[sessionmaker]:
+        return [sessionmaker(autocommit=False, autoflush=False, bind=e) for e in self.engines]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def pick(self) -> int:
+        n = len(self.engines)
+        start = next(self._counter) % n
+        if self.strategy == "round_robin":
+            return start
+        # Rotate the scan start so idle replicas share load instead of all
+        # ties going to replica 0.
+        order = [(start + i) % n for i in range(n)]
+        return min(order, key=lambda i: _checked_out(self.engines[i]))
+
+    def session(self) -> Session:
+        return self._sessionmakers[self.pick()]()
+
+    def record_write(self, user_id: int) -> None:
+        now = self._clock()
+        with self._lock:
+            self._last_write[user_id] = now
+            self._last_write.move_to_end(user_id)
+            while True:
+                oldest, written_at = next(iter(self._last_write.items()))
+                if now - written_at < self.read_your_writes_seconds:
+                    break
+                del self._last_write[oldest]
+
+    def recently_wrote(self, user_id: int) -> bool:
+        written_at = self._last_write.get(user_id)
+        if written_at is None:
+            return False
+        if self._clock() - written_at < self.read_your_writes_seconds:
+            return True
+        with self._lock:
+            if self._last_write.get(user_id) == written_at:
+                del self._last_write[user_id]
+        return False
+
+
+router = ReplicaRouter(
+    get_replica_engines,
+    strategy=REPLICA_STRATEGY,
+    read_your_writes_seconds=READ_YOUR_WRITES_SECONDS,
+)
+
+
+def track_writes(db: Session, user_id: int) -> None:
+    """Attribute writes committed through ``db`` to ``user_id``."""
+    db.info["user_id"] = user_id
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_dirty(session: Session, flush_context) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _record_commit(session: Session) -> None:
+    user_id: Optional[int] = session.info.get("user_id")
+    if session.info.pop("wrote", False) and user_id is not None:
+        router.record_write(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_writes(session: Session) -> None:
+    session.info.pop("wrote", None)
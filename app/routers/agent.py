@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session
 from sqlalchemy import select
 
-from app import models, schemas
-from app.dependencies import get_db, get_current_user
+from app import models, pagination, schemas, serialization, versions
+from app.dependencies import (
+    get_db, get_read_db, get_current_user, get_current_read_user, conditional_get, replica_stale_window,
+    profile_fields, page_cursor,
+)
+
+router = APIRouter(tags=["agent"], route_class=serialization.MsgPackRoute)
 
-router = APIRouter(tags=["agent"])
+MATCHMAKER_PAGE_SIZE = 50
+MATCHMAKER_MAX_PAGE_SIZE = 200
 
 
 @router.get("/agent/me", response_model=schemas.AgentResponse)
@@ -23,18 +31,44 @@ def get_my_agent(
 
 @router.get("/matchmaker", response_model=list[schemas.MatchmakerResponse])
 def get_matchmakers(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    snapshot: Optional[versions.Snapshot] = Depends(conditional_get(versions.MATCHMAKER, sparse=True)),
+    fields: Optional[tuple[str, ...]] = Depends(profile_fields),
+    status: Optional[models.MatchmakerStatusEnum] = Query(None, description="Only entries with this status."),
+    cursor: Optional[pagination.Cursor] = Depends(page_cursor),
+    limit: int = Query(MATCHMAKER_PAGE_SIZE, ge=1, le=MATCHMAKER_MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_read_user),
 ):
-    agent = db.scalar(
-        select(models.Agent).where(models.Agent.user_id == current_user.id)
+    """The caller's agent's queue, newest first, a page at a time (see app.pagination)."""
+    since = versions.tracker.sequence()
+    # One query from the user to the page of entries, via ix_matchmakers_agent_(status_)created.
+    stmt = (
+        select(*serialization.MATCHMAKER_COLUMNS)
+        .join(models.Agent, models.Agent.id == models.Matchmaker.agent_id)
+        .where(models.Agent.user_id == current_user.id)
     )
-    if not agent:
-        raise HTTPException(status_code=404, detail="Agent not found for this user")
+    if status is not None:
+        stmt = stmt.where(models.Matchmaker.status == status)
+    rows = db.execute(
+        pagination.paginate(stmt, models.Matchmaker.created_at, models.Matchmaker.id, cursor, limit)
+    ).all()
+    if rows:
+        agent_id = rows[0].agent_id
+    else:
+        agent_id = db.scalar(select(models.Agent.id).where(models.Agent.user_id == current_user.id))
+        if agent_id is None:
+            raise HTTPException(status_code=404, detail="Agent not found for this user")
+    if snapshot is None and versions.tracker.enabled:
+        # First poll: learn the agent id so the next one can be answered from memory.
+        versions.tracker.remember_agent(current_user.id, agent_id)
+        snapshot = versions.tracker.snapshot(
+            (versions.MATCHMAKER, agent_id), variant=serialization.representation(request, fields), since=since,
+        )
 
-    return db.scalars(
-        select(models.Matchmaker)
-        .options(joinedload(models.Matchmaker.target_user).joinedload(models.User.photos))
-        .where(models.Matchmaker.agent_id == agent.id)
-        .order_by(models.Matchmaker.created_at.desc())
-    ).unique().all()
+    rows, next_cursor = pagination.split_page(rows, limit)
+    targets = serialization.profiles_by_id(db, (row.target_user_id for row in rows), fields)
+    headers = versions.response_headers(snapshot, targets, replica_stale_window())
+    if next_cursor:
+        headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+    return serialization.respond(request, serialization.matchmakers(rows, targets), headers, ("target_user",))
@@ -1,14 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy import select
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 
-from app import models, schemas, auth
-from app.dependencies import get_db, get_current_user
+from app import models, schemas, auth, replicas, serialization, similarity, versions
+from app.dependencies import get_db, get_current_read_user, conditional_get, replica_stale_window
+from app.limits import limiter
 
-router = APIRouter(prefix="/auth", tags=["auth"])
-limiter = Limiter(key_func=get_remote_address)
+router = APIRouter(prefix="/auth", tags=["auth"], route_class=serialization.MsgPackRoute)
 
 
 @router.post("/register", response_model=schemas.UserResponse, status_code=201)
@@ -36,6 +36,7 @@ def register(request: Request, payload: schemas.UserRegisterRequest, db: Session
     )
     db.add(user)
     db.flush()  # get user.id before creating Agent
+    replicas.track_writes(db, user.id)
 
     agent = models.Agent(
         user_id=user.id,
@@ -43,6 +44,7 @@ def register(request: Request, payload: schemas.UserRegisterRequest, db: Session
         status=models.AgentStatusEnum.pending,
     )
     db.add(agent)
+    similarity.save_vector(db, user)
     db.commit()
     db.refresh(user)
 
@@ -65,5 +67,10 @@ def login(request: Request, payload: schemas.UserLoginRequest, db: Session = Dep
 
 
 @router.get("/me", response_model=schemas.UserResponse)
-def get_me(current_user: models.User = Depends(get_current_user)):
+def get_me(
+    response: Response,
+    snapshot: Optional[versions.Snapshot] = Depends(conditional_get(versions.PROFILE)),
+    current_user: models.User = Depends(get_current_read_user),
+):
+    response.headers.update(versions.response_headers(snapshot, stale_window=replica_stale_window()))
     return current_user
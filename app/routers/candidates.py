@@ -1,26 +1,34 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, status
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, select
+from sqlalchemy import Select, or_
 
-from app import models, schemas
-from app.dependencies import get_db, get_current_user
+from app import models, profiles, schemas, serialization, similarity, text_search
+from app.dependencies import get_read_db, get_current_read_user, get_read_swipe_store, profile_fields
+from app.sharding import SwipeStore
 
-router = APIRouter(prefix="/candidates", tags=["candidates"])
+# Most recent unanswered likes moved to the front with likes_first.
+LIKES_FIRST_MAX = 100
+SIMILAR_PAGE_SIZE = 20
+SIMILAR_MAX_PAGE_SIZE = 100
 
+router = APIRouter(prefix="/candidates", tags=["candidates"], route_class=serialization.MsgPackRoute)
 
-@router.post("/search", response_model=list[schemas.ProfileResponse])
-def search_candidates(
+
+def search_query(
     filters: schemas.CandidateSearchRequest,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
-):
-    # Exclude current user and users already swiped on
-    already_swiped = select(models.Swipe.target_user_id).where(
-        models.Swipe.user_id == current_user.id
-    )
+    user_id: int,
+    already_swiped,
+    dialect: str,
+    liked: Optional[list[int]] = None,
+) -> Select:
+    """The card query for ``filters``: everyone but ``user_id`` and ``already_swiped``.
 
-    stmt = select(models.User).where(
-        models.User.id != current_user.id,
+    ``liked``, the user's unanswered likers, goes first when ``filters.likes_first``.
+    """
+    stmt = profiles.card_query().where(
+        models.User.id != user_id,
         models.User.id.not_in(already_swiped),
     )
 
@@ -46,5 +54,58 @@ def search_candidates(
         stmt = stmt.where(models.User.industry == filters.industry)
     if filters.income_range is not None:
         stmt = stmt.where(models.User.income_range == filters.income_range)
+    if filters.likes_first and liked is not None:
+        stmt = stmt.order_by(models.User.id.in_(liked).desc())
+    if filters.q:
+        stmt = text_search.search(stmt, dialect, filters.q)
+    return stmt
+
+
+@router.post("/search", response_model=list[schemas.ProfileResponse])
+def search_candidates(
+    request: Request,
+    filters: schemas.CandidateSearchRequest,
+    fields: Optional[tuple[str, ...]] = Depends(profile_fields),
+    db: Session = Depends(get_read_db),
+    store: SwipeStore = Depends(get_read_swipe_store),
+    current_user: models.User = Depends(get_current_read_user),
+):
+    # Exclude current user and users already swiped on
+    already_swiped = store.swiped_target_ids(current_user.id)
+    liked = None
+    if filters.likes_first:
+        likes = store.likes_received(current_user.id, serialization.LIKE_COLUMNS, None, LIKES_FIRST_MAX)
+        liked = [row.user_id for row in likes]
+    stmt = search_query(filters, current_user.id, already_swiped, db.get_bind().dialect.name, liked)
+    return serialization.respond(request, serialization.profiles(profiles.cards(db, stmt), fields))
+
+
+@router.get("/similar/{user_id}", response_model=list[schemas.ProfileResponse])
+def similar_candidates(
+    request: Request,
+    user_id: int = Path(..., gt=0),
+    limit: int = Query(SIMILAR_PAGE_SIZE, ge=1, le=SIMILAR_MAX_PAGE_SIZE),
+    fields: Optional[tuple[str, ...]] = Depends(profile_fields),
+    db: Session = Depends(get_read_db),
+    store: SwipeStore = Depends(get_read_swipe_store),
+    current_user: models.User = Depends(get_current_read_user),
+):
+    """Profiles most like ``user_id``'s, most similar first (see app.similarity).
+
+    Skips the caller and users they've already swiped on.
+    """
+    if similarity.np is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Similarity search is not available")
+    vector = similarity.profile_vector(db, user_id)
+    if vector is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    return db.scalars(stmt).all()
+    already_swiped = store.swiped_target_ids(current_user.id)
+    if not isinstance(already_swiped, list):
+        already_swiped = db.scalars(already_swiped).all()
+    hits = similarity.get_index(db).search(vector, limit, exclude={current_user.id, user_id, *already_swiped})
+    # Deleted users can linger in the index; they have no card.
+    by_id = profiles.cards_by_id(db, [hit_id for hit_id, _ in hits])
+    cards = [by_id[hit_id] for hit_id, _ in hits if hit_id in by_id]
+    return serialization.respond(request, serialization.profiles(cards, fields))
@@ -0,0 +1,147 @@
+"""
+Serves photos from LocalStorage under /uploads.
+
+Store keys are content fingerprints, so their URLs are immutable: responses
+carry ``Cache-Control: immutable`` and a strong ETag taken from the key, and
+a matching If-None-Match is answered with 304 before the disk is touched.
+Flat files from before the store revalidate on every use instead. Single
+byte ranges (with If-Range) are honoured.
+
+Bodies go out with the ASGI zero-copy extension (sendfile) when the server
+offers it, else in chunks read off the event loop. Behind nginx, set
+PHOTO_ACCEL_REDIRECT_PREFIX to an internal location aliasing the upload
+directory and nginx sends the file itself.
+"""
+import os
+import re
+from typing import Optional
+
+import anyio
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from starlette.types import Receive, Scope, Send
+
+from app import photo_store
+from app.storage import CONTENT_TYPES, IMMUTABLE_CACHE_CONTROL, LocalStorage, get_storage
+from app.versions import etag_matches
+
+PHOTO_ACCEL_REDIRECT_PREFIX = os.getenv("PHOTO_ACCEL_REDIRECT_PREFIX", "").rstrip("/")
+# Flat files keep their name when replaced, so clients must revalidate them.
+MUTABLE_CACHE_CONTROL = "no-cache"
+CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+router = APIRouter(tags=["photos"])
+
+
+class PhotoFileResponse(Response):
+    """``count`` bytes of the file at ``path`` from ``offset``."""
+
+    def __init__(self, path: str, offset: int, count: int, status_code: int, headers: dict[str, str],
+                 send_body: bool = True):
+        super().__init__(status_code=status_code, headers={**headers, "Content-Length": str(count)})
+        self.path = path
+        self.offset = offset
+        self.count = count
+        self.send_body = send_body
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or self.count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            f = await anyio.to_thread.run_sync(open, self.path, "rb")
+            try:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f, "offset": self.offset, "count": self.count,
+                })
+            finally:
+                f.close()
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.offset)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break  # truncated underneath us; end the body rather than hang
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})
+
+
+def _byte_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """Inclusive (start, end) for a single satisfiable range; None means send it all."""
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None  # absent, malformed or multi-range: a full 200 is always allowed
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+@router.api_route("/uploads/{key:path}", methods=["GET", "HEAD"], include_in_schema=False)
+def get_photo(key: str, request: Request):
+    storage = get_storage()
+    parts = key.split("/")
+    if not isinstance(storage, LocalStorage) or any(p in ("", ".", "..") or p.startswith(".") for p in parts):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+
+    if_none_match = request.headers.get("if-none-match")
+    fingerprint = photo_store.fingerprint(key)
+    if fingerprint is not None:
+        etag, cache_control = f'"{fingerprint}"', IMMUTABLE_CACHE_CONTROL
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+    path = storage.path(key)
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+
+    if fingerprint is None:
+        etag, cache_control = f'"{st.st_mtime_ns:x}-{st.st_size:x}"', MUTABLE_CACHE_CONTROL
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "Content-Type": CONTENT_TYPES.get(key.rsplit(".", 1)[-1], "application/octet-stream"),
+    }
+    if PHOTO_ACCEL_REDIRECT_PREFIX:
+        headers["X-Accel-Redirect"] = f"{PHOTO_ACCEL_REDIRECT_PREFIX}/{key}"
+        return Response(status_code=200, headers=headers)
+
+    send_body = request.method != "HEAD"
+    if_range = request.headers.get("if-range")
+    byte_range = None
+    if if_range is None or if_range.strip() == etag:
+        byte_range = _byte_range(request.headers.get("range"), st.st_size)
+    if byte_range is None:
+        return PhotoFileResponse(path, 0, st.st_size, 200, headers, send_body)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    return PhotoFileResponse(path, start, end - start + 1, 206, headers, send_body)
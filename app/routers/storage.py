@@ -0,0 +1,49 @@
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+
+from app import auth, photo_store
+from app.storage import LocalStorage, get_storage
+
+router = APIRouter(prefix="/storage", tags=["storage"])
+
+
+@router.put("/uploads/{token}", status_code=204, response_class=Response)
+async def put_upload(token: str, request: Request):
+    """Target of LocalStorage presigned URLs; S3 deployments PUT to the bucket instead."""
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    claims = auth.decode_upload_token(token)
+    if claims is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired upload token")
+    if request.headers.get("content-type") != claims["content_type"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Content-Type does not match the upload")
+
+    staged = await run_in_threadpool(storage.staging_path)
+    f = await run_in_threadpool(open, staged, "wb")
+    hasher = photo_store.new_hasher()
+    size = 0
+
+    def write(chunk: bytes) -> None:
+        f.write(chunk)
+        hasher.update(chunk)
+
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > claims["size"]:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Upload exceeds the signed size",
+                )
+            await run_in_threadpool(write, chunk)
+        await run_in_threadpool(f.close)
+        if size != claims["size"] or hasher.hexdigest() != claims["sha256"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Upload does not match the signed checksum",
+            )
+        await run_in_threadpool(storage.put_file, staged, claims["key"])
+    except BaseException:
+        f.close()
+        await run_in_threadpool(storage.discard, staged)
+        raise
+    return Response(status_code=204)
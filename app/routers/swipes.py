@@ -1,31 +1,68 @@
-from fastapi import APIRouter, Depends, HTTPException, Path, status
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, status
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 from sqlalchemy import select
 
-from app import models, schemas
-from app.dependencies import get_db, get_current_user
+from app import matchmaker_queue, models, pagination, schemas, serialization, versions
+from app.dependencies import (
+    get_db, get_read_db, get_current_user, get_current_read_user,
+    get_swipe_store, get_read_swipe_store, conditional_get, page_cursor, replica_stale_window, profile_fields,
+)
+from app.sharding import SwipeStore
+
+LIKES_PAGE_SIZE = 50
+LIKES_MAX_PAGE_SIZE = 200
 
-router = APIRouter(prefix="/swipes", tags=["swipes"])
+router = APIRouter(prefix="/swipes", tags=["swipes"], route_class=serialization.MsgPackRoute)
 
 
 @router.get("/matches", response_model=list[schemas.MatchResponse])
 def get_matches(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    snapshot: Optional[versions.Snapshot] = Depends(conditional_get(versions.MATCHES, sparse=True)),
+    fields: Optional[tuple[str, ...]] = Depends(profile_fields),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_read_user),
 ):
-    return db.scalars(
-        select(models.Match)
-        .options(
-            joinedload(models.Match.user1).joinedload(models.User.photos),
-            joinedload(models.Match.user2).joinedload(models.User.photos),
-        )
+    rows = db.execute(
+        select(*serialization.MATCH_COLUMNS)
         .where(
             (models.Match.user1_id == current_user.id) |
             (models.Match.user2_id == current_user.id)
         )
         .order_by(models.Match.matched_at.desc())
-    ).unique().all()
+    ).all()
+    users = serialization.profiles_by_id(db, (uid for row in rows for uid in (row.user1_id, row.user2_id)), fields)
+    headers = versions.response_headers(snapshot, users, replica_stale_window())
+    return serialization.respond(request, serialization.matches(rows, users), headers, ("user1", "user2"))
+
+
+@router.get("/likes-received", response_model=list[schemas.LikeReceivedResponse])
+def get_likes_received(
+    request: Request,
+    snapshot: Optional[versions.Snapshot] = Depends(conditional_get(versions.LIKES, sparse=True)),
+    fields: Optional[tuple[str, ...]] = Depends(profile_fields),
+    cursor: Optional[pagination.Cursor] = Depends(page_cursor),
+    limit: int = Query(LIKES_PAGE_SIZE, ge=1, le=LIKES_MAX_PAGE_SIZE),
+    store: SwipeStore = Depends(get_read_swipe_store),
+    current_user: models.User = Depends(get_current_read_user),
+):
+    """Users who swiped right on the caller and haven't been swiped back yet, newest first.
+
+    Paged like /matchmaker (see app.pagination); the first page also sends the
+    total in X-Total-Count. Reads ix_swipes_target_direction_swiped.
+    """
+    rows = store.likes_received(current_user.id, serialization.LIKE_COLUMNS, cursor, limit)
+    rows, next_cursor = pagination.split_page(rows, limit, key=lambda row: (row.swiped_at, row.user_id))
+    likers = serialization.profiles_by_id(store.db, (row.user_id for row in rows), fields)
+    headers = versions.response_headers(snapshot, likers, replica_stale_window())
+    if next_cursor:
+        headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+    if cursor is None:
+        headers[pagination.TOTAL_COUNT_HEADER] = str(store.count_likes_received(current_user.id))
+    return serialization.respond(request, serialization.likes(rows, likers), headers, ("user",))
 
 
 @router.post("/{target_user_id}", response_model=schemas.SwipeResponse, status_code=201)
@@ -33,6 +70,7 @@ def swipe_user(
     direction_body: schemas.SwipeRequest,
     target_user_id: int = Path(..., gt=0),
     db: Session = Depends(get_db),
+    store: SwipeStore = Depends(get_swipe_store),
     current_user: models.User = Depends(get_current_user),
 ):
     if target_user_id == current_user.id:
@@ -47,17 +85,11 @@ def swipe_user(
         target_user_id=target_user_id,
         direction=direction_body.direction,
     )
-    db.add(swipe)
+    store.add(swipe)
 
     if direction_body.direction == models.SwipeDirectionEnum.right:
         # Check for mutual right swipe → create match
-        mutual = db.scalar(
-            select(models.Swipe).where(
-                models.Swipe.user_id == target_user_id,
-                models.Swipe.target_user_id == current_user.id,
-                models.Swipe.direction == models.SwipeDirectionEnum.right,
-            )
-        )
+        mutual = store.find(target_user_id, current_user.id, models.SwipeDirectionEnum.right)
         if mutual:
             u1, u2 = sorted([current_user.id, target_user_id])
             db.add(models.Match(user1_id=u1, user2_id=u2))
@@ -67,37 +99,29 @@ def swipe_user(
             select(models.Agent).where(models.Agent.user_id == current_user.id)
         )
         if agent:
-            db.add(models.Matchmaker(
-                agent_id=agent.id,
-                target_user_id=target_user_id,
-                status=models.MatchmakerStatusEnum.pending,
-            ))
+            matchmaker_queue.enqueue(db, agent.id, target_user_id)
 
     try:
-        db.commit()
+        store.commit()
     except IntegrityError:
-        db.rollback()
+        store.rollback()
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="You have already swiped on this user",
         )
-    db.refresh(swipe)
 
-    return db.scalar(
-        select(models.Swipe)
-        .options(joinedload(models.Swipe.target_user).joinedload(models.User.photos))
-        .where(models.Swipe.id == swipe.id)
-    )
+    return store.load(swipe)
 
 
 @router.get("", response_model=list[schemas.SwipeResponse])
 def get_swipe_history(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    snapshot: Optional[versions.Snapshot] = Depends(conditional_get(versions.SWIPES, sparse=True)),
+    fields: Optional[tuple[str, ...]] = Depends(profile_fields),
+    store: SwipeStore = Depends(get_read_swipe_store),
+    current_user: models.User = Depends(get_current_read_user),
 ):
-    return db.scalars(
-        select(models.Swipe)
-        .options(joinedload(models.Swipe.target_user).joinedload(models.User.photos))
-        .where(models.Swipe.user_id == current_user.id)
-        .order_by(models.Swipe.swiped_at.desc())
-    ).unique().all()
+    rows = store.history_rows(current_user.id, serialization.SWIPE_COLUMNS)
+    targets = serialization.profiles_by_id(store.db, (row.target_user_id for row in rows), fields)
+    headers = versions.response_headers(snapshot, targets, replica_stale_window())
+    return serialization.respond(request, serialization.swipes(rows, targets), headers, ("target_user",))
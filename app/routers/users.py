@@ -1,19 +1,67 @@
-import os
-import uuid
-from typing import List
-
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
-from app import models, schemas
+from app import images, models, photo_store, schemas, serialization, similarity
 from app.dependencies import get_db, get_current_user
+from app.storage import get_storage
+from app.uploads import (
+    EXTENSIONS_BY_CONTENT_TYPE, MAX_PHOTOS, MAX_FILE_SIZE, MULTIPART_OVERHEAD, SNIFF_BYTES,
+    PhotoUploadParser, sniff_image_type,
+)
+
+router = APIRouter(prefix="/users", tags=["users"], route_class=serialization.MsgPackRoute)
 
-router = APIRouter(prefix="/users", tags=["users"])
 
-UPLOAD_DIR = "uploads"
-MAX_PHOTOS = 6
-MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB
-ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp"}
+def _check_photo_room(user: models.User) -> int:
+    existing_count = len(user.photos)
+    if existing_count >= MAX_PHOTOS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot exceed {MAX_PHOTOS} photos total (you already have {existing_count})",
+        )
+    return existing_count
+
+
+def _save_photos(
+    db: Session, user: models.User, stored: list[photo_store.StoredPhoto], existing_count: int,
+) -> schemas.UserResponse:
+    storage = get_storage()
+    photos = [
+        models.UserPhoto(
+            user_id=user.id,
+            filename=blob.filename,
+            content_hash=blob.content_hash,
+            placeholder=blob.placeholder,
+            display_order=existing_count + i,
+        )
+        for i, blob in enumerate(stored)
+    ]
+    created = []
+    try:
+        # A delete releasing the same blob waits for the commit, or finishes first and the blob is put back.
+        with photo_store.blob_lock(db, *(blob.content_hash for blob in stored)):
+            db.add_all(photos)
+            for blob in stored:
+                if blob.staged is None:
+                    if not storage.exists(blob.filename):
+                        raise HTTPException(
+                            status_code=status.HTTP_400_BAD_REQUEST, detail="Photo has not been uploaded",
+                        )
+                elif storage.put_file(blob.staged, blob.filename):
+                    created.append(blob)
+            db.commit()
+    except BaseException:
+        for blob in stored:
+            if blob.staged is not None:
+                storage.discard(blob.staged)
+        for blob in created:
+            photo_store.release(db, storage, blob.filename, blob.content_hash)
+        raise
+    for photo in photos:
+        images.pipeline.submit(photo.id, db.get_bind(), storage)
+    db.refresh(user)
+    return schemas.UserResponse.model_validate(user)
 
 
 @router.patch("/me", response_model=schemas.UserResponse)
@@ -34,59 +82,116 @@ def update_me(
         current_user.education = payload.education
     if payload.industry is not None:
         current_user.industry = payload.industry
+    similarity.save_vector(db, current_user)
     db.commit()
     db.refresh(current_user)
     return current_user
 
 
-@router.post("/me/photos", response_model=schemas.UserResponse, status_code=201)
+@router.post(
+    "/me/photos",
+    response_model=schemas.UserResponse,
+    status_code=201,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"multipart/form-data": {"schema": {
+                "type": "object",
+                "required": ["files"],
+                "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+            }}},
+        },
+    },
+)
 async def upload_photos(
-    files: List[UploadFile] = File(...),
+    request: Request,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    existing_count = len(current_user.photos)
-    if existing_count + len(files) > MAX_PHOTOS:
+    # Reject before reading any of the body when the request can't succeed.
+    content_length = request.headers.get("content-length")
+    if content_length:
+        try:
+            content_length = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Content-Length header")
+    if content_length and content_length > MAX_PHOTOS * MAX_FILE_SIZE + MULTIPART_OVERHEAD:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Cannot exceed {MAX_PHOTOS} photos total (you already have {existing_count})",
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Upload exceeds {MAX_PHOTOS} photos of {MAX_FILE_SIZE // (1024*1024)}MB",
         )
+    existing_count = await run_in_threadpool(_check_photo_room, current_user)
 
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-    for i, file in enumerate(files):
-        if not file.content_type or not file.content_type.startswith("image/"):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File '{file.filename}' is not an image",
-            )
-        ext = (file.filename or "file.jpg").rsplit(".", 1)[-1].lower()
-        if ext not in ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File extension '.{ext}' not allowed. Use: {', '.join(sorted(ALLOWED_EXTENSIONS))}",
-            )
-        content = await file.read()
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File '{file.filename}' exceeds {MAX_FILE_SIZE // (1024*1024)}MB limit",
-            )
-        filename = f"user_{current_user.id}_{uuid.uuid4().hex[:8]}.{ext}"
-        path = os.path.join(UPLOAD_DIR, filename)
-        with open(path, "wb") as f:
-            f.write(content)
-
-        photo = models.UserPhoto(
-            user_id=current_user.id,
-            filename=filename,
-            display_order=existing_count + i,
-        )
-        db.add(photo)
+    storage = get_storage()
+    parser = PhotoUploadParser(request.headers.get("content-type", ""), storage, existing_count)
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(parser.write, chunk)
+        stored = await run_in_threadpool(parser.finish)
+    except BaseException:
+        await run_in_threadpool(parser.abort)
+        raise
 
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    return await run_in_threadpool(_save_photos, db, current_user, stored, existing_count)
+
+
+@router.post("/me/photos/uploads", response_model=schemas.PhotoUploadTicket)
+def create_photo_upload(
+    payload: schemas.PhotoUploadRequest,
+    current_user: models.User = Depends(get_current_user),
+):
+    """Presign a direct upload to storage; confirm it with POST /users/me/photos/confirm."""
+    ext = EXTENSIONS_BY_CONTENT_TYPE.get(payload.content_type)
+    if ext is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Content type must be one of: {', '.join(sorted(EXTENSIONS_BY_CONTENT_TYPE))}",
+        )
+    if not 0 < payload.size <= MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File must be between 1 byte and {MAX_FILE_SIZE // (1024*1024)}MB",
+        )
+    _check_photo_room(current_user)
+
+    storage = get_storage()
+    key = photo_store.blob_key(payload.sha256, ext)
+    upload = storage.presign_put(key, payload.sha256, payload.size, payload.content_type)
+    return schemas.PhotoUploadTicket(
+        key=key,
+        upload_url=upload.url,
+        method=upload.method,
+        headers=upload.headers,
+        expires_in=upload.expires_in,
+        exists=storage.exists(key),
+    )
+
+
+@router.post("/me/photos/confirm", response_model=schemas.UserResponse, status_code=201)
+def confirm_photo_upload(
+    payload: schemas.PhotoConfirmRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    parsed = photo_store.parse_blob_key(payload.key)
+    if parsed is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid photo key")
+    content_hash, ext = parsed
+    existing_count = _check_photo_room(current_user)
+
+    storage = get_storage()
+    if not storage.exists(payload.key):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Photo has not been uploaded")
+    # Presigned uploads bypass the streaming parser, so check the bytes now.
+    with storage.open(payload.key) as f:
+        if sniff_image_type(f.read(SNIFF_BYTES)) != ext:
+            photo_store.release(db, storage, payload.key, content_hash)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Upload is not a supported image")
+        f.seek(0)
+        placeholder = images.make_placeholder(f)
+
+    stored = [photo_store.StoredPhoto(content_hash, payload.key, placeholder)]
+    return _save_photos(db, current_user, stored, existing_count)
 
 
 @router.delete("/me/photos/{photo_id}", response_model=schemas.UserResponse)
@@ -99,11 +204,11 @@ def delete_photo(
     if not photo or photo.user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photo not found")
 
-    path = os.path.join(UPLOAD_DIR, photo.filename)
-    if os.path.exists(path):
-        os.remove(path)
-
+    key, content_hash = photo.filename, photo.content_hash
     db.delete(photo)
     db.commit()
+    # Other photos may share the blob; it only goes with the last reference.
+    photo_store.release(db, get_storage(), key, content_hash)
     db.refresh(current_user)
     return current_user
+
@@ -0,0 +1,126 @@
+"""
+Create and upgrade database tables.
+
+Run once per deploy (``python -m app.schema``) instead of letting every worker
+race DDL at startup. Set AUTO_CREATE_SCHEMA=1 to do it in the app lifespan for
+local development.
+
+create_all only adds missing tables. A database created by an older version
+is brought up to the models by ``upgrade`` (migrate_schema.py): it adds
+missing columns, indexes and unique constraints to the primary and the swipe
+shards, and drops indexes the models replaced. Duplicate matchmaker rows,
+which uq_matchmaker_agent_target forbids, are deleted first.
+"""
+from sqlalchemy import Connection, Engine, Table, UniqueConstraint, and_, delete, func, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+
+from app import models, sharding, text_search  # noqa: F401  (registers tables and DDL on Base.metadata)
+from app.database import Base, get_engine
+
+DELETE_BATCH_SIZE = 500
+
+# Single-column indexes made redundant by composite ones leading with the same column.
+OBSOLETE_INDEXES = {
+    "swipes": ("ix_swipes_target_user_id",),  # ix_swipes_target_direction_swiped
+    "matchmakers": ("ix_matchmakers_agent_id",),  # uq_matchmaker_agent_target, ix_matchmakers_agent_*
+}
+
+
+def create_schema() -> None:
+    Base.metadata.create_all(bind=get_engine())
+    sharding.router.create_all()
+
+
+def dedupe_matchmakers(conn: Connection, dry_run: bool = False) -> int:
+    """Delete all but one matchmaker row per (agent, target); returns how many go.
+
+    The oldest row an agent has already worked on is kept, else the oldest.
+    """
+    table = models.Matchmaker.__table__
+    dupes = (
+        select(table.c.agent_id, table.c.target_user_id)
+        .group_by(table.c.agent_id, table.c.target_user_id)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    rows = conn.execute(
+        select(table.c.id, table.c.agent_id, table.c.target_user_id, table.c.status)
+        .join(dupes, and_(table.c.agent_id == dupes.c.agent_id, table.c.target_user_id == dupes.c.target_user_id))
+        .order_by(table.c.id)
+    ).all()
+    keep = {}
+    for row in rows:
+        kept = keep.get((row.agent_id, row.target_user_id))
+        if kept is None or (kept.status == models.MatchmakerStatusEnum.pending
+                            and row.status != models.MatchmakerStatusEnum.pending):
+            keep[(row.agent_id, row.target_user_id)] = row
+    doomed = [row.id for row in rows if keep[(row.agent_id, row.target_user_id)].id != row.id]
+    if not dry_run:
+        for start in range(0, len(doomed), DELETE_BATCH_SIZE):
+            conn.execute(delete(table).where(table.c.id.in_(doomed[start:start + DELETE_BATCH_SIZE])))
+    return len(doomed)
+
+
+def _columns(conn: Connection, columns) -> str:
+    quote = conn.dialect.identifier_preparer.quote
+    return ", ".join(quote(column.name) for column in columns)
+
+
+def upgrade_table(conn: Connection, table: Table, dry_run: bool = False) -> list[str]:
+    """Bring one existing table up to ``table``; returns the steps, taken unless ``dry_run``."""
+    inspector = inspect(conn)
+    if not inspector.has_table(table.name):
+        if not dry_run:
+            table.create(conn)
+        return [f"create table {table.name}"]
+
+    steps = []
+    quote = conn.dialect.identifier_preparer.quote
+    columns = {column["name"] for column in inspector.get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in columns:
+            steps.append(f"add column {table.name}.{column.name}")
+            if not dry_run:
+                spec = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {spec}"))
+
+    indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+    uniques = indexes | {constraint["name"] for constraint in inspector.get_unique_constraints(table.name)}
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint) and constraint.name and constraint.name not in uniques:
+            if table.name == models.Matchmaker.__tablename__:
+                steps.append(f"delete {dedupe_matchmakers(conn, dry_run)} duplicate matchmaker rows")
+            # A unique index: SQLite can't add a constraint to an existing table, and it enforces the same.
+            steps.append(f"add unique index {constraint.name}")
+            if not dry_run:
+                conn.execute(text(f"CREATE UNIQUE INDEX {quote(constraint.name)} "
+                                  f"ON {quote(table.name)} ({_columns(conn, constraint.columns)})"))
+    for index in sorted(table.indexes, key=lambda index: index.name):
+        if index.name not in indexes:
+            steps.append(f"add index {index.name}")
+            if not dry_run:
+                index.create(conn)
+    for name in OBSOLETE_INDEXES.get(table.name, ()):
+        if name in indexes:
+            steps.append(f"drop index {name}")
+            if not dry_run:
+                conn.execute(text(f"DROP INDEX {quote(name)}"))
+    return steps
+
+
+def upgrade(engine: Engine, shard_engines: list[Engine], dry_run: bool = False) -> list[str]:
+    """Upgrade every table on the primary and the swipes table on each shard."""
+    steps = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            steps += upgrade_table(conn, table, dry_run)
+    table = sharding.shard_table()
+    for i, shard in enumerate(shard_engines):
+        with shard.begin() as conn:
+            steps += [f"shard {i}: {step}" for step in upgrade_table(conn, table, dry_run)]
+    return steps
+
+
+if __name__ == "__main__":
+    create_schema()
+    print("Schema is up to date.")
@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional
-from pydantic import BaseModel, EmailStr, field_validator, computed_field, ConfigDict
+from pydantic import BaseModel, EmailStr, Field, field_validator, computed_field, ConfigDict
 from app.models import (
     GenderEnum, SwipeDirectionEnum, AgentStatusEnum, MatchmakerStatusEnum,
     IncomeRangeEnum, EducationEnum, IndustryEnum,
@@ -54,6 +54,10 @@ class UserPhotoResponse(BaseModel):
 
     id: int
     url: str
+    thumbnail_url: str
+    card_url: str
+    full_url: str
+    placeholder: Optional[str] = None  # BlurHash to paint until the image loads
     display_order: int
 
 
@@ -84,6 +88,25 @@ class UserUpdateRequest(BaseModel):
     industry: Optional[IndustryEnum] = None
 
 
+class PhotoUploadRequest(BaseModel):
+    sha256: str = Field(pattern=r"^[0-9a-f]{64}$")
+    content_type: str
+    size: int
+
+
+class PhotoUploadTicket(BaseModel):
+    key: str
+    upload_url: str
+    method: str
+    headers: dict[str, str]
+    expires_in: int
+    exists: bool  # already stored; the client can skip the PUT and confirm straight away
+
+
+class PhotoConfirmRequest(BaseModel):
+    key: str
+
+
 # ---------------------------------------------------------------------------
 # Profile (public view — no email or password exposed)
 # ---------------------------------------------------------------------------
@@ -106,7 +129,17 @@ class ProfileResponse(BaseModel):
     @computed_field
     @property
     def photo_url(self) -> Optional[str]:
-        return self.photos[0].url if self.photos else None
+        return self.photos[0].card_url if self.photos else None
+
+    @computed_field
+    @property
+    def thumbnail_url(self) -> Optional[str]:
+        return self.photos[0].thumbnail_url if self.photos else None
+
+    @computed_field
+    @property
+    def photo_placeholder(self) -> Optional[str]:
+        return self.photos[0].placeholder if self.photos else None
 
 
 # ---------------------------------------------------------------------------
@@ -122,6 +155,8 @@ class CandidateSearchRequest(BaseModel):
     education: Optional[EducationEnum] = None
     industry: Optional[IndustryEnum] = None
     income_range: Optional[IncomeRangeEnum] = None
+    q: Optional[str] = Field(None, max_length=200)  # full-text over bio and tags, see app.text_search
+    likes_first: bool = False  # users who already liked the caller come first
 
     @field_validator("min_age", "max_age")
     @classmethod
@@ -149,6 +184,12 @@ class SwipeResponse(BaseModel):
     target_user: ProfileResponse
 
 
+class LikeReceivedResponse(BaseModel):
+    user_id: int
+    liked_at: datetime
+    user: ProfileResponse
+
+
 # ---------------------------------------------------------------------------
 # Match
 # ---------------------------------------------------------------------------
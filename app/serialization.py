@@ -0,0 +1,306 @@
+"""
+Fast JSON for list endpoints.
+
+By default FastAPI validates whatever a route returns against its
+response_model (``from_attributes``, walking every relationship), then
+encodes the result with jsonable_encoder and json.dumps. On swipe history and
+match lists that is most of the request's CPU.
+
+Routes that opt in build plain dicts straight from row tuples and profile
+cards (app.profiles) instead, in the same shape and key order as the schemas
+in app.schemas, and return a FastJSONResponse, which FastAPI sends as is. They keep their response_model
+for the OpenAPI docs, and tests compare their output with the schema path
+through the prebuilt TypeAdapters below.
+
+orjson does the encoding when it is installed, pydantic-core's to_json
+otherwise.
+
+Clients that send ``Accept: application/msgpack`` get the same payloads as
+MessagePack instead, when the optional ``msgpack`` package is installed
+(JSON otherwise). List endpoints then send each nested profile once:
+``{"items": [...], "profiles": [...]}``, with the items keeping their
+``*_id`` fields and losing the nested objects (see ``dedupe``). Routers built
+with MsgPackRoute also accept MessagePack request bodies and re-encode their
+ordinary JSON responses.
+"""
+import functools
+from datetime import date
+from enum import Enum
+from typing import Any, Callable, Iterable, Optional, Sequence
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter
+from pydantic_core import from_json, to_json
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.compression import accept_qvalues
+from app.profiles import PhotoRow, ProfileCard, cards_by_id
+from app.storage import StorageBackend, get_storage
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is in requirements.txt
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return to_json(content)
+
+
+def loads(body: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(body)
+    return from_json(body)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _msgpack_default(value: Any) -> Any:
+    # Same representations as the JSON responses.
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Cannot encode {type(value).__name__} as MessagePack")
+
+
+def packb(content: Any) -> bytes:
+    return msgpack.packb(content, default=_msgpack_default)
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return packb(content)
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    """True when ``accept`` names a MessagePack type at least as preferred as JSON."""
+    if msgpack is None or not accept:
+        return False
+    accepted = accept_qvalues(accept)
+    q = max(accepted.get(media_type, 0.0) for media_type in MSGPACK_TYPES)
+    return q > 0 and q >= accepted.get("application/json", 0.0)
+
+
+def dedupe(items: Sequence[dict], profile_keys: Sequence[str]) -> dict:
+    """List payload with the profiles under ``profile_keys`` moved out and sent once each."""
+    shared: dict[int, dict] = {}
+    slim = []
+    for item in items:
+        item = dict(item)
+        for key in profile_keys:
+            profile = item.pop(key)
+            shared.setdefault(profile["id"], profile)
+        slim.append(item)
+    return {"items": slim, "profiles": list(shared.values())}
+
+
+def respond(request: Request, items: list[dict], headers: Optional[dict[str, str]] = None,
+            profile_keys: Sequence[str] = ()) -> Response:
+    """FastJSONResponse, or MsgPackResponse (deduped by ``profile_keys``) if the client asked."""
+    if wants_msgpack(request.headers.get("accept")):
+        response = MsgPackResponse(dedupe(items, profile_keys) if profile_keys else items, headers=headers)
+    else:
+        response = FastJSONResponse(items, headers=headers)
+    response.headers.add_vary_header("Accept")
+    return response
+
+
+def representation(request: Request, fields: Optional[tuple[str, ...]] = None) -> str:
+    """Names the body a request gets, as an ETag variant: its ?fields=, other query parameters and encoding."""
+    variant = ",".join(fields or ())
+    params = sorted((k, v) for k, v in request.query_params.multi_items() if k != "fields")
+    if params:
+        variant += "?" + "&".join(f"{k}={v}" for k, v in params)
+    if wants_msgpack(request.headers.get("accept")):
+        variant += ";msgpack"
+    return variant
+
+
+def _is_msgpack(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip().lower() in MSGPACK_TYPES
+
+
+async def _as_json_request(request: Request) -> Request:
+    """``request`` with its MessagePack body re-encoded as JSON, for FastAPI's body parsing."""
+    if msgpack is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="MessagePack request bodies are not supported")
+    try:
+        body = dumps(msgpack.unpackb(await request.body()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid MessagePack body")
+    headers = [(k, v) for k, v in request.scope["headers"] if k not in (b"content-type", b"content-length")]
+    headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    json_request = Request({**request.scope, "headers": headers}, request.receive)
+    json_request._body = body
+    return json_request
+
+
+class MsgPackRoute(APIRoute):
+    """APIRoute that also speaks MessagePack.
+
+    A MessagePack request body is validated exactly as its JSON equivalent
+    would be, and a JSON response is re-encoded when ``wants_msgpack``.
+    Responses built by ``respond`` come out already negotiated.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            if _is_msgpack(request.headers.get("content-type")):
+                request = await _as_json_request(request)
+            response = await handler(request)
+            if isinstance(response, JSONResponse) and wants_msgpack(request.headers.get("accept")):
+                packed = MsgPackResponse(loads(response.body), status_code=response.status_code,
+                                         background=response.background)
+                packed.raw_headers += [(k, v) for k, v in response.raw_headers
+                                       if k not in (b"content-length", b"content-type")]
+                response = packed
+            response.headers.add_vary_header("Accept")
+            return response
+
+        return route_handler
+
+
+@functools.lru_cache(maxsize=None)
+def adapter(response_type: Any) -> TypeAdapter:
+    """Shared TypeAdapter for a response type, e.g. ``list[schemas.SwipeResponse]``."""
+    return TypeAdapter(response_type)
+
+
+# Names accepted by ?fields=, in payload order; ``id`` is always sent.
+PROFILE_FIELDS = (*schemas.ProfileResponse.model_fields, *schemas.ProfileResponse.model_computed_fields)
+
+SWIPE_COLUMNS = (models.Swipe.id, models.Swipe.target_user_id, models.Swipe.direction, models.Swipe.swiped_at)
+LIKE_COLUMNS = (models.Swipe.user_id, models.Swipe.swiped_at)
+MATCH_COLUMNS = (models.Match.id, models.Match.user1_id, models.Match.user2_id, models.Match.matched_at)
+MATCHMAKER_COLUMNS = (
+    models.Matchmaker.id, models.Matchmaker.agent_id, models.Matchmaker.target_user_id,
+    models.Matchmaker.status, models.Matchmaker.contact_notes, models.Matchmaker.created_at,
+)
+
+
+def photo_payload(photo: PhotoRow, storage: StorageBackend) -> dict:
+    """schemas.UserPhotoResponse."""
+    url = storage.url(photo.filename)
+    variants = photo.variants or {}
+    thumb, card, full = (variants.get(v) for v in ("thumb", "card", "full"))
+    return {
+        "id": photo.id,
+        "url": url,
+        "thumbnail_url": storage.url(thumb) if thumb else url,
+        "card_url": storage.url(card) if card else url,
+        "full_url": storage.url(full) if full else url,
+        "placeholder": photo.placeholder,
+        "display_order": photo.display_order,
+    }
+
+
+def profile_payload(card: ProfileCard, storage: StorageBackend) -> dict:
+    """schemas.ProfileResponse, computed fields included."""
+    photos = [photo_payload(p, storage) for p in card.photos]
+    first: Optional[dict] = photos[0] if photos else None
+    return {
+        "id": card.id,
+        "name": card.name,
+        "gender": card.gender,
+        "age": card.age,
+        "location": card.location,
+        "bio": card.bio,
+        "tags": card.tags,
+        "income_range": card.income_range,
+        "education": card.education,
+        "industry": card.industry,
+        "photos": photos,
+        "photo_url": first and first["card_url"],
+        "thumbnail_url": first and first["thumbnail_url"],
+        "photo_placeholder": first and first["placeholder"],
+    }
+
+
+def sparse(payload: dict, fields: Optional[tuple[str, ...]]) -> dict:
+    """``payload`` cut down to ``fields`` (all of them for None)."""
+    if fields is None:
+        return payload
+    return {name: payload[name] for name in fields}
+
+
+def parse_fields(value: Optional[str]) -> Optional[tuple[str, ...]]:
+    """?fields= value to PROFILE_FIELDS names in payload order; ValueError on unknown names."""
+    if value is None:
+        return None
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = requested.difference(PROFILE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown profile fields: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    return tuple(name for name in PROFILE_FIELDS if name in requested)
+
+
+def profiles(cards: Iterable[ProfileCard], fields: Optional[tuple[str, ...]] = None) -> list[dict]:
+    storage = get_storage()
+    return [sparse(profile_payload(card, storage), fields) for card in cards]
+
+
+def profiles_by_id(db: Session, user_ids: Iterable[int], fields: Optional[tuple[str, ...]] = None) -> dict[int, dict]:
+    """Profile payloads for ``user_ids``, loaded as cards in batches."""
+    storage = get_storage()
+    return {id: sparse(profile_payload(card, storage), fields) for id, card in cards_by_id(db, user_ids).items()}
+
+
+def swipes(rows: Iterable[tuple], targets: dict[int, dict]) -> list[dict]:
+    """schemas.SwipeResponse for SWIPE_COLUMNS rows."""
+    return [
+        {"id": id, "target_user_id": target_id, "direction": direction, "swiped_at": swiped_at,
+         "target_user": targets[target_id]}
+        for id, target_id, direction, swiped_at in rows
+        # A user deleted on the primary can outlive their swipes on a shard for a moment.
+        if target_id in targets
+    ]
+
+
+def likes(rows: Iterable[tuple], users: dict[int, dict]) -> list[dict]:
+    """schemas.LikeReceivedResponse for LIKE_COLUMNS rows."""
+    return [
+        {"user_id": user_id, "liked_at": swiped_at, "user": users[user_id]}
+        for user_id, swiped_at in rows
+        if user_id in users
+    ]
+
+
+def matches(rows: Iterable[tuple], users: dict[int, dict]) -> list[dict]:
+    """schemas.MatchResponse for MATCH_COLUMNS rows."""
+    return [
+        {"id": id, "user1_id": user1_id, "user2_id": user2_id, "matched_at": matched_at,
+         "user1": users[user1_id], "user2": users[user2_id]}
+        for id, user1_id, user2_id, matched_at in rows
+    ]
+
+
+def matchmakers(rows: Iterable[tuple], targets: dict[int, dict]) -> list[dict]:
+    """schemas.MatchmakerResponse for MATCHMAKER_COLUMNS rows."""
+    return [
+        {"id": id, "agent_id": agent_id, "target_user_id": target_id, "status": status,
+         "contact_notes": notes, "created_at": created_at, "target_user": targets[target_id]}
+        for id, agent_id, target_id, status, notes, created_at in rows
+    ]
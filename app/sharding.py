@@ -0,0 +1,331 @@
+import functools
+import logging
+from typing import Callable, Optional, Sequence, Union
+
+from sqlalchemy import Engine, Exists, ForeignKeyConstraint, MetaData, Row, Select, Table, delete, exists, func, select
+from sqlalchemy.orm import Session, aliased, joinedload, selectinload, sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import models
+from app.database import get_swipe_shard_engines, insert_ignore
+from app.pagination import Cursor, paginate
+
+ANSWERED_BATCH_SIZE = 500  # liker ids per lookup of the user's own swipes, when sharded
+
+logger = logging.getLogger(__name__)
+
+
+def shard_table() -> Table:
+    """The swipes table as created on a shard: shard databases have no users
+    table, so it goes without the foreign keys to users.id."""
+    table = models.Swipe.__table__.to_metadata(MetaData())
+    for constraint in [c for c in table.constraints if isinstance(c, ForeignKeyConstraint)]:
+        table.constraints.discard(constraint)
+    for column in table.columns:
+        column.foreign_keys.clear()
+    table.foreign_keys.clear()
+    return table
+
+
+def jump_hash(key: int, num_buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach).
+
+    Growing from N to N+1 buckets moves only ~1/(N+1) of the keys, which keeps
+    resharding cheap.
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    b, j = -1, 0
+    while j < num_buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+class ShardRouter:
+    """Maps a swiper's user id to the database holding their swipe rows."""
+
+    def __init__(self, engines: Union[Sequence[Engine], Callable[[], Sequence[Engine]]]):
+        self._engines = engines
+
+    @functools.cached_property
+    def engines(self) -> list[Engine]:
+        return list(self._engines() if callable(self._engines) else self._engines)
+
+    @functools.cached_property
+    def _sessionmakers(self) -> list[sessionmaker]:
+        return [sessionmaker(autocommit=False, autoflush=False, bind=e) for e in self.engines]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def shard_for_user(self, user_id: int) -> int:
+        return jump_hash(user_id, len(self.engines))
+
+    def session(self, shard: int) -> Session:
+        return self._sessionmakers[shard]()
+
+    def create_all(self) -> None:
+        table = shard_table()
+        for engine in self.engines:
+            table.metadata.create_all(bind=engine)
+
+
+router = ShardRouter(get_swipe_shard_engines)
+
+
+class SwipeStore:
+    """Swipe reads and writes for one request, routed to the owning shard.
+
+    All of a user's own swipes live on ``shard_for_user(user_id)``, so history
+    and the search exclusion list are shard-local. The reciprocal lookup for a
+    match reads the target's shard by point query, and likes received are
+    gathered from every shard. Without configured shards every lookup uses the
+    request's primary session and keeps its SQL joins.
+    """
+
+    def __init__(self, db: Session, shard_router: ShardRouter):
+        self.db = db
+        self.router = shard_router
+        self._sessions: dict[int, Session] = {}
+        self._added: list[models.Swipe] = []
+
+    @property
+    def sharded(self) -> bool:
+        return self.router.enabled
+
+    def session_for(self, user_id: int) -> Session:
+        if not self.sharded:
+            return self.db
+        shard = self.router.shard_for_user(user_id)
+        if shard not in self._sessions:
+            self._sessions[shard] = self.router.session(shard)
+        return self._sessions[shard]
+
+    def all_sessions(self) -> list[Session]:
+        if not self.sharded:
+            return [self.db]
+        for shard in range(len(self.router.engines)):
+            if shard not in self._sessions:
+                self._sessions[shard] = self.router.session(shard)
+        return [self._sessions[shard] for shard in range(len(self.router.engines))]
+
+    def swiped_target_ids(self, user_id: int) -> Union[Select, list[int]]:
+        """Ids the user has swiped on, usable with ``column.not_in(...)``."""
+        stmt = select(models.Swipe.target_user_id).where(models.Swipe.user_id == user_id)
+        if not self.sharded:
+            return stmt
+        return list(self.session_for(user_id).scalars(stmt))
+
+    def find(
+        self,
+        user_id: int,
+        target_user_id: int,
+        direction: Optional[models.SwipeDirectionEnum] = None,
+    ) -> Optional[models.Swipe]:
+        stmt = select(models.Swipe).where(
+            models.Swipe.user_id == user_id,
+            models.Swipe.target_user_id == target_user_id,
+        )
+        if direction is not None:
+            stmt = stmt.where(models.Swipe.direction == direction)
+        return self.session_for(user_id).scalar(stmt)
+
+    def add(self, swipe: models.Swipe) -> None:
+        self.session_for(swipe.user_id).add(swipe)
+        if self.sharded:
+            self._added.append(swipe)
+
+    def load(self, swipe: models.Swipe) -> models.Swipe:
+        """Reload a freshly committed swipe with its target profile attached."""
+        if not self.sharded:
+            return self.db.scalar(
+                select(models.Swipe)
+                .options(joinedload(models.Swipe.target_user).joinedload(models.User.photos))
+                .where(models.Swipe.id == swipe.id)
+            )
+        self.session_for(swipe.user_id).refresh(swipe)
+        self.attach_targets([swipe])
+        return swipe
+
+    def history_rows(self, user_id: int, columns: Sequence) -> list[Row]:
+        """``columns`` of the user's swipes, newest first, without target profiles."""
+        return self.session_for(user_id).execute(
+            select(*columns)
+            .where(models.Swipe.user_id == user_id)
+            .order_by(models.Swipe.swiped_at.desc())
+        ).all()
+
+    def _likes(self, user_id: int, columns: Sequence) -> Select:
+        return select(*columns).where(
+            models.Swipe.target_user_id == user_id,
+            models.Swipe.direction == models.SwipeDirectionEnum.right,
+        )
+
+    def _answered(self, user_id: int) -> Exists:
+        """Whether ``user_id`` has swiped on the row's swiper; for unsharded queries."""
+        mine = aliased(models.Swipe)
+        return exists().where(mine.user_id == user_id, mine.target_user_id == models.Swipe.user_id)
+
+    def _answered_among(self, user_id: int, liker_ids: Sequence[int]) -> set[int]:
+        """Which of ``liker_ids`` ``user_id`` has swiped on, from their own shard."""
+        answered = set()
+        for start in range(0, len(liker_ids), ANSWERED_BATCH_SIZE):
+            answered.update(self.session_for(user_id).scalars(
+                select(models.Swipe.target_user_id).where(
+                    models.Swipe.user_id == user_id,
+                    models.Swipe.target_user_id.in_(liker_ids[start:start + ANSWERED_BATCH_SIZE]),
+                )
+            ))
+        return answered
+
+    def likes_received(self, user_id: int, columns: Sequence, cursor: Optional[Cursor], limit: int) -> list[Row]:
+        """``columns`` of right swipes on ``user_id`` they haven't answered, as a ``paginate`` page.
+
+        Pages are keyed by (swiped_at, swiper's user id), unique within one
+        user's likes even across shards, so ``columns`` must include
+        Swipe.swiped_at and Swipe.user_id.
+        """
+        stmt = self._likes(user_id, columns)
+        if not self.sharded:
+            stmt = stmt.where(~self._answered(user_id))
+            return self.db.execute(paginate(stmt, models.Swipe.swiped_at, models.Swipe.user_id, cursor, limit)).all()
+        # Each shard pages its part of the likes; keep merging pages until
+        # enough survive the filter against the user's own swipes.
+        rows = []
+        while True:
+            page = paginate(stmt, models.Swipe.swiped_at, models.Swipe.user_id, cursor, limit)
+            batch = sorted((row for session in self.all_sessions() for row in session.execute(page)),
+                           key=lambda row: (row.swiped_at, row.user_id), reverse=True)[:limit + 1]
+            answered = self._answered_among(user_id, [row.user_id for row in batch])
+            rows.extend(row for row in batch if row.user_id not in answered)
+            if len(rows) > limit or len(batch) <= limit:
+                return rows[:limit + 1]
+            cursor = Cursor(batch[-1].swiped_at, batch[-1].user_id)
+
+    def count_likes_received(self, user_id: int) -> int:
+        """How many likes ``likes_received`` would list in all."""
+        if not self.sharded:
+            stmt = self._likes(user_id, [func.count()]).where(~self._answered(user_id))
+            return self.db.scalar(stmt)
+        likers = [liker for session in self.all_sessions()
+                  for liker in session.scalars(self._likes(user_id, [models.Swipe.user_id]))]
+        return len(likers) - len(self._answered_among(user_id, likers))
+
+    def attach_targets(self, swipes: Sequence[models.Swipe]) -> None:
+        """Fill ``Swipe.target_user`` from the primary without a cross-database join."""
+        ids = {s.target_user_id for s in swipes}
+        if not ids:
+            return
+        users = {
+            u.id: u for u in self.db.scalars(
+                select(models.User)
+                .options(selectinload(models.User.photos))
+                .where(models.User.id.in_(ids))
+            )
+        }
+        for swipe in swipes:
+            set_committed_value(swipe, "target_user", users.get(swipe.target_user_id))
+
+    def commit(self) -> None:
+        if not self.sharded:
+            self.db.commit()
+            return
+        # Shard rows first: the unique (user_id, target_user_id) constraint there
+        # is what rejects a duplicate swipe before the primary commits a match.
+        # If the primary then fails, delete the swipes again, or they would hide
+        # their targets from search for good.
+        added = [(swipe.user_id, swipe.target_user_id) for swipe in self._added]
+        committed = []
+        try:
+            for shard, session in self._sessions.items():
+                session.commit()
+                committed.append(shard)
+            self.db.commit()
+        except Exception:
+            self.rollback()
+            self._undo(added, committed)
+            raise
+        finally:
+            self._added.clear()
+
+    def _undo(self, added: list[tuple[int, int]], shards: list[int]) -> None:
+        for user_id, target_user_id in added:
+            shard = self.router.shard_for_user(user_id)
+            if shard not in shards:
+                continue
+            session = self._sessions[shard]
+            try:
+                session.execute(delete(models.Swipe).where(
+                    models.Swipe.user_id == user_id, models.Swipe.target_user_id == target_user_id,
+                ))
+                session.commit()
+            except Exception:
+                session.rollback()
+                logger.exception("Could not remove swipe %s -> %s from shard %s after a failed commit",
+                                 user_id, target_user_id, shard)
+
+    def rollback(self) -> None:
+        for session in self._sessions.values():
+            session.rollback()
+        self.db.rollback()
+        self._added.clear()
+
+    def close(self) -> None:
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+
+def rebalance(source: ShardRouter, target: ShardRouter, batch_size: int = 5000,
+              dry_run: bool = False) -> int:
+    """Move swipe rows from the ``source`` layout to the ``target`` layout.
+
+    Rows are copied in batches then deleted from their old shard; copies use
+    insert-or-ignore so an interrupted run can simply be restarted. Returns the
+    number of rows that moved (or would move, with ``dry_run``).
+    """
+    target.create_all()
+    target_by_url = {str(e.url): i for i, e in enumerate(target.engines)}
+    columns = [c for c in models.Swipe.__table__.columns if c.name != "id"]
+    moved = 0
+
+    for engine in source.engines:
+        here = target_by_url.get(str(engine.url))
+        last_id = 0
+        while True:
+            with Session(engine) as src:
+                rows = src.execute(
+                    select(models.Swipe.__table__)
+                    .where(models.Swipe.id > last_id)
+                    .order_by(models.Swipe.id)
+                    .limit(batch_size)
+                ).mappings().all()
+                if not rows:
+                    break
+                last_id = rows[-1]["id"]
+
+                by_dest: dict[int, list] = {}
+                for row in rows:
+                    dest = target.shard_for_user(row["user_id"])
+                    if dest != here:
+                        by_dest.setdefault(dest, []).append(row)
+                batch_moved = sum(len(r) for r in by_dest.values())
+                moved += batch_moved
+                if dry_run or not batch_moved:
+                    continue
+
+                for dest, dest_rows in by_dest.items():
+                    dest_engine = target.engines[dest]
+                    with Session(dest_engine) as dst:
+                        dst.execute(
+                            insert_ignore(dest_engine, models.Swipe),
+                            [{c.name: row[c.name] for c in columns} for row in dest_rows],
+                        )
+                        dst.commit()
+                moved_ids = [row["id"] for dest_rows in by_dest.values() for row in dest_rows]
+                src.execute(delete(models.Swipe).where(models.Swipe.id.in_(moved_ids)))
+                src.commit()
+
+    return moved
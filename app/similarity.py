@@ -0,0 +1,442 @@
+"""
+"Profiles like this one": hashed profile vectors and an in-process IVF index.
+
+Every profile becomes a SIMILARITY_DIM-long unit vector, computed locally
+with the hashing trick. Tags, bio words (and word pairs), and the categorical
+attributes (gender, age band, location, education, industry, income) are
+each hashed to one signed coordinate. Each group is normalised and weighted
+by GROUP_WEIGHTS, so profiles that share more of them get a higher dot
+product. Vectors are kept as float16 in profile_vectors, 2 bytes per
+dimension. They are written in the same transaction as the profile, on
+register and PATCH /users/me.
+
+The index is an inverted file (IVF). It partitions the vectors into about
+sqrt(N) lists around k-means centroids trained on a sample. A query scores
+the centroids, then only the vectors in the SIMILARITY_NPROBE nearest lists:
+at a million profiles that is a few thousand dot products instead of a
+million. In memory each vector is int8 with a float32 scale, 132 bytes at
+the default 128 dimensions, and cheaper to widen for the dot products than
+float16. The centroids are not retrained, so restart to rebuild once the
+population has grown several-fold.
+
+Each process holds its own index. Vectors its own sessions commit go into
+their nearest list as they arrive (see the session hooks at the bottom).
+Vectors written anywhere else (other workers, the backfill below) are picked
+up by a refresh: at most every SIMILARITY_REFRESH_SECONDS, the next lookup
+first reads the profile_vectors rows whose updated_at is newer than the last
+build or refresh, less REFRESH_OVERLAP for clock skew and slow commits.
+Until then such a profile is missing from results or stale in them.
+
+The index is built from profile_vectors on first use, or at startup with
+SIMILARITY_WARMUP=1. Profiles inserted in bulk (generate_data.py), or
+created before this table existed, have no vector until backfilled:
+  python -m app.similarity
+  python -m app.similarity --all   # recompute every vector, e.g. after changing SIMILARITY_DIM
+"""
+import argparse
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import delete, event, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import insert_ignore
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is in requirements.txt
+    np = None
+
+SIMILARITY_DIM = int(os.getenv("SIMILARITY_DIM", "128"))
+SIMILARITY_NPROBE = int(os.getenv("SIMILARITY_NPROBE", "16"))  # lists scanned per query
+# Below this many vectors the index is a single list, i.e. exact search.
+SIMILARITY_MIN_TRAIN = int(os.getenv("SIMILARITY_MIN_TRAIN", "4096"))
+SIMILARITY_WARMUP = os.getenv("SIMILARITY_WARMUP", "").lower() in ("1", "true", "yes")
+# How often the index reads vectors other processes wrote; 0 never does.
+SIMILARITY_REFRESH_SECONDS = float(os.getenv("SIMILARITY_REFRESH_SECONDS", "60"))
+REFRESH_OVERLAP = timedelta(seconds=30)
+
+GROUP_WEIGHTS = {"tags": 1.0, "bio": 0.6, "attributes": 0.8}
+TRAIN_PER_LIST = 32  # k-means sample size, per centroid
+TRAIN_ITERATIONS = 10
+BATCH_SIZE = 65536  # vectors assigned to centroids per matrix product
+
+VECTOR_COLUMNS = (
+    models.User.id, models.User.gender, models.User.age, models.User.location, models.User.bio,
+    models.User.tags, models.User.income_range, models.User.education, models.User.industry,
+)
+STOPWORDS = frozenset(
+    "a about all am an and are as at be but by for from have i i'm im in is it just like love me my "
+    "of on or so that the this to too up we with you your".split()
+)
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def _words(text: Optional[str]) -> list[str]:
+    return [w for w in _WORD.findall((text or "").lower()) if len(w) > 1 and w not in STOPWORDS]
+
+
+def _value(value) -> str:
+    return str(getattr(value, "value", value)).strip().lower()
+
+
+def features(profile) -> dict[str, list[str]]:
+    """Hashed feature names of a User (or a row of VECTOR_COLUMNS), by group."""
+    tags = [f"tag:{t}" for t in (tag.strip().lower() for tag in (profile.tags or "").split(",")) if t]
+    words = _words(profile.bio)
+    bio = [f"word:{w}" for w in words] + [f"pair:{a} {b}" for a, b in zip(words, words[1:])]
+    attributes = [f"age:{profile.age // 5}", f"age+:{(profile.age + 2) // 5}"]  # overlapping 5-year bands
+    for name in ("gender", "location", "education", "industry", "income_range"):
+        value = getattr(profile, name)
+        if value:
+            attributes.append(f"{name}:{_value(value)}")
+    return {"tags": tags, "bio": bio, "attributes": attributes}
+
+
+def embed(profile, dim: int = SIMILARITY_DIM) -> "np.ndarray":
+    """Unit float32 vector of ``profile``; the dot product of two is their similarity."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for group, names in features(profile).items():
+        part = np.zeros(dim, dtype=np.float32)
+        for name in names:
+            h = zlib.crc32(name.encode())
+            part[h % dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(part)
+        if norm:
+            vector += GROUP_WEIGHTS[group] * part / norm
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def encode(vector: "np.ndarray") -> bytes:
+    return vector.astype(np.float16).tobytes()
+
+
+def decode(blob: bytes) -> "np.ndarray":
+    return np.frombuffer(blob, dtype=np.float16)
+
+
+def quantize(vectors: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+    """int8 codes and per-row scales; ``codes * scales[:, None]`` approximates ``vectors``."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    peak = np.abs(vectors).max(axis=1)
+    scales = np.where(peak > 0, peak / 127, 1).astype(np.float32)
+    return np.rint(vectors / scales[:, None]).astype(np.int8), scales
+
+
+def _normalized(vectors: "np.ndarray") -> "np.ndarray":
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def kmeans(sample: "np.ndarray", k: int, rng: "np.random.Generator",
+           iterations: int = TRAIN_ITERATIONS) -> "np.ndarray":
+    """k unit centroids for unit-length float32 ``sample`` (spherical k-means)."""
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        filled = np.bincount(assign, minlength=k) > 0
+        centroids[filled] = _normalized(sums[filled])  # an empty cluster keeps its centroid
+    return centroids
+
+
+class _List:
+    """One inverted list of quantized vectors, grown by doubling, removed from by swapping in the last."""
+    __slots__ = ("ids", "codes", "scales", "size")
+
+    def __init__(self, ids: "np.ndarray", codes: "np.ndarray", scales: "np.ndarray"):
+        self.ids, self.codes, self.scales, self.size = ids, codes, scales, len(ids)
+
+    def append(self, user_id: int, codes: "np.ndarray", scale: float) -> int:
+        if self.size == len(self.ids):
+            capacity = max(16, 2 * self.size)
+            self.ids = np.resize(self.ids, capacity)
+            self.codes = np.resize(self.codes, (capacity, self.codes.shape[1]))
+            self.scales = np.resize(self.scales, capacity)
+        self.ids[self.size], self.codes[self.size], self.scales[self.size] = user_id, codes, scale
+        self.size += 1
+        return self.size - 1
+
+    def pop(self, slot: int) -> Optional[int]:
+        """Remove ``slot``; the id moved into it, if any."""
+        self.size -= 1
+        if slot == self.size:
+            return None
+        last = self.size
+        self.ids[slot], self.codes[slot], self.scales[slot] = self.ids[last], self.codes[last], self.scales[last]
+        return int(self.ids[slot])
+
+
+class IVFIndex:
+    """Top-K inner-product search over unit vectors, thread-safe, updated in place."""
+
+    def __init__(self, dim: int = SIMILARITY_DIM, nprobe: int = SIMILARITY_NPROBE,
+                 min_train: int = SIMILARITY_MIN_TRAIN, seed: int = 0):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.seed = seed
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.ready = False
+            self.centroids = np.zeros((1, self.dim), dtype=np.float32)
+            self.lists = [self._empty_list()]
+            # Where each user id lives: list number (-1 if absent) and slot, indexed by id.
+            self._list_of = np.full(0, -1, dtype=np.int32)
+            self._slot_of = np.zeros(0, dtype=np.int32)
+            self._pending: Optional[dict[int, "np.ndarray"]] = None
+
+    def _empty_list(self) -> _List:
+        return _List(np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.int8),
+                     np.empty(0, dtype=np.float32))
+
+    def __len__(self) -> int:
+        return sum(lst.size for lst in self.lists)
+
+    def build(self, ids: "np.ndarray", vectors: "np.ndarray") -> None:
+        """Replace the contents with ``vectors`` (one row per id, e.g. float16), training new centroids."""
+        n = len(ids)
+        nlist = max(1, int(math.sqrt(n))) if n >= self.min_train else 1
+        if nlist > 1:
+            rng = np.random.default_rng(self.seed)
+            sample = vectors[rng.choice(n, min(n, nlist * TRAIN_PER_LIST), replace=False)].astype(np.float32)
+            centroids = kmeans(sample, nlist, rng)
+        else:
+            centroids = np.zeros((1, self.dim), dtype=np.float32)
+        assign = np.zeros(n, dtype=np.int64)
+        if nlist > 1:
+            for start in range(0, n, BATCH_SIZE):
+                chunk = vectors[start:start + BATCH_SIZE].astype(np.float32)
+                assign[start:start + BATCH_SIZE] = np.argmax(chunk @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=nlist))))
+        ids = ids[order].astype(np.int64)
+        codes, scales = np.empty((n, self.dim), dtype=np.int8), np.empty(n, dtype=np.float32)
+        for start in range(0, n, BATCH_SIZE):
+            rows = order[start:start + BATCH_SIZE]
+            codes[start:start + BATCH_SIZE], scales[start:start + BATCH_SIZE] = quantize(vectors[rows])
+        lists = [_List(ids[a:b].copy(), codes[a:b].copy(), scales[a:b].copy())
+                 for a, b in zip(bounds[:-1], bounds[1:])]
+        list_of = np.full(int(ids.max()) + 1 if n else 0, -1, dtype=np.int32)
+        slot_of = np.zeros(len(list_of), dtype=np.int32)
+        list_of[ids] = assign[order]
+        slot_of[ids] = np.arange(n) - bounds[assign[order]]
+        with self._lock:
+            self.centroids, self.lists = centroids, lists
+            self._list_of, self._slot_of = list_of, slot_of
+            self.ready = True
+
+    @contextmanager
+    def buffering(self) -> Iterator[None]:
+        """Hold ``add`` calls while a build reads the table, and apply them after it."""
+        with self._lock:
+            self._pending = {}
+        try:
+            yield
+        finally:
+            with self._lock:
+                pending, self._pending = self._pending, None
+                for user_id, vector in pending.items():
+                    self.add(user_id, vector)
+
+    def add(self, user_id: int, vector: "np.ndarray") -> None:
+        """Insert or replace ``user_id``'s vector. A no-op until built."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending[user_id] = vector
+                return
+            if not self.ready:
+                return
+            self.remove(user_id)
+            if user_id >= len(self._list_of):
+                size = max(user_id + 1, 2 * len(self._list_of))
+                grown = np.full(size, -1, dtype=np.int32)
+                grown[:len(self._list_of)] = self._list_of
+                self._list_of = grown
+                self._slot_of = np.resize(self._slot_of, size)
+            number = int(np.argmax(self.centroids @ vector)) if len(self.lists) > 1 else 0
+            codes, scales = quantize(vector)
+            self._list_of[user_id] = number
+            self._slot_of[user_id] = self.lists[number].append(user_id, codes[0], scales[0])
+
+    def remove(self, user_id: int) -> None:
+        with self._lock:
+            if user_id >= len(self._list_of) or self._list_of[user_id] < 0:
+                return
+            slot = int(self._slot_of[user_id])
+            moved = self.lists[self._list_of[user_id]].pop(slot)
+            if moved is not None:
+                self._slot_of[moved] = slot
+            self._list_of[user_id] = -1
+
+    def get(self, user_id: int) -> Optional["np.ndarray"]:
+        with self._lock:
+            if user_id >= len(self._list_of) or self._list_of[user_id] < 0:
+                return None
+            lst, slot = self.lists[self._list_of[user_id]], self._slot_of[user_id]
+            return lst.codes[slot] * lst.scales[slot]
+
+    def search(self, vector: "np.ndarray", k: int, exclude: Iterable[int] = ()) -> list[tuple[int, float]]:
+        """Up to ``k`` (user id, score) pairs, best first, skipping ids in ``exclude``.
+
+        Probes more lists when exclusions leave fewer than ``k`` results.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        excluded = np.fromiter(exclude, dtype=np.int64)
+        with self._lock:
+            ranked = np.argsort(-(self.centroids @ vector))
+        nprobe = self.nprobe
+        while True:
+            with self._lock:
+                probed = [self.lists[i] for i in ranked[:nprobe]]
+                ids = np.concatenate([lst.ids[:lst.size] for lst in probed])
+                codes = np.concatenate([lst.codes[:lst.size] for lst in probed])
+                scales = np.concatenate([lst.scales[:lst.size] for lst in probed])
+            scores = (codes.astype(np.float32) @ vector) * scales
+            if len(excluded):
+                scores[np.isin(ids, excluded)] = -np.inf
+            top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+            top = top[np.isfinite(scores[top])]
+            if len(top) >= k or nprobe >= len(ranked):
+                break
+            nprobe *= 2
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+def load_vectors(db: Session, dim: int = SIMILARITY_DIM) -> tuple["np.ndarray", "np.ndarray"]:
+    """Every stored vector of length ``dim``: (ids, float16 vectors)."""
+    ids, blobs = [], []
+    for user_id, blob in db.execute(select(models.ProfileVector.user_id, models.ProfileVector.vector)):
+        if len(blob) == 2 * dim:
+            ids.append(user_id)
+            blobs.append(blob)
+    return np.array(ids, dtype=np.int64), np.frombuffer(b"".join(blobs), dtype=np.float16).reshape(-1, dim)
+
+
+index = IVFIndex() if np is not None else None
+_build_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_synced_at: Optional[datetime] = None  # vectors updated before this (less REFRESH_OVERLAP) are in the index
+_refreshed = 0.0  # time.monotonic() of the last build or refresh
+
+
+def get_index(db: Session) -> IVFIndex:
+    """The process-wide index, built from ``db`` on first use and refreshed from it now and then."""
+    global _synced_at, _refreshed
+    if not index.ready:
+        with _build_lock:
+            if not index.ready:
+                started = models.utcnow()
+                with index.buffering():
+                    index.build(*load_vectors(db, index.dim))
+                _synced_at, _refreshed = started, time.monotonic()
+    elif 0 < SIMILARITY_REFRESH_SECONDS <= time.monotonic() - _refreshed:
+        refresh(db)
+    return index
+
+
+def refresh(db: Session) -> int:
+    """Add the vectors written since the last build or refresh; how many rows were read.
+
+    Returns 0 straight away while another thread is refreshing.
+    """
+    global _synced_at, _refreshed
+    if not _refresh_lock.acquire(blocking=False):
+        return 0
+    try:
+        started = models.utcnow()
+        stmt = select(models.ProfileVector.user_id, models.ProfileVector.vector)
+        if _synced_at is not None:
+            stmt = stmt.where(models.ProfileVector.updated_at >= _synced_at - REFRESH_OVERLAP)
+        rows = db.execute(stmt).all()
+        for user_id, blob in rows:
+            if len(blob) == 2 * index.dim:
+                index.add(user_id, decode(blob).astype(np.float32))
+        _synced_at, _refreshed = started, time.monotonic()
+        return len(rows)
+    finally:
+        _refresh_lock.release()
+
+
+def profile_vector(db: Session, user_id: int) -> Optional["np.ndarray"]:
+    """``user_id``'s indexed vector, or one computed from their profile; None if there's no such user."""
+    vector = get_index(db).get(user_id)
+    if vector is not None:
+        return vector
+    row = db.execute(select(*VECTOR_COLUMNS).where(models.User.id == user_id)).first()
+    return embed(row) if row is not None else None
+
+
+def save_vector(db: Session, user: models.User) -> None:
+    """Store ``user``'s vector in ``db``'s transaction; the index picks it up on commit."""
+    if np is None:
+        return
+    vector = embed(user)
+    db.merge(models.ProfileVector(user_id=user.id, vector=encode(vector)))
+    db.info.setdefault("similarity", {})[user.id] = vector
+
+
+@event.listens_for(Session, "after_commit")
+def _index_committed(session: Session) -> None:
+    pending = session.info.pop("similarity", None)
+    if pending and index is not None:
+        for user_id, vector in pending.items():
+            index.add(user_id, vector)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session: Session) -> None:
+    session.info.pop("similarity", None)
+
+
+def backfill(db: Session, recompute: bool = False, batch_size: int = 1000) -> int:
+    """Store vectors for profiles without one (every profile with ``recompute``); how many were written."""
+    written, last_id = 0, 0
+    while True:
+        stmt = select(*VECTOR_COLUMNS).where(models.User.id > last_id).order_by(models.User.id).limit(batch_size)
+        if not recompute:
+            stmt = stmt.outerjoin(models.ProfileVector, models.ProfileVector.user_id == models.User.id).where(
+                models.ProfileVector.user_id.is_(None))
+        rows = db.execute(stmt).all()
+        if not rows:
+            return written
+        if recompute:
+            db.execute(delete(models.ProfileVector).where(models.ProfileVector.user_id.in_([r.id for r in rows])))
+        db.execute(insert_ignore(db.get_bind(), models.ProfileVector), [
+            {"user_id": row.id, "vector": encode(embed(row)), "updated_at": models.utcnow()} for row in rows
+        ])
+        db.commit()
+        written += len(rows)
+        last_id = rows[-1].id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--all", action="store_true", help="recompute every vector, not just missing ones")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    from app.database import SessionLocal
+
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        written = backfill(db, recompute=args.all, batch_size=args.batch_size)
+    print(f"Wrote {written} profile vectors in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Where photo bytes live.
+
+Everything above this module deals in photo store keys ("ab/cd/<sha256>.png",
+see app.photo_store); a StorageBackend maps keys to bytes and public URLs.
+
+- LocalStorage: a directory served under /uploads. The default.
+- S3Storage: any S3-compatible bucket (AWS, R2, MinIO) through a boto3-style
+  client. Photo URLs point at S3_PUBLIC_URL, typically a CDN.
+
+Both hand out presigned uploads, so clients can PUT photo bytes straight to
+storage and then confirm the upload through the API.
+
+Configure with STORAGE_BACKEND=local|s3. S3 also reads S3_BUCKET, S3_REGION,
+S3_ENDPOINT_URL, S3_PUBLIC_URL and S3_PREFIX, and needs boto3 installed.
+"""
+import base64
+import glob
+import io
+import os
+import tempfile
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import BinaryIO, NamedTuple, Optional
+
+from app import auth
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "photos/")
+
+# Keys are content-addressed, so an object never changes once written.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+CONTENT_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+
+class PresignedUpload(NamedTuple):
+    url: str
+    method: str
+    headers: dict[str, str]
+    expires_in: int
+
+
+class StorageBackend(ABC):
+    """Interface for photo storage. Keys are "/"-separated relative paths."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def staging_path(self) -> str:
+        """A fresh local path to write a file to before ``put_file``."""
+
+    @abstractmethod
+    def put_file(self, source: str, key: str) -> bool:
+        """Store the local file ``source`` (consumed) as ``key``; True if the key is new."""
+
+    def discard(self, staged: str) -> None:
+        """Drop a staging file that won't be stored after all."""
+        try:
+            os.remove(staged)
+        except FileNotFoundError:
+            pass
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str) -> None:
+        ...
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        ...
+
+    @abstractmethod
+    def presign_put(self, key: str, content_hash: str, size: int, content_type: str) -> PresignedUpload:
+        ...
+
+
+class LocalStorage(StorageBackend):
+    """Files under ``root``; presigned PUTs go to the API's /storage/uploads route."""
+
+    def __init__(self, root: str, base_url: str = "/uploads", put_url: str = "/storage/uploads"):
+        self.root = root
+        self.base_url = base_url
+        self.put_url = put_url
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def staging_path(self) -> str:
+        # Same filesystem as the store, so put_file is an atomic rename.
+        os.makedirs(self.root, exist_ok=True)
+        return os.path.join(self.root, f".upload_{uuid.uuid4().hex}.part")
+
+    def put_file(self, source: str, key: str) -> bool:
+        # Renaming over an existing key is harmless (same bytes) and restores a
+        # blob that a concurrent delete removed a moment earlier.
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        created = not os.path.exists(path)
+        os.replace(source, path)
+        return created
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix: str) -> None:
+        for path in glob.glob(glob.escape(self.path(prefix)) + "*"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def presign_put(self, key: str, content_hash: str, size: int, content_type: str) -> PresignedUpload:
+        token = auth.create_upload_token(key, content_hash, size, content_type)
+        return PresignedUpload(
+            url=f"{self.put_url}/{token}",
+            method="PUT",
+            headers={"Content-Type": content_type},
+            expires_in=auth.UPLOAD_TOKEN_EXPIRE_SECONDS,
+        )
+
+
+class S3Storage(StorageBackend):
+    """Objects in an S3-compatible bucket, via an injected boto3-style client."""
+
+    def __init__(self, client, bucket: str, public_url: str, prefix: str = ""):
+        self.client = client
+        self.bucket = bucket
+        self.public_url = public_url.rstrip("/")
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as exc:
+            if _error_code(exc) in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def staging_path(self) -> str:
+        return os.path.join(tempfile.gettempdir(), f"tinderido_{uuid.uuid4().hex}.part")
+
+    def put_file(self, source: str, key: str) -> bool:
+        created = not self.exists(key)
+        try:
+            self.client.upload_file(source, self.bucket, self._key(key), ExtraArgs={
+                "ContentType": _content_type(key),
+                "CacheControl": IMMUTABLE_CACHE_CONTROL,
+            })
+        finally:
+            os.remove(source)
+        return created
+
+    def open(self, key: str) -> BinaryIO:
+        # Photos are capped at a few MB; buffering keeps callers seekable.
+        body = self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+        try:
+            return io.BytesIO(body.read())
+        finally:
+            body.close()
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_prefix(self, prefix: str) -> None:
+        kwargs = {"Bucket": self.bucket, "Prefix": self._key(prefix)}
+        while True:
+            page = self.client.list_objects_v2(**kwargs)
+            for obj in page.get("Contents", []):
+                self.client.delete_object(Bucket=self.bucket, Key=obj["Key"])
+            if not page.get("IsTruncated"):
+                return
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{self._key(key)}"
+
+    def presign_put(self, key: str, content_hash: str, size: int, content_type: str) -> PresignedUpload:
+        # S3 verifies the signed length and checksum, so the stored bytes match the key.
+        checksum = base64.b64encode(bytes.fromhex(content_hash)).decode()
+        expires_in = auth.UPLOAD_TOKEN_EXPIRE_SECONDS
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self._key(key),
+                "ContentType": content_type,
+                "ContentLength": size,
+                "ChecksumSHA256": checksum,
+                "CacheControl": IMMUTABLE_CACHE_CONTROL,
+            },
+            ExpiresIn=expires_in,
+        )
+        return PresignedUpload(
+            url=url,
+            method="PUT",
+            headers={
+                "Content-Type": content_type,
+                "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+                "x-amz-checksum-sha256": checksum,
+            },
+            expires_in=expires_in,
+        )
+
+
+def _content_type(key: str) -> str:
+    return CONTENT_TYPES.get(key.rsplit(".", 1)[-1], "application/octet-stream")
+
+
+def _error_code(exc: Exception) -> Optional[str]:
+    response = getattr(exc, "response", None) or {}
+    return str(response.get("Error", {}).get("Code", "")) or None
+
+
+_storage: Optional[StorageBackend] = None
+_lock = threading.Lock()
+
+
+def _build() -> StorageBackend:
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(UPLOAD_DIR)
+    if STORAGE_BACKEND == "s3":
+        try:
+            import boto3
+        except ImportError as exc:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 (pip install boto3)") from exc
+        if not S3_BUCKET:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        client = boto3.client("s3", region_name=S3_REGION, endpoint_url=S3_ENDPOINT_URL)
+        public_url = S3_PUBLIC_URL or f"https://{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com"
+        return S3Storage(client, S3_BUCKET, public_url, prefix=S3_PREFIX)
+    raise RuntimeError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; use 'local' or 's3'")
+
+
+def get_storage() -> StorageBackend:
+    """The configured backend, built on first use like the database engines."""
+    global _storage
+    if _storage is None:
+        with _lock:
+            if _storage is None:
+                _storage = _build()
+    return _storage
@@ -0,0 +1,106 @@
+"""
+Full-text search over profile bios and tags (POST /candidates/search ``q``).
+
+SQLite uses an FTS5 index, users_fts. It is an external-content table over
+users(bio, tags): the index holds only the tokens, the text stays in users.
+Triggers keep it in step with every INSERT, UPDATE and DELETE, including
+bulk loads. Postgres uses users.search_vector, a generated tsvector column
+with a GIN index. Both stem English words (porter on SQLite, the 'english'
+configuration on Postgres), weight tags above bio, and rank matches by
+relevance: bm25 on SQLite, ts_rank_cd on Postgres. A query's words must all
+match, as with plainto_tsquery.
+
+The index objects are created with the users table through DDL events, so
+create_all (python -m app.schema) sets them up. Add them to a database whose
+users table predates this module, and index the existing rows, with:
+  python -m app.text_search
+
+Other databases fall back to ILIKE on bio and tags, which scans users.
+"""
+import re
+
+from sqlalchemy import DDL, Engine, Select, and_, column, event, func, literal_column, or_, table, text
+
+from app import models
+
+SEARCH_DIALECTS = ("sqlite", "postgresql")
+MAX_TERMS = 16
+
+# Column weights for bm25 / setweight: tags count more than a passing word in a bio.
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "bio, tags, content='users', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, bio, tags) VALUES (new.id, new.bio, new.tags); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, bio, tags) VALUES ('delete', old.id, old.bio, old.tags); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF bio, tags ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, bio, tags) VALUES ('delete', old.id, old.bio, old.tags); "
+    "INSERT INTO users_fts(rowid, bio, tags) VALUES (new.id, new.bio, new.tags); END",
+]
+POSTGRES_DDL = [
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(tags, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(bio, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_users_search_vector ON users USING GIN (search_vector)",
+]
+
+users_fts = table("users_fts", column("rowid"), column("users_fts"))
+_TERM = re.compile(r"\w+")
+
+for _statement in SQLITE_DDL:
+    event.listen(models.User.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+for _statement in POSTGRES_DDL:
+    event.listen(models.User.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+# The triggers and the generated column go with the table; the FTS5 table doesn't.
+event.listen(models.User.__table__, "before_drop",
+             DDL("DROP TABLE IF EXISTS users_fts").execute_if(dialect="sqlite"))
+
+
+def terms(q: str) -> list[str]:
+    """The words of ``q``, lowercased; punctuation and query operators are dropped."""
+    return [t.lower() for t in _TERM.findall(q)][:MAX_TERMS]
+
+
+def search(stmt: Select, dialect: str, q: str) -> Select:
+    """``stmt`` (a select from users) narrowed to profiles matching every word of ``q``, best first."""
+    words = terms(q)
+    if not words:
+        return stmt
+    if dialect == "sqlite":
+        # Quoted, so words like AND or NEAR are searched for rather than parsed.
+        match = " ".join(f'"{w}"' for w in words)
+        return (
+            stmt.join(users_fts, users_fts.c.rowid == models.User.id)
+            .where(users_fts.c.users_fts.op("MATCH")(match))
+            .order_by(func.bm25(literal_column("users_fts"), 1.0, 2.0))
+        )
+    if dialect == "postgresql":
+        vector = literal_column("users.search_vector")
+        query = func.plainto_tsquery("english", " ".join(words))
+        return stmt.where(vector.op("@@")(query)).order_by(func.ts_rank_cd(vector, query).desc())
+    return stmt.where(and_(*(
+        or_(models.User.bio.ilike(f"%{w}%"), models.User.tags.ilike(f"%{w}%")) for w in words
+    )))
+
+
+def install(engine: Engine) -> None:
+    """Create the index objects on an existing users table and index its rows."""
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            for statement in SQLITE_DDL:
+                conn.execute(text(statement))
+            conn.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+        elif engine.dialect.name == "postgresql":
+            for statement in POSTGRES_DDL:
+                conn.execute(text(statement))
+
+
+if __name__ == "__main__":
+    from app.database import get_engine
+
+    engine = get_engine()
+    if engine.dialect.name not in SEARCH_DIALECTS:
+        raise SystemExit(f"No full-text index for {engine.dialect.name}; searches use ILIKE.")
+    install(engine)
+    print("Full-text index is up to date.")
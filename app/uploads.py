@@ -0,0 +1,172 @@
+from typing import Optional
+
+from fastapi import HTTPException, status
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app import images, photo_store
+from app.photo_store import StoredPhoto
+from app.storage import CONTENT_TYPES, StorageBackend
+
+MAX_PHOTOS = 6
+MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB
+ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp"}
+# Content types accepted for presigned uploads, which can't be sniffed until confirmed.
+EXTENSIONS_BY_CONTENT_TYPE = {content_type: ext for ext, content_type in CONTENT_TYPES.items()}
+# Room for multipart boundaries and part headers on top of the file bytes.
+MULTIPART_OVERHEAD = 64 * 1024
+
+SNIFF_BYTES = 12
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """File extension for the image format in ``head`` (magic bytes), or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def _bad_request(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+class _Part:
+    def __init__(self, original_name: str, temp_path: str):
+        self.original_name = original_name
+        self.temp_path = temp_path
+        self.file = open(temp_path, "wb")
+        self.hasher = photo_store.new_hasher()
+        self.size = 0
+        self.head = b""
+
+
+class PhotoUploadParser:
+    """Streams a multipart photo upload straight to disk.
+
+    Fed one network chunk at a time (from a worker thread, since it does file
+    I/O). Content type, extension, magic bytes, size and photo count are
+    checked as bytes arrive, and the first violation raises HTTPException so
+    the rest of the body is never read. Only ``SNIFF_BYTES`` of each file are
+    ever held in memory; the content hash is computed on the same pass, and
+    each finished file gets its placeholder. Files stay staged until their
+    rows are saved, which puts them into the photo store.
+    """
+
+    def __init__(self, content_type: str, storage: StorageBackend, existing_count: int):
+        ctype, params = parse_options_header(content_type)
+        if ctype != b"multipart/form-data" or not params.get(b"boundary"):
+            raise _bad_request("Expected a multipart/form-data upload")
+
+        self.storage = storage
+        self.existing_count = existing_count
+        self.saved: list[StoredPhoto] = []
+        self._part: Optional[_Part] = None
+        self._headers: dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def write(self, chunk: bytes) -> None:
+        self._parser.write(chunk)
+
+    def finish(self) -> list[StoredPhoto]:
+        self._parser.finalize()
+        if not self.saved:
+            raise _bad_request("No files uploaded")
+        return self.saved
+
+    def abort(self) -> None:
+        """Remove everything written so far."""
+        if self._part is not None:
+            self._part.file.close()
+            self.storage.discard(self._part.temp_path)
+            self._part = None
+        for blob in self.saved:
+            self.storage.discard(blob.staged)
+        self.saved = []
+
+    # -- multipart callbacks -------------------------------------------------
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._field.lower()] = self._value
+        self._field = b""
+        self._value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name") != b"files" or b"filename" not in options:
+            return  # not a photo part; its bytes are skipped
+
+        filename = options[b"filename"].decode("utf-8", "replace") or "file.jpg"
+        content_type = self._headers.get(b"content-type", b"").decode("latin-1")
+        if not content_type.startswith("image/"):
+            raise _bad_request(f"File '{filename}' is not an image")
+        ext = filename.rsplit(".", 1)[-1].lower()
+        if ext not in ALLOWED_EXTENSIONS:
+            raise _bad_request(
+                f"File extension '.{ext}' not allowed. Use: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
+            )
+        if self.existing_count + len(self.saved) >= MAX_PHOTOS:
+            raise _bad_request(
+                f"Cannot exceed {MAX_PHOTOS} photos total (you already have {self.existing_count})"
+            )
+
+        self._part = _Part(filename, self.storage.staging_path())
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        part = self._part
+        if part is None:
+            return
+        part.size += end - start
+        if part.size > MAX_FILE_SIZE:
+            raise _bad_request(
+                f"File '{part.original_name}' exceeds {MAX_FILE_SIZE // (1024*1024)}MB limit"
+            )
+        if len(part.head) < SNIFF_BYTES:
+            part.head += data[start:min(end, start + SNIFF_BYTES - len(part.head))]
+            if len(part.head) == SNIFF_BYTES:
+                self._sniff(part)
+        chunk = data[start:end]
+        part.file.write(chunk)
+        part.hasher.update(chunk)
+
+    def _on_part_end(self) -> None:
+        part = self._part
+        if part is None:
+            return
+        ext = self._sniff(part)
+        part.file.close()
+        content_hash = part.hasher.hexdigest()
+        key = photo_store.blob_key(content_hash, ext)
+        with open(part.temp_path, "rb") as f:
+            placeholder = images.make_placeholder(f)
+        self.saved.append(StoredPhoto(content_hash, key, placeholder, part.temp_path))
+        self._part = None
+
+    def _sniff(self, part: _Part) -> str:
+        ext = sniff_image_type(part.head)
+        if ext is None:
+            raise _bad_request(f"File '{part.original_name}' is not a supported image")
+        return ext
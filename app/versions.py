@@ -0,0 +1,206 @@
+"""
+Version counters for conditional GETs.
+
+Polled endpoints (GET /auth/me, /swipes, /swipes/matches, /swipes/likes-received,
+/matchmaker) send a weak ETag built from a version counter and answer a
+matching If-None-Match with 304 from memory once the caller is looked up (see
+app.dependencies.conditional_get).
+
+Every committed ORM write bumps the versions of what it touched: a user's
+profile (their row or photos), swipe history or matches, or an agent's
+matchmaker queue. Lists also show other users' profiles, so serving one
+registers it as a watcher of those profiles; a profile change then bumps its
+watchers as well.
+
+Counters live in process memory, like the read-your-writes window in
+app.replicas. ETags carry a per-process epoch, so a restarted or different
+process never answers 304 for them. But a write is only seen by the process
+that committed it: writes from other workers or hosts, the agent engine and
+matchmaker queue workers (python -m app.agent_engine / app.matchmaker_queue),
+generate_data.py and similarity backfills all leave these counters alone, and
+polls would keep getting 304 for data that has changed. Conditional GETs are
+therefore off unless CONDITIONAL_GET_ENABLED=1, which is only safe when this
+one process makes every write. Core statements on the request path
+(app.matchmaker_queue) name what they change with ``touch``.
+"""
+import os
+import threading
+import time
+import uuid
+import zlib
+from itertools import chain
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import models
+
+CONDITIONAL_GET_ENABLED = os.getenv("CONDITIONAL_GET_ENABLED", "0").lower() in ("1", "true", "yes")
+# Watcher registrations kept before the tracker starts over (a new epoch).
+CONDITIONAL_GET_MAX_WATCHES = int(os.getenv("CONDITIONAL_GET_MAX_WATCHES", "1000000"))
+
+PROFILE = "profile"        # keyed by user id
+SWIPES = "swipes"          # keyed by the swiper's user id
+MATCHES = "matches"        # keyed by user id, either side of the match
+MATCHMAKER = "matchmaker"  # keyed by agent id
+LIKES = "likes"            # unanswered likes received, keyed by the liked user's id
+
+Key = tuple[str, int]
+
+
+class NotModified(Exception):
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+class Snapshot(NamedTuple):
+    key: Key
+    etag: str
+    since: int  # sequence number taken before the response's data was read
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as If-None-Match uses."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+class VersionTracker:
+    """A key's version is the value of a process-wide sequence when it last changed."""
+
+    def __init__(self, enabled: bool = True, max_watches: int = 1_000_000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.enabled = enabled
+        self.max_watches = max_watches
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget all versions and start a new epoch, invalidating every ETag."""
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._versions: dict[Key, tuple[int, float]] = {}  # key -> (sequence, monotonic time)
+        self._watchers: dict[int, set[Key]] = {}  # user id -> lists showing their profile
+        self._watches = 0
+        self._agents: dict[int, int] = {}  # user id -> agent id
+
+    def version(self, key: Key) -> int:
+        return self._versions.get(key, (0, 0.0))[0]
+
+    def sequence(self) -> int:
+        """Pass to ``snapshot`` as ``since`` when the key is only known after reading."""
+        return self._seq
+
+    def snapshot(self, key: Key, variant: str = "", since: Optional[int] = None) -> Snapshot:
+        """``variant`` names one of several representations of the same data."""
+        since = self._seq if since is None else since
+        tag = f"{self.epoch}.{key[0]}.{key[1]}.{self.version(key)}"
+        if variant:
+            tag += f".{zlib.crc32(variant.encode()):08x}"
+        return Snapshot(key, f'W/"{tag}"', since)
+
+    def bump(self, keys: Iterable[Key]) -> None:
+        with self._lock:
+            self._seq += 1
+            stamp = (self._seq, self._clock())
+            for key in keys:
+                self._versions[key] = stamp
+                if key[0] == PROFILE:
+                    for watcher in self._watchers.pop(key[1], ()):
+                        self._versions[watcher] = stamp
+
+    def watch(self, snapshot: Snapshot, members: Iterable[int], stale_window: float = 0.0) -> bool:
+        """Bump ``snapshot.key`` when any of the ``members`` profiles changes.
+
+        False when the snapshot's ETag can't be trusted for the data just
+        read: a member changed after the snapshot was taken, the tracker
+        started over, or (with ``stale_window``, for replica reads) something
+        changed too recently for the replica to be sure to have it.
+        """
+        with self._lock:
+            if not snapshot.etag.startswith(f'W/"{self.epoch}.'):
+                return False
+            if self._watches >= self.max_watches:
+                self.reset()
+                return False
+            now = self._clock()
+
+            def too_recent(key: Key) -> bool:
+                seq, at = self._versions.get(key, (0, 0.0))
+                return seq > snapshot.since or bool(stale_window and seq and now - at < stale_window)
+
+            valid = not too_recent(snapshot.key)
+            for user_id in members:
+                if too_recent((PROFILE, user_id)):
+                    valid = False
+                watchers = self._watchers.setdefault(user_id, set())
+                if snapshot.key not in watchers:
+                    watchers.add(snapshot.key)
+                    self._watches += 1
+            return valid
+
+    def agent_for(self, user_id: int) -> Optional[int]:
+        return self._agents.get(user_id)
+
+    def remember_agent(self, user_id: int, agent_id: int) -> None:
+        self._agents[user_id] = agent_id
+
+
+tracker = VersionTracker(enabled=CONDITIONAL_GET_ENABLED, max_watches=CONDITIONAL_GET_MAX_WATCHES)
+
+
+def response_headers(snapshot: Optional[Snapshot], members: Iterable[int] = (),
+                     stale_window: float = 0.0) -> dict[str, str]:
+    """Headers for a full response built after ``snapshot`` was taken."""
+    if snapshot is None:
+        return {}
+    headers = {"Cache-Control": "private, no-cache"}
+    if tracker.watch(snapshot, members, stale_window):
+        headers["ETag"] = snapshot.etag
+    return headers
+
+
+def touch(session: Session, keys: Iterable[Key]) -> None:
+    """Bump ``keys`` when ``session`` commits, for writes the ORM doesn't see."""
+    session.info.setdefault("versions", set()).update(keys)
+
+
+def _touched(obj) -> Iterable[Key]:
+    if isinstance(obj, models.User):
+        return [(PROFILE, obj.id)]
+    if isinstance(obj, models.UserPhoto):
+        return [(PROFILE, obj.user_id)]
+    if isinstance(obj, models.Swipe):
+        # A swipe is a like for its target, or an answer to the target's like.
+        return [(SWIPES, obj.user_id), (LIKES, obj.target_user_id), (LIKES, obj.user_id)]
+    if isinstance(obj, models.Match):
+        return [(MATCHES, obj.user1_id), (MATCHES, obj.user2_id)]
+    if isinstance(obj, models.Matchmaker):
+        return [(MATCHMAKER, obj.agent_id)]
+    if isinstance(obj, models.Agent):
+        return [(MATCHMAKER, obj.id)]
+    return []
+
+
+@event.listens_for(Session, "after_flush")
+def _collect(session: Session, flush_context) -> None:
+    # new/dirty/deleted still hold the pre-flush state here, with ids assigned.
+    keys = session.info.setdefault("versions", set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        keys.update(_touched(obj))
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed(session: Session) -> None:
+    keys = session.info.pop("versions", None)
+    if keys:
+        tracker.bump(keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session: Session) -> None:
+    session.info.pop("versions", None)
@@ -0,0 +1,226 @@
+"""
+HTTP load test: realistic user sessions against a local uvicorn instance.
+
+Each virtual user logs in as a generated account (see generate_data.py),
+loads the candidate stack, swipes through a burst of cards, polls matches
+and history, and occasionally uploads and removes a photo. Results are
+reported per endpoint as throughput and p50/p95/p99 latency.
+
+Run:
+  python generate_data.py --users 20000
+  python -m bench.loadtest --duration 60 --concurrency 50 --output run.json
+  python -m bench.loadtest --baseline run.json      # flag regressions
+
+Pass --base-url to target a server that is already running; otherwise one is
+started with rate limiting disabled and stopped afterwards.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Optional
+
+import httpx
+
+from bench.report import compare, format_table, load_json, save_json, summarize_latencies
+from generate_data import LOADTEST_PASSWORD, placeholder_png
+
+# North-star SLOs (docs/architecture_north_star.md): the stack loads in under
+# 300 ms. Swipe throughput is reported against --swipe-qps-target.
+STACK_ENDPOINT = "POST /candidates/search"
+SWIPE_ENDPOINT = "POST /swipes/{id}"
+STACK_P99_SLO_MS = 300.0
+
+LOCATIONS = ["Sydney, NSW", "Melbourne, VIC", "Brisbane, QLD", "Perth, WA", "Adelaide, SA"]
+TAGS = ["hiking", "coffee", "travel", "music", "art", "yoga", "cooking", "running"]
+
+PHOTO = placeholder_png(64, (180, 120, 90))
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def record(self, label: str, seconds: float, ok: bool) -> None:
+        self.samples[label].append(seconds)
+        if not ok:
+            self.errors[label] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        return {
+            label: summarize_latencies(self.samples[label], self.errors[label], elapsed)
+            for label in sorted(self.samples)
+        }
+
+
+async def timed(
+    client: httpx.AsyncClient, recorder: Recorder, label: str, method: str, url: str,
+    expected: tuple[int, ...] = (200,), **kwargs,
+) -> Optional[httpx.Response]:
+    start = time.perf_counter()
+    try:
+        resp = await client.request(method, url, **kwargs)
+    except httpx.HTTPError:
+        recorder.record(label, time.perf_counter() - start, ok=False)
+        return None
+    ok = resp.status_code in expected
+    recorder.record(label, time.perf_counter() - start, ok=ok)
+    return resp if ok else None
+
+
+def stack_filters(rng: random.Random) -> dict:
+    low = rng.randint(20, 45)
+    return {
+        "gender": rng.choice(["female", "male"]),
+        "min_age": low,
+        "max_age": low + rng.randint(3, 8),
+        "location": rng.choice(LOCATIONS),
+        "tags": [rng.choice(TAGS)],
+    }
+
+
+async def session(client, recorder, rng, user_id, deadline, args) -> None:
+    resp = await timed(client, recorder, "POST /auth/login", "POST", "/auth/login", json={
+        "email": f"user{user_id}@loadtest.example", "password": LOADTEST_PASSWORD,
+    })
+    if resp is None:
+        return
+    headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+    await timed(client, recorder, "GET /auth/me", "GET", "/auth/me", headers=headers)
+
+    for _ in range(args.rounds):
+        if time.monotonic() >= deadline:
+            return
+        resp = await timed(client, recorder, STACK_ENDPOINT, "POST", "/candidates/search",
+                           json=stack_filters(rng), headers=headers)
+        cards = resp.json()[:args.burst] if resp is not None else []
+        for card in cards:
+            direction = "right" if rng.random() < args.right_ratio else "left"
+            # 409 means a concurrent session already swiped this card: expected, not an error.
+            await timed(client, recorder, SWIPE_ENDPOINT, "POST", f"/swipes/{card['id']}",
+                        expected=(201, 409), json={"direction": direction}, headers=headers)
+
+        await timed(client, recorder, "GET /swipes/matches", "GET", "/swipes/matches", headers=headers)
+        if rng.random() < 0.25:
+            await timed(client, recorder, "GET /swipes", "GET", "/swipes", headers=headers)
+        if rng.random() < args.upload_ratio:
+            await upload_cycle(client, recorder, headers)
+
+
+async def upload_cycle(client, recorder, headers) -> None:
+    resp = await timed(client, recorder, "POST /users/me/photos", "POST", "/users/me/photos",
+                       expected=(201,), headers=headers,
+                       files=[("files", ("loadtest.png", PHOTO, "image/png"))])
+    if resp is None or not resp.json()["photos"]:
+        return
+    newest = max(resp.json()["photos"], key=lambda p: p["id"])
+    await timed(client, recorder, "DELETE /users/me/photos/{id}", "DELETE",
+                f"/users/me/photos/{newest['id']}", headers=headers)
+
+
+async def virtual_user(index, client, recorder, deadline, args) -> None:
+    rng = random.Random(args.seed + index)
+    while time.monotonic() < deadline:
+        user_id = rng.randint(1, args.user_pool)
+        await session(client, recorder, rng, user_id, deadline, args)
+
+
+async def run(args) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30.0) as client:
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            virtual_user(i, client, recorder, deadline, args) for i in range(args.concurrency)
+        ))
+        elapsed = time.monotonic() - started
+    return recorder.summary(elapsed)
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    env = {**os.environ, "RATE_LIMIT_ENABLED": "0"}
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(cmd, env=env)
+
+
+def wait_for_health(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Server at {base_url} did not become healthy within {timeout:.0f}s")
+
+
+def check_slos(summary: dict, swipe_qps_target: Optional[float], max_error_rate: float) -> list[str]:
+    failures = []
+    for label, stats in summary.items():
+        if stats["count"] and stats["errors"] / stats["count"] > max_error_rate:
+            failures.append(f"{label} error rate {stats['errors'] / stats['count']:.1%}")
+    stack = summary.get(STACK_ENDPOINT)
+    if stack and stack["p99_ms"] > STACK_P99_SLO_MS:
+        failures.append(f"{STACK_ENDPOINT} p99 {stack['p99_ms']:.0f} ms > {STACK_P99_SLO_MS:.0f} ms SLO")
+    swipes = summary.get(SWIPE_ENDPOINT)
+    if swipe_qps_target and (not swipes or swipes["rps"] < swipe_qps_target):
+        achieved = swipes["rps"] if swipes else 0.0
+        failures.append(f"{SWIPE_ENDPOINT} {achieved:.0f} req/s < {swipe_qps_target:.0f} req/s target")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="existing server; default starts uvicorn locally")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when starting a server")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users")
+    parser.add_argument("--user-pool", type=int, default=10_000, help="generated user ids to log in as")
+    parser.add_argument("--rounds", type=int, default=5, help="stack loads per session")
+    parser.add_argument("--burst", type=int, default=10, help="swipes per stack")
+    parser.add_argument("--right-ratio", type=float, default=0.35)
+    parser.add_argument("--upload-ratio", type=float, default=0.05, help="share of rounds that upload a photo")
+    parser.add_argument("--swipe-qps-target", type=float, default=None)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the summary JSON here")
+    parser.add_argument("--baseline", help="compare against a previous --output")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative regression tolerance")
+    args = parser.parse_args()
+
+    server = None
+    if not args.base_url:
+        args.base_url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args.port, args.workers)
+    try:
+        wait_for_health(args.base_url)
+        summary = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(format_table(summary, ["count", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms"]))
+    if args.output:
+        save_json(args.output, summary)
+
+    problems = check_slos(summary, args.swipe_qps_target, args.max_error_rate)
+    if args.baseline:
+        problems += compare(summary, load_json(args.baseline), threshold=args.threshold)
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Microbenchmarks: per-call CPU of the building blocks of a request.
+
+Seeds an in-memory SQLite database with --users profiles (photos, agents and
+--swipes swipes each, from generate_data.py's vocabularies) and times:
+
+  auth.create_access_token      signing a login's JWT
+  auth.decode_token             verifying one, as every authenticated request does
+  search.build                  search_candidates' query for a typical filter set (gender,
+                                ages, tags, q, likes_first with 100 likers)
+  search.compile                that query compiled to SQL, as on a statement cache miss
+  search.endpoint               the whole search_candidates body: queries, cards and the JSON body
+  serialize.profiles.pydantic   --page profiles through ProfileResponse: validate, dump_json
+                                (what FastAPI's response_model path costs)
+  serialize.profiles.rows       the same payload through orjson (app.serialization, what we send)
+  serialize.matches.pydantic    --page matches through MatchResponse
+  serialize.matches.rows        the same through orjson
+  swipe.transaction             swipe_user on a new session: load the user, insert the swipe,
+                                check for a match, queue the matchmaker, commit
+
+Each benchmark is warmed up, then run in batches of enough calls to take
+--min-time seconds; --samples batches give the per-call median, mean,
+spread and a 95% confidence interval of the median (bench.report). The raw
+samples are saved with --output, so a later --baseline run can test whether
+a change is real (Mann-Whitney U, p < --alpha) as well as big enough
+(--threshold). Only significant, large slowdowns count as regressions.
+
+SQLite in memory keeps I/O out of it: this measures Python and driver CPU,
+not the database. Compare runs from the same machine and Python.
+
+Run:
+  python -m bench.micro
+  python -m bench.micro --only serialize --samples 30
+  python -m bench.micro --output micro.json
+  python -m bench.micro --baseline micro.json   # flag regressions
+"""
+
+import argparse
+import gc
+import itertools
+import logging
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Callable
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from starlette.requests import Request
+
+from app import auth, metrics, models, profiles, schemas, serialization, storage
+from app.database import Base
+from app.routers import candidates, swipes
+from app.sharding import ShardRouter, SwipeStore
+from app.storage import LocalStorage
+from bench.report import compare, format_table, load_json, mann_whitney_p, save_json, summarize_timings
+from generate_data import BIO_CLOSERS, BIO_NOUNS, BIO_OPENERS, EPOCH, LOCATIONS, TAGS
+
+VIEWER = 1
+LIKERS = 100  # unanswered likes for the viewer, as search's likes_first reads them
+SEARCH = schemas.CandidateSearchRequest(
+    gender=models.GenderEnum.female, min_age=25, max_age=35, tags=["hiking", "coffee"], q="surfer",
+    likes_first=True,
+)
+STAT_COLUMNS = ["median_us", "ci_low_us", "ci_high_us", "stdev_us", "min_us", "loops"]
+
+
+def seed(db: Session, users: int, swipes_per_user: int, photos: int, matches: int,
+         rng: random.Random) -> set[tuple[int, int]]:
+    """Users 1..``users``, and ``matches`` for the viewer; returns the (swiper, target) pairs taken."""
+    db.execute(insert(models.User), [{
+        "id": i, "email": f"u{i}@bench.example", "password_hash": "x", "name": f"User {i}",
+        "gender": rng.choice(list(models.GenderEnum)), "age": rng.randint(18, 60),
+        "location": rng.choice(LOCATIONS), "tags": ",".join(rng.sample(TAGS, rng.randint(2, 5))),
+        "bio": f"{rng.choice(BIO_OPENERS)} {rng.choice(BIO_NOUNS)}. {rng.choice(BIO_CLOSERS)}",
+        "education": rng.choice(list(models.EducationEnum)), "industry": rng.choice(list(models.IndustryEnum)),
+        "income_range": rng.choice(list(models.IncomeRangeEnum)), "created_at": EPOCH,
+    } for i in range(1, users + 1)])
+    db.execute(insert(models.Agent), [{"user_id": i, "name": f"User {i}'s Agent"} for i in range(1, users + 1)])
+    db.execute(insert(models.UserPhoto), [{
+        "user_id": i, "filename": f"ab/cd/{i:060x}{k:04x}.jpg", "display_order": k,
+        "placeholder": "LEHV6nWB2yk8pyo0adR*.7kCMdnj", "created_at": EPOCH,
+        "variants": {v: f"ab/cd/{i:060x}{k:04x}_{v}.webp" for v in ("thumb", "card", "full")},
+    } for i in range(1, users + 1) for k in range(photos)])
+
+    likers = range(VIEWER + 1, min(VIEWER + 1 + LIKERS, users + 1))
+    taken = {(liker, VIEWER) for liker in likers}
+    for user in range(1, users + 1):
+        for target in rng.sample(range(1, users + 1), min(swipes_per_user + 1, users)):
+            # The viewer leaves their likers unanswered.
+            if target != user and not (user == VIEWER and target in likers):
+                taken.add((user, target))
+    db.execute(insert(models.Swipe), [{
+        "user_id": user, "target_user_id": target,
+        "direction": models.SwipeDirectionEnum.right if target == VIEWER or rng.random() < 0.5
+        else models.SwipeDirectionEnum.left,
+        "swiped_at": EPOCH + timedelta(seconds=n),
+    } for n, (user, target) in enumerate(sorted(taken))])
+    matched = range(likers.stop, min(likers.stop + matches, users + 1))
+    if matched:
+        db.execute(insert(models.Match), [{
+            "user1_id": VIEWER, "user2_id": target, "matched_at": EPOCH + timedelta(seconds=target),
+        } for target in matched])
+    db.commit()
+    return taken
+
+
+def fresh_pairs(users: int, taken: set[tuple[int, int]], rng: random.Random):
+    """Endless (swiper, target) pairs not swiped yet. The viewer's matches are left alone."""
+    while True:
+        user, target = rng.randint(VIEWER + 1, users), rng.randint(VIEWER + 1, users)
+        if user != target and (user, target) not in taken:
+            taken.add((user, target))
+            yield user, target
+
+
+def request() -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/candidates/search", "headers": []})
+
+
+def benchmarks(ctx: SimpleNamespace) -> dict[str, Callable[[], Callable[[], object]]]:
+    """Name -> setup, which returns the zero-argument call to time."""
+
+    def create_token():
+        return lambda: auth.create_access_token(VIEWER)
+
+    def decode_token():
+        token = auth.create_access_token(VIEWER)
+        return lambda: auth.decode_token(token)
+
+    def search_build():
+        already_swiped = SwipeStore(ctx.db, ShardRouter([])).swiped_target_ids(VIEWER)
+        liked = list(range(VIEWER + 1, VIEWER + 1 + LIKERS))
+        return lambda: candidates.search_query(SEARCH, VIEWER, already_swiped, "sqlite", liked)
+
+    def search_compile():
+        stmt = search_build()()
+        dialect = ctx.engine.dialect
+        return lambda: stmt.compile(dialect=dialect)
+
+    def search_endpoint():
+        store = SwipeStore(ctx.db, ShardRouter([]))
+        viewer = ctx.db.get(models.User, VIEWER)
+
+        def call():
+            ctx.db.expunge_all()
+            return candidates.search_candidates(request(), SEARCH, None, ctx.db, store, viewer)
+        return call
+
+    def profile_payloads():
+        ids = range(VIEWER + 1, min(VIEWER + 1 + ctx.page, ctx.users + 1))
+        by_id = profiles.cards_by_id(ctx.db, ids)
+        return serialization.profiles(by_id[i] for i in ids)
+
+    def match_payloads():
+        rows = ctx.db.execute(
+            select(*serialization.MATCH_COLUMNS).where(models.Match.user1_id == VIEWER).limit(ctx.page)
+        ).all()
+        users = serialization.profiles_by_id(ctx.db, (uid for row in rows for uid in (row.user1_id, row.user2_id)))
+        return serialization.matches(rows, users)
+
+    def pydantic(payloads, model):
+        adapter = serialization.adapter(list[model])
+        return lambda: adapter.dump_json(adapter.validate_python(payloads))
+
+    def rows(payloads):
+        return lambda: serialization.dumps(payloads)
+
+    def swipe_transaction():
+        pairs = fresh_pairs(ctx.users, ctx.taken, random.Random(ctx.seed))
+        directions = itertools.cycle(models.SwipeDirectionEnum)
+
+        def call():
+            user_id, target = next(pairs)
+            with Session(ctx.engine) as db:
+                store = SwipeStore(db, ShardRouter([]))
+                current_user = db.get(models.User, user_id)
+                swipes.swipe_user(schemas.SwipeRequest(direction=next(directions)), target, db, store, current_user)
+        return call
+
+    return {
+        "auth.create_access_token": create_token,
+        "auth.decode_token": decode_token,
+        "search.build": search_build,
+        "search.compile": search_compile,
+        "search.endpoint": search_endpoint,
+        "serialize.profiles.pydantic": lambda: pydantic(profile_payloads(), schemas.ProfileResponse),
+        "serialize.profiles.rows": lambda: rows(profile_payloads()),
+        "serialize.matches.pydantic": lambda: pydantic(match_payloads(), schemas.MatchResponse),
+        "serialize.matches.rows": lambda: rows(match_payloads()),
+        "swipe.transaction": swipe_transaction,
+    }
+
+
+def _time(call: Callable[[], object], loops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(loops):
+        call()
+    return time.perf_counter() - started
+
+
+def measure(call: Callable[[], object], samples: int, min_time: float) -> dict:
+    """Per-call microseconds over ``samples`` batches, each running for at least ``min_time``."""
+    call()  # warm up: imports, statement and adapter caches
+    # Park what's alive now (the app, the seeded session) outside the collector, so the
+    # per-batch collections below only walk garbage from the benchmark itself.
+    gc.collect()
+    gc.freeze()
+    try:
+        for loops in (10 ** e * m for e in itertools.count() for m in (1, 2, 5)):
+            if _time(call, loops) >= min_time:
+                break
+        timings = []
+        for _ in range(samples):
+            gc.collect()  # start each batch with the same heap, so one batch doesn't pay for another's garbage
+            timings.append(_time(call, loops) / loops * 1e6)
+    finally:
+        gc.unfreeze()
+    stats = summarize_timings(timings)
+    result = {f"{key}_us": value for key, value in stats.items()}
+    result["loops"] = loops
+    result["samples_us"] = [round(t, 4) for t in timings]
+    return result
+
+
+def run(users: int, swipes_per_user: int, photos: int, page: int, samples: int, min_time: float,
+        seed_value: int, only: tuple[str, ...] = ()) -> dict:
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    storage._storage = LocalStorage(tempfile.gettempdir())
+    results = {}
+    with Session(engine) as db:
+        taken = seed(db, users, swipes_per_user, photos, page, random.Random(seed_value))
+        ctx = SimpleNamespace(engine=engine, db=db, users=users, page=page, taken=taken, seed=seed_value)
+        for name, setup in benchmarks(ctx).items():
+            if only and not any(part in name for part in only):
+                continue
+            results[name] = measure(setup(), samples, min_time)
+    engine.dispose()
+    return results
+
+
+def comparison(results: dict, baseline: dict) -> dict:
+    """Baseline and current medians, the change, and its p-value, per benchmark in both runs."""
+    rows = {}
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        rows[name] = {
+            "base_us": base["median_us"], "median_us": cur["median_us"],
+            "change_%": (cur["median_us"] / base["median_us"] - 1) * 100,
+            "p_value": mann_whitney_p(base.get("samples_us", []), cur["samples_us"]),
+        }
+    return rows
+
+
+def regressions(results: dict, baseline: dict, threshold: float, alpha: float, min_delta: float) -> list[str]:
+    significant = {name: row for name, row in comparison(results, baseline).items() if row["p_value"] < alpha}
+    return compare({name: results[name] for name in significant}, baseline, threshold=threshold,
+                   lower_is_better=("median_us",), higher_is_better=(), min_delta=min_delta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000, help="profiles in the database")
+    parser.add_argument("--swipes", type=int, default=20, help="swipes per user")
+    parser.add_argument("--photos", type=int, default=3, help="photos per profile")
+    parser.add_argument("--page", type=int, default=50, help="profiles or matches per serialized page")
+    parser.add_argument("--samples", type=int, default=20, help="timed batches per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per batch")
+    parser.add_argument("--only", action="append", default=[], help="run benchmarks whose name contains this")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--baseline", help="compare against a previous --output")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative regression tolerance")
+    parser.add_argument("--alpha", type=float, default=0.01, help="significance level for a regression")
+    parser.add_argument("--min-delta", type=float, default=0.5, help="ignore slowdowns under this many us")
+    args = parser.parse_args()
+
+    metrics.slow_query_log.setLevel(logging.ERROR)  # seeding is one slow query after another
+    print(f"Python {platform.python_version()} on {platform.machine()}, {args.users} users")
+    results = run(args.users, args.swipes, args.photos, args.page, args.samples, args.min_time, args.seed,
+                  tuple(args.only))
+    print(format_table(results, STAT_COLUMNS, label="benchmark"))
+    if args.output:
+        save_json(args.output, results)
+    problems = []
+    if args.baseline:
+        baseline = load_json(args.baseline)
+        print()
+        print(format_table(comparison(results, baseline), ["base_us", "median_us", "change_%", "p_value"],
+                           label="benchmark"))
+        problems = regressions(results, baseline, args.threshold, args.alpha, args.min_delta)
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
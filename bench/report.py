@@ -0,0 +1,144 @@
+import json
+import math
+from typing import Iterable, Mapping, Sequence
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Linear-interpolated percentile of an already sorted sequence (q in 0..100)."""
+    if not sorted_values:
+        return math.nan
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * q / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize_latencies(samples: Sequence[float], errors: int, elapsed: float) -> dict:
+    """Throughput and latency percentiles (ms) for one endpoint; ``samples`` in seconds."""
+    ordered = sorted(samples)
+    ms = [s * 1000 for s in ordered]
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "rps": len(ordered) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": ms[-1] if ms else math.nan,
+    }
+
+
+def summarize_timings(samples: Sequence[float]) -> dict:
+    """Centre and spread of repeated timings of one operation, in the samples' unit.
+
+    ``ci_low``/``ci_high`` bound the median with about 95% confidence, from the
+    order statistics, so they hold whatever the shape of the distribution.
+    """
+    ordered = sorted(samples)
+    n = len(ordered)
+    if not n:
+        return {"median": math.nan, "mean": math.nan, "stdev": math.nan, "min": math.nan,
+                "ci_low": math.nan, "ci_high": math.nan}
+    mean = sum(ordered) / n
+    half_width = 1.96 * math.sqrt(n) / 2
+    return {
+        "median": percentile(ordered, 50),
+        "mean": mean,
+        "stdev": math.sqrt(sum((x - mean) ** 2 for x in ordered) / (n - 1)) if n > 1 else 0.0,
+        "min": ordered[0],
+        # 1-based ranks n/2 - 0.98*sqrt(n) and 1 + n/2 + 0.98*sqrt(n), rounded outwards
+        "ci_low": ordered[max(0, math.floor(n / 2 - half_width) - 1)],
+        "ci_high": ordered[min(n - 1, math.ceil(1 + n / 2 + half_width) - 1)],
+    }
+
+
+def mann_whitney_p(a: Sequence[float], b: Sequence[float]) -> float:
+    """Two-sided p-value that ``a`` and ``b`` come from the same distribution.
+
+    Mann-Whitney U with the normal approximation and a tie correction; fine
+    from about 8 samples a side. Unlike a t-test it doesn't assume normal
+    timings, which are skewed by the odd GC pause or context switch.
+    """
+    n1, n2 = len(a), len(b)
+    if not n1 or not n2:
+        return math.nan
+    combined = sorted([(x, 0) for x in a] + [(x, 1) for x in b])
+    n = n1 + n2
+    rank_sum, ties, i = 0.0, 0.0, 0
+    while i < n:
+        j = i
+        while j < n and combined[j][0] == combined[i][0]:
+            j += 1
+        rank = (i + j + 1) / 2  # the mean of ranks i+1 .. j
+        rank_sum += rank * sum(1 for _, side in combined[i:j] if side == 0)
+        ties += (j - i) ** 3 - (j - i)
+        i = j
+    u = rank_sum - n1 * (n1 + 1) / 2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = max(0.0, abs(u - n1 * n2 / 2) - 0.5) / sigma
+    return math.erfc(z / math.sqrt(2))
+
+
+def compare(
+    current: Mapping[str, Mapping[str, float]],
+    baseline: Mapping[str, Mapping[str, float]],
+    threshold: float = 0.10,
+    lower_is_better: Iterable[str] = ("p50_ms", "p95_ms", "p99_ms"),
+    higher_is_better: Iterable[str] = ("rps",),
+    min_delta: float = 1.0,
+) -> list[str]:
+    """Human-readable regressions of ``current`` against ``baseline``.
+
+    A metric regresses when it is worse by more than ``threshold`` (relative)
+    and by more than ``min_delta`` (absolute), so sub-millisecond jitter on fast
+    endpoints is not reported.
+    """
+    regressions = []
+    for name, base in sorted(baseline.items()):
+        cur = current.get(name)
+        if cur is None:
+            continue
+        for metric in lower_is_better:
+            old, new = base.get(metric), cur.get(metric)
+            if _finite(old, new) and new - old > min_delta and new > old * (1 + threshold):
+                regressions.append(f"{name} {metric}: {old:.2f} -> {new:.2f} (+{_pct(new, old)})")
+        for metric in higher_is_better:
+            old, new = base.get(metric), cur.get(metric)
+            if _finite(old, new) and old - new > min_delta and new < old * (1 - threshold):
+                regressions.append(f"{name} {metric}: {old:.2f} -> {new:.2f} (-{_pct(old, new)})")
+    return regressions
+
+
+def _finite(*values) -> bool:
+    return all(isinstance(v, (int, float)) and math.isfinite(v) for v in values)
+
+
+def _pct(a: float, b: float) -> str:
+    return f"{(a / b - 1) * 100:.0f}%" if b else "inf%"
+
+
+def format_table(rows: Mapping[str, Mapping[str, float]], columns: Sequence[str], label: str = "endpoint") -> str:
+    width = max([len(label)] + [len(name) for name in rows])
+    lines = ["  ".join([f"{label:<{width}}"] + [f"{c:>10}" for c in columns])]
+    for name, stats in rows.items():
+        cells = []
+        for c in columns:
+            value = stats.get(c, math.nan)
+            cells.append(f"{value:>10.2f}" if isinstance(value, float) else f"{value:>10}")
+        lines.append("  ".join([f"{name:<{width}}"] + cells))
+    return "\n".join(lines)
+
+
+def load_json(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_json(path: str, data: dict) -> None:
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
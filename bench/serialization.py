@@ -0,0 +1,224 @@
+"""
+Serialization microbenchmark: per-item cost of swipe history responses.
+
+Seeds an in-memory SQLite database with one user's swipe history (each target
+with a few photos) and times these ways of turning it into a response body:
+
+  response_model  ORM load, from_attributes validation, jsonable dict, json.dumps
+                  (what FastAPI does for a route that returns ORM objects)
+  type_adapter    the same ORM load, then a prebuilt TypeAdapter's dump_json
+  rows            column rows and batched profiles into plain dicts, then orjson
+                  (app.serialization, what GET /swipes uses)
+  rows_sparse     rows with ?fields=id,thumbnail_url
+
+"encode" excludes the queries, "total" includes them. "bytes" and
+"gzip_bytes" are body sizes per item, before and after compression.
+
+Then, with the ``msgpack`` package installed, the wire formats for the
+history and for a match list (the user's own profile in every match):
+
+  json            orjson, what clients get by default
+  msgpack         the same list as MessagePack
+  msgpack_dedup   MessagePack with each profile sent once (Accept: application/msgpack)
+
+"decode" is the client's side: parsing the body back into objects.
+
+Run:
+  python -m bench.serialization --items 500
+  python -m bench.serialization --output ser.json
+  python -m bench.serialization --baseline ser.json   # flag regressions
+"""
+
+import argparse
+import gzip
+import json
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.pool import StaticPool
+
+from app import models, schemas, serialization, storage
+from app.database import Base
+from app.sharding import SwipeStore, ShardRouter
+from app.serialization import msgpack
+from app.storage import LocalStorage
+from bench.report import compare, format_table, load_json, save_json
+
+HISTORY = list[schemas.SwipeResponse]
+SPARSE_FIELDS = serialization.parse_fields("id,thumbnail_url")
+
+
+def seed(db: Session, items: int, photos: int, rng: random.Random) -> int:
+    now = datetime(2026, 1, 1)
+    users = [{
+        "id": i, "email": f"u{i}@bench.example", "password_hash": "x", "name": f"User {i}",
+        "gender": rng.choice(list(models.GenderEnum)), "age": rng.randint(18, 60),
+        "location": "Sydney, NSW", "bio": "Weekend surfer. " * 4, "tags": "hiking,coffee,travel",
+        "education": models.EducationEnum.bachelor, "industry": models.IndustryEnum.technology,
+        "created_at": now,
+    } for i in range(1, items + 2)]
+    db.execute(insert(models.User), users)
+    db.execute(insert(models.UserPhoto), [{
+        "user_id": u["id"], "filename": f"ab/cd/{u['id']:060x}{k:04x}.jpg", "display_order": k,
+        "placeholder": "LEHV6nWB2yk8pyo0adR*.7kCMdnj", "created_at": now,
+        "variants": {v: f"ab/cd/{u['id']:060x}{k:04x}_{v}.webp" for v in ("thumb", "card", "full")},
+    } for u in users for k in range(photos)])
+    db.execute(insert(models.Swipe), [{
+        "user_id": 1, "target_user_id": target,
+        "direction": rng.choice(list(models.SwipeDirectionEnum)), "swiped_at": now + timedelta(seconds=target),
+    } for target in range(2, items + 2)])
+    db.execute(insert(models.Match), [{
+        "user1_id": 1, "user2_id": target, "matched_at": now + timedelta(seconds=target),
+    } for target in range(2, items + 2)])
+    db.commit()
+    return 1
+
+
+def load_orm(db: Session, user_id: int) -> list[models.Swipe]:
+    db.expunge_all()
+    return db.scalars(
+        select(models.Swipe)
+        .options(joinedload(models.Swipe.target_user).joinedload(models.User.photos))
+        .where(models.Swipe.user_id == user_id)
+        .order_by(models.Swipe.swiped_at.desc())
+    ).unique().all()
+
+
+def load_rows(db: Session, user_id: int, fields=None):
+    db.expunge_all()
+    rows = SwipeStore(db, ShardRouter([])).history_rows(user_id, serialization.SWIPE_COLUMNS)
+    return rows, serialization.profiles_by_id(db, (row.target_user_id for row in rows), fields)
+
+
+def load_rows_sparse(db: Session, user_id: int):
+    return load_rows(db, user_id, SPARSE_FIELDS)
+
+
+def encode_response_model(swipes) -> bytes:
+    adapter = serialization.adapter(HISTORY)
+    content = adapter.dump_python(adapter.validate_python(swipes, from_attributes=True), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def encode_type_adapter(swipes) -> bytes:
+    adapter = serialization.adapter(HISTORY)
+    return adapter.dump_json(adapter.validate_python(swipes, from_attributes=True))
+
+
+def encode_rows(loaded) -> bytes:
+    rows, targets = loaded
+    return serialization.dumps(serialization.swipes(rows, targets))
+
+
+STRATEGIES = {
+    "response_model": (load_orm, encode_response_model),
+    "type_adapter": (load_orm, encode_type_adapter),
+    "rows": (load_rows, encode_rows),
+    "rows_sparse": (load_rows_sparse, encode_rows),
+}
+
+
+def list_payloads(db: Session, user_id: int) -> dict[str, tuple[list[dict], tuple[str, ...]]]:
+    """The history and match list bodies, with their nested profile keys."""
+    rows, targets = load_rows(db, user_id)
+    match_rows = db.execute(select(*serialization.MATCH_COLUMNS).where(models.Match.user1_id == user_id)).all()
+    users = serialization.profiles_by_id(db, (uid for row in match_rows for uid in (row.user1_id, row.user2_id)))
+    return {
+        "history": (serialization.swipes(rows, targets), ("target_user",)),
+        "matches": (serialization.matches(match_rows, users), ("user1", "user2")),
+    }
+
+
+FORMATS = {
+    "json": (lambda items, keys: serialization.dumps(items), serialization.loads),
+    "msgpack": (lambda items, keys: serialization.packb(items), lambda body: msgpack.unpackb(body)),
+    "msgpack_dedup": (lambda items, keys: serialization.packb(serialization.dedupe(items, keys)),
+                      lambda body: msgpack.unpackb(body)),
+}
+
+
+def run_formats(db: Session, user_id: int, items: int, repeat: int) -> dict:
+    results = {}
+    for payload_name, (payload, keys) in list_payloads(db, user_id).items():
+        for name, (encode, decode) in FORMATS.items():
+            body = encode(payload, keys)
+            results[f"{payload_name}:{name}"] = {
+                "encode_us": per_item_us(lambda: encode(payload, keys), items, repeat),
+                "decode_us": per_item_us(lambda: decode(body), items, repeat),
+                "bytes": len(body) / items,
+                "gzip_bytes": len(gzip.compress(body, compresslevel=6)) / items,
+            }
+    return results
+
+
+def per_item_us(fn, items: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best / items * 1e6
+
+
+def run(items: int, photos: int, repeat: int, seed_value: int) -> dict:
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    storage._storage = LocalStorage(tempfile.gettempdir())
+    results = {}
+    with Session(engine) as db:
+        user_id = seed(db, items, photos, random.Random(seed_value))
+        expected = json.loads(encode_rows(load_rows(db, user_id)))
+        for name, (load, encode) in STRATEGIES.items():
+            loaded = load(db, user_id)
+            body = encode(loaded)
+            if load is not load_rows_sparse:
+                assert json.loads(body) == expected, f"{name} output differs"
+            results[name] = {
+                "encode_us": per_item_us(lambda: encode(loaded), items, repeat),
+                "total_us": per_item_us(lambda: encode(load(db, user_id)), items, repeat),
+                "bytes": len(body) / items,
+                "gzip_bytes": len(gzip.compress(body, compresslevel=6)) / items,
+            }
+        if msgpack is not None:
+            results.update(run_formats(db, user_id, items, repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=500, help="swipes in the history")
+    parser.add_argument("--photos", type=int, default=3, help="photos per profile")
+    parser.add_argument("--repeat", type=int, default=5, help="best of N")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--baseline", help="compare against a previous --output")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative regression tolerance")
+    args = parser.parse_args()
+
+    results = run(args.items, args.photos, args.repeat, args.seed)
+    print(format_table({k: v for k, v in results.items() if k in STRATEGIES},
+                       ["encode_us", "total_us", "bytes", "gzip_bytes"]))
+    formats = {k: v for k, v in results.items() if k not in STRATEGIES}
+    if formats:
+        print()
+        print(format_table(formats, ["encode_us", "decode_us", "bytes", "gzip_bytes"]))
+    else:
+        print("\nmsgpack is not installed; skipping the wire format comparison")
+    if args.output:
+        save_json(args.output, results)
+    problems = []
+    if args.baseline:
+        problems = compare(results, load_json(args.baseline), threshold=args.threshold,
+                           lower_is_better=("encode_us", "total_us", "decode_us"), higher_is_better=())
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
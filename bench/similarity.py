@@ -0,0 +1,123 @@
+"""
+Similar-profiles benchmark: app.similarity at a realistic population size.
+
+Makes --profiles synthetic profiles with generate_data.py's vocabularies,
+embeds them, builds the IVF index, and reports:
+
+  embed    microseconds to vectorize one profile (register / PATCH /users/me)
+  build    seconds to train and fill the index, and its size in memory
+  add      microseconds to move one profile into the index after a commit
+  query    top-K latency percentiles (ms), and recall@K against exact search
+
+Run:
+  python -m bench.similarity                      # a million profiles
+  python -m bench.similarity --profiles 100000 --nprobe 16
+  python -m bench.similarity --output sim.json
+  python -m bench.similarity --baseline sim.json  # flag regressions
+"""
+
+import argparse
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from app import models, similarity
+from bench.report import compare, format_table, load_json, save_json, summarize_latencies
+from generate_data import BIO_CLOSERS, BIO_NOUNS, BIO_OPENERS, LOCATIONS, TAGS
+
+
+def profiles(count: int, rng: random.Random):
+    for _ in range(count):
+        yield SimpleNamespace(
+            gender=rng.choice(list(models.GenderEnum)), age=min(60, max(18, int(rng.gauss(30, 6)))),
+            location=rng.choice(LOCATIONS), tags=",".join(rng.sample(TAGS, rng.randint(2, 5))),
+            bio=f"{rng.choice(BIO_OPENERS)} {rng.choice(BIO_NOUNS)}. {rng.choice(BIO_CLOSERS)}",
+            income_range=rng.choice(list(models.IncomeRangeEnum)),
+            education=rng.choice(list(models.EducationEnum)), industry=rng.choice(list(models.IndustryEnum)),
+        )
+
+
+def exact_kth(vectors: np.ndarray, queries: np.ndarray, k: int, chunk: int = 65536) -> np.ndarray:
+    """The k-th best exact score per query, scanning ``vectors`` in chunks."""
+    best = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    for start in range(0, len(vectors), chunk):
+        scores = np.hstack([best, queries @ vectors[start:start + chunk].astype(np.float32).T])
+        best = -np.sort(-scores, axis=1)[:, :k]
+    return best[:, -1]
+
+
+def run(count: int, k: int, nprobe: int, queries: int, recall_queries: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    results = {}
+
+    started = time.perf_counter()
+    vectors = np.empty((count, similarity.SIMILARITY_DIM), dtype=np.float16)
+    for i, profile in enumerate(profiles(count, rng)):
+        vectors[i] = similarity.embed(profile)
+    results["embed"] = {"us": (time.perf_counter() - started) / count * 1e6}
+
+    ids = np.arange(1, count + 1)
+    index = similarity.IVFIndex(nprobe=nprobe)
+    started = time.perf_counter()
+    index.build(ids, vectors)
+    seconds = time.perf_counter() - started
+    memory = sum(lst.ids.nbytes + lst.codes.nbytes + lst.scales.nbytes for lst in index.lists)
+    results["build"] = {"seconds": seconds, "lists": len(index.lists), "mb": memory / 2**20}
+
+    picks = [rng.randrange(count) for _ in range(queries)]
+    samples = []
+    for row in picks:
+        started = time.perf_counter()
+        index.search(vectors[row].astype(np.float32), k, exclude=(row + 1,))
+        samples.append(time.perf_counter() - started)
+    results["query"] = summarize_latencies(samples, 0, sum(samples))
+
+    # Generated profiles repeat, so neighbours tie; a hit counts if it scores as well as the exact k-th.
+    queried = vectors[picks[:recall_queries]].astype(np.float32)
+    kth = exact_kth(vectors, queried, k)
+    found = [sum(score >= floor - 1e-3 for _, score in index.search(query, k)) for query, floor in zip(queried, kth)]
+    results["query"]["recall"] = float(np.mean(found)) / k
+
+    fresh = [similarity.embed(profile) for profile in profiles(1000, rng)]
+    started = time.perf_counter()
+    for i, vector in enumerate(fresh):
+        index.add(count + 1 + i, vector)
+    results["add"] = {"us": (time.perf_counter() - started) / len(fresh) * 1e6}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=1_000_000)
+    parser.add_argument("--k", type=int, default=20, help="results per query")
+    parser.add_argument("--nprobe", type=int, default=similarity.SIMILARITY_NPROBE)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--recall-queries", type=int, default=100, help="queries checked against exact search")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--baseline", help="compare against a previous --output")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative regression tolerance")
+    args = parser.parse_args()
+
+    results = run(args.profiles, args.k, args.nprobe, args.queries, args.recall_queries, args.seed)
+    print(format_table({"query": results["query"]}, ["p50_ms", "p95_ms", "p99_ms", "max_ms", "recall"]))
+    print()
+    print(format_table({name: results[name] for name in ("embed", "build", "add")},
+                       ["us", "seconds", "lists", "mb"]))
+    if args.output:
+        save_json(args.output, results)
+    problems = []
+    if args.baseline:
+        problems = compare(results, load_json(args.baseline), threshold=args.threshold,
+                           lower_is_better=("p50_ms", "p99_ms", "us", "seconds"), higher_is_better=("recall",),
+                           min_delta=0.01)
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Generate a large synthetic population for load and scaling tests.
+
+Unlike seed_data.py this never touches the network: rows are generated in
+worker processes from a deterministic per-chunk seed and bulk-loaded with
+COPY (Postgres) or executemany (SQLite). Placeholder photos are rendered
+locally as a small palette of PNGs shared across users.
+
+Run:
+  python generate_data.py --users 1000000 --swipes 100000000 --workers 8
+
+Every generated user's password is LOADTEST_PASSWORD. Swipes go to the swipe
+shards when SWIPE_SHARD_URLS is set. The target database must be empty.
+"""
+
+import argparse
+import csv
+import io
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sqlalchemy import func, select  # noqa: E402
+
+from app import images, photo_store, sharding  # noqa: E402
+from app.auth import hash_password  # noqa: E402
+from app.database import get_engine  # noqa: E402
+from app.models import (  # noqa: E402
+    AgentStatusEnum, EducationEnum, GenderEnum, IncomeRangeEnum, IndustryEnum,
+    MatchmakerStatusEnum, SwipeDirectionEnum, User,
+)
+from app.schema import create_schema  # noqa: E402
+from app.storage import get_storage  # noqa: E402
+
+LOADTEST_PASSWORD = "loadtest123"
+EPOCH = datetime(2026, 1, 1)
+
+FIRST_NAMES = {
+    GenderEnum.female: ["Olivia", "Mia", "Chloe", "Zoe", "Ava", "Grace", "Isla", "Ruby", "Lily", "Emma"],
+    GenderEnum.male: ["Liam", "Noah", "Jack", "Oliver", "Leo", "Henry", "Lucas", "Finn", "Max", "Ethan"],
+    GenderEnum.other: ["Alex", "Sam", "Jordan", "Riley", "Charlie", "Taylor"],
+}
+LAST_NAMES = ["Smith", "Nguyen", "Chen", "Patel", "Brown", "Wilson", "Kim", "Rossi", "Martin", "Lee"]
+LOCATIONS = [
+    "Sydney, NSW", "Melbourne, VIC", "Brisbane, QLD", "Perth, WA", "Adelaide, SA",
+    "Canberra, ACT", "Hobart, TAS", "Gold Coast, QLD", "Newcastle, NSW", "Darwin, NT",
+]
+TAGS = [
+    "hiking", "coffee", "travel", "music", "art", "yoga", "cooking", "photography", "running",
+    "reading", "gaming", "tech", "wine", "beach", "dogs", "cats", "film", "dancing", "surfing",
+    "fitness", "food", "design", "science", "startups", "jazz", "pottery", "climbing", "cycling",
+]
+BIO_OPENERS = ["Weekend", "Lifelong", "Amateur", "Aspiring", "Part-time", "Self-taught"]
+BIO_NOUNS = ["chef", "surfer", "photographer", "bookworm", "runner", "traveller", "gardener"]
+BIO_CLOSERS = [
+    "Looking for someone to explore the city with.", "Coffee first, then adventures.",
+    "Ask me about my latest project.", "Big on dogs, bigger on brunch.",
+]
+
+GENDER_WEIGHTS = [(GenderEnum.female, 48), (GenderEnum.male, 48), (GenderEnum.other, 4)]
+AGENT_STATUS_WEIGHTS = [
+    (AgentStatusEnum.active, 30), (AgentStatusEnum.pending, 60), (AgentStatusEnum.inactive, 10),
+]
+
+USER_COLUMNS = (
+    "id", "email", "password_hash", "name", "gender", "age", "location", "bio", "tags",
+    "income_range", "education", "industry",
+)
+AGENT_COLUMNS = ("id", "user_id", "name", "status", "notes")
+PHOTO_COLUMNS = ("id", "user_id", "filename", "content_hash", "placeholder", "display_order")
+SWIPE_COLUMNS = ("user_id", "target_user_id", "direction", "swiped_at")
+MATCH_COLUMNS = ("user1_id", "user2_id", "matched_at")
+MATCHMAKER_COLUMNS = ("agent_id", "target_user_id", "status")
+
+
+@dataclass
+class Config:
+    users: int
+    swipes: int
+    right_ratio: float
+    reciprocal_rate: float
+    photo_ratio: float
+    photo_variants: int
+    chunk_size: int
+    seed: int
+    password_hash: str = ""
+    photos: list = field(default_factory=list)  # StoredPhoto per placeholder, set by write_placeholders
+
+
+@dataclass
+class Chunk:
+    users: list = field(default_factory=list)
+    agents: list = field(default_factory=list)
+    photos: list = field(default_factory=list)
+    swipes: list = field(default_factory=list)
+    matches: list = field(default_factory=list)
+    matchmakers: list = field(default_factory=list)
+
+
+def _weighted(rng: random.Random, weights):
+    values, w = zip(*weights)
+    return rng.choices(values, weights=w)[0]
+
+
+def _timestamp(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _user_photo(user_id: int, cfg: Config) -> photo_store.StoredPhoto:
+    return cfg.photos[user_id % len(cfg.photos)]
+
+
+def generate_chunk(args) -> Chunk:
+    """Rows for users ``[start, stop)``; depends only on the seed and the range."""
+    cfg, start, stop = args
+    rng = random.Random(cfg.seed * 1_000_003 + start)
+    out = Chunk()
+    n = cfg.users
+    # Each unordered pair {a, b} is owned by whichever of them sees the other
+    # less than half-way round the id circle, so a pair is generated once and
+    # reciprocal swipes never collide with independently generated ones.
+    half = (n - 1) // 2
+    mean = cfg.swipes / max(n, 1) / (1 + cfg.right_ratio * cfg.reciprocal_rate)
+
+    for user_id in range(start, stop):
+        gender = _weighted(rng, GENDER_WEIGHTS)
+        first = rng.choice(FIRST_NAMES[gender])
+        name = f"{first} {rng.choice(LAST_NAMES)}"
+        tags = rng.sample(TAGS, rng.randint(2, 5))
+        bio = f"{rng.choice(BIO_OPENERS)} {rng.choice(BIO_NOUNS)}. {rng.choice(BIO_CLOSERS)}"
+        out.users.append((
+            user_id, f"user{user_id}@loadtest.example", cfg.password_hash, name, gender.name,
+            min(60, max(18, int(rng.gauss(30, 6)))), rng.choice(LOCATIONS), bio, ",".join(tags),
+            rng.choice(list(IncomeRangeEnum)).name, rng.choice(list(EducationEnum)).name,
+            rng.choice(list(IndustryEnum)).name,
+        ))
+
+        status = _weighted(rng, AGENT_STATUS_WEIGHTS)
+        notes = None
+        if status == AgentStatusEnum.active:
+            low = rng.randint(20, 40)
+            wanted = GenderEnum.male if gender == GenderEnum.female else GenderEnum.female
+            notes = f"gender: {wanted.value}; age: {low}-{low + rng.randint(3, 12)}; tags: {','.join(tags[:2])}"
+        # Agents get the owner's id so matchmaker rows can be generated without lookups.
+        out.agents.append((user_id, user_id, f"{first}'s Agent", status.name, notes))
+
+        if cfg.photos and rng.random() < cfg.photo_ratio:
+            content_hash, key, placeholder = _user_photo(user_id, cfg)
+            out.photos.append((user_id, user_id, key, content_hash, placeholder, 0))
+
+        if half < 1:
+            continue
+        count = min(half, int(rng.expovariate(1 / mean)) if mean > 0 else 0)
+        for offset in rng.sample(range(1, half + 1), count):
+            target = (user_id - 1 + offset) % n + 1
+            swiped_at = EPOCH - timedelta(seconds=rng.randint(0, 90 * 86400))
+            right = rng.random() < cfg.right_ratio
+            direction = SwipeDirectionEnum.right if right else SwipeDirectionEnum.left
+            out.swipes.append((user_id, target, direction.name, _timestamp(swiped_at)))
+            if not right:
+                continue
+            out.matchmakers.append((user_id, target, MatchmakerStatusEnum.pending.name))
+            if rng.random() < cfg.reciprocal_rate:
+                back_at = swiped_at + timedelta(seconds=rng.randint(60, 7 * 86400))
+                out.swipes.append((target, user_id, SwipeDirectionEnum.right.name, _timestamp(back_at)))
+                out.matchmakers.append((target, user_id, MatchmakerStatusEnum.pending.name))
+                u1, u2 = sorted((user_id, target))
+                out.matches.append((u1, u2, _timestamp(back_at)))
+    return out
+
+
+def placeholder_png(size: int, rgb: tuple[int, int, int]) -> bytes:
+    """A vertical-gradient PNG built with zlib alone, no imaging library needed."""
+    rows = []
+    for y in range(size):
+        shade = 0.6 + 0.4 * y / max(size - 1, 1)
+        pixel = bytes(int(c * shade) for c in rgb)
+        rows.append(b"\x00" + pixel * size)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        body = tag + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(b"".join(rows), 6)) + chunk(b"IEND", b""))
+
+
+def write_placeholders(cfg: Config, size: int = 512) -> None:
+    rng = random.Random(cfg.seed)
+    for _ in range(cfg.photo_variants):
+        rgb = (rng.randint(60, 255), rng.randint(60, 255), rng.randint(60, 255))
+        png = placeholder_png(size, rgb)
+        stored = photo_store.put_bytes(get_storage(), png, "png")
+        cfg.photos.append(stored._replace(placeholder=images.make_placeholder(io.BytesIO(png))))
+
+
+class BulkWriter:
+    """Bulk loader on one raw DBAPI connection: COPY on Postgres, executemany elsewhere."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.conn = engine.raw_connection()
+        if self.dialect == "sqlite":
+            cur = self.conn.cursor()
+            cur.execute("PRAGMA synchronous=OFF")
+            cur.execute("PRAGMA journal_mode=WAL")
+
+    def write(self, table: str, columns, rows) -> None:
+        if not rows:
+            return
+        cur = self.conn.cursor()
+        cols = ", ".join(columns)
+        if self.dialect == "postgresql":
+            buf = io.StringIO()
+            csv.writer(buf).writerows(rows)
+            buf.seek(0)
+            cur.copy_expert(f"COPY {table} ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+        else:
+            mark = "?" if self.engine.dialect.paramstyle == "qmark" else "%s"
+            cur.executemany(f"INSERT INTO {table} ({cols}) VALUES ({', '.join([mark] * len(columns))})", rows)
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def reset_sequences(self, tables) -> None:
+        if self.dialect != "postgresql":
+            return
+        cur = self.conn.cursor()
+        for table in tables:
+            cur.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+            )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def generate(cfg: Config, workers: int) -> dict:
+    create_schema()
+    engine = get_engine()
+    with engine.connect() as conn:
+        if conn.scalar(select(func.count()).select_from(User)):
+            raise SystemExit("Database already has users; generate into an empty database.")
+
+    cfg.password_hash = hash_password(LOADTEST_PASSWORD)
+    if cfg.photo_ratio > 0:
+        write_placeholders(cfg)
+
+    primary = BulkWriter(engine)
+    shard_writers = [BulkWriter(e) for e in sharding.router.engines]
+    totals = dict.fromkeys(("users", "swipes", "matches", "matchmakers", "photos"), 0)
+    ranges = [
+        (cfg, start, min(start + cfg.chunk_size, cfg.users + 1))
+        for start in range(1, cfg.users + 1, cfg.chunk_size)
+    ]
+
+    try:
+        with multiprocessing.Pool(workers) as pool:
+            # imap keeps chunk order, so the load is identical for any worker count.
+            for chunk in pool.imap(generate_chunk, ranges):
+                primary.write("users", USER_COLUMNS, chunk.users)
+                primary.write("agents", AGENT_COLUMNS, chunk.agents)
+                primary.write("user_photos", PHOTO_COLUMNS, chunk.photos)
+                primary.write("matches", MATCH_COLUMNS, chunk.matches)
+                primary.write("matchmakers", MATCHMAKER_COLUMNS, chunk.matchmakers)
+                if shard_writers:
+                    by_shard: dict[int, list] = {}
+                    for row in chunk.swipes:
+                        by_shard.setdefault(sharding.router.shard_for_user(row[0]), []).append(row)
+                    for shard, rows in by_shard.items():
+                        shard_writers[shard].write("swipes", SWIPE_COLUMNS, rows)
+                        shard_writers[shard].commit()
+                else:
+                    primary.write("swipes", SWIPE_COLUMNS, chunk.swipes)
+                primary.commit()
+
+                totals["users"] += len(chunk.users)
+                totals["photos"] += len(chunk.photos)
+                totals["swipes"] += len(chunk.swipes)
+                totals["matches"] += len(chunk.matches)
+                totals["matchmakers"] += len(chunk.matchmakers)
+                print(f"  {totals['users']:>10,} users  {totals['swipes']:>12,} swipes", end="\r")
+        primary.reset_sequences(["users", "agents", "user_photos"])
+    finally:
+        primary.close()
+        for writer in shard_writers:
+            writer.close()
+    print()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--swipes", type=int, default=None, help="total swipes (default: 100 per user)")
+    parser.add_argument("--right-ratio", type=float, default=0.35, help="share of swipes that are right")
+    parser.add_argument("--reciprocal-rate", type=float, default=0.15,
+                        help="share of right swipes the target swipes right on in return")
+    parser.add_argument("--photo-ratio", type=float, default=0.9, help="share of users with a photo")
+    parser.add_argument("--photo-variants", type=int, default=64, help="distinct placeholder images")
+    parser.add_argument("--chunk-size", type=int, default=2_000, help="users per worker task")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    cfg = Config(
+        users=args.users,
+        swipes=args.swipes if args.swipes is not None else args.users * 100,
+        right_ratio=args.right_ratio,
+        reciprocal_rate=args.reciprocal_rate,
+        photo_ratio=args.photo_ratio,
+        photo_variants=max(1, args.photo_variants),
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+    )
+    started = time.perf_counter()
+    totals = generate(cfg, args.workers)
+    elapsed = time.perf_counter() - started
+    summary = ", ".join(f"{v:,} {k}" for k, v in totals.items())
+    print(f"Generated {summary} in {elapsed:.1f}s. Password for all: '{LOADTEST_PASSWORD}'")
+
+
+if __name__ == "__main__":
+    main()
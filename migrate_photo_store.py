@@ -0,0 +1,35 @@
+"""
+Move photos from the flat uploads/ directory into the content-addressed store.
+
+Usage:
+  python migrate_photo_store.py [--dry-run]
+
+Run migrate_schema.py first on a database that predates the store.
+Identical files collapse into a single blob under ab/cd/ in the configured
+storage backend, so with STORAGE_BACKEND=s3 this also uploads them to the
+bucket. Safe to run again after an interruption; photos already in the store
+are skipped. Run `python -m app.images` afterwards to render variants the old
+files lacked.
+"""
+import argparse
+
+from app.database import SessionLocal
+from app.photo_store import migrate_flat
+from app.storage import UPLOAD_DIR, get_storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--upload-dir", default=UPLOAD_DIR, help="where the flat files are")
+    parser.add_argument("--dry-run", action="store_true", help="report what would move")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        counts = migrate_flat(db, args.upload_dir, get_storage(), dry_run=args.dry_run)
+    verb = "Would migrate" if args.dry_run else "Migrated"
+    print(f"{verb} {counts['photos']} photos in {counts['files']} files "
+          f"({counts['deduplicated']} already stored, {counts['missing']} photos missing their file).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Bring a database created by an older version up to the current models.
+
+Usage:
+  python migrate_schema.py [--dry-run]
+
+create_all (python -m app.schema) adds missing tables but never changes
+existing ones. This adds what they lack, on the primary and on every
+SWIPE_SHARD_URLS shard:
+
+  user_photos   content_hash, variants, placeholder
+  matchmakers   queue columns (claim_token, leased_until, attempts,
+                available_at, last_error), uq_matchmaker_agent_target,
+                ix_matchmakers_status_id and ix_matchmakers_agent_*
+  swipes        ix_swipes_target_direction_swiped
+
+Before uq_matchmaker_agent_target goes in, duplicate (agent, target)
+matchmaker rows are deleted, keeping the oldest one an agent has worked on,
+else the oldest. Indexes the new ones replace (ix_swipes_target_user_id,
+ix_matchmakers_agent_id) are dropped. Anything already in place is skipped,
+so an interrupted run can simply be started again. Then run
+migrate_photo_store.py to fill in content hashes, and
+`python -m app.text_search` for the full-text index.
+"""
+import argparse
+
+from app.database import get_engine, get_swipe_shard_engines
+from app.schema import upgrade
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="list the changes without making them")
+    args = parser.parse_args()
+
+    steps = upgrade(get_engine(), get_swipe_shard_engines(), dry_run=args.dry_run)
+    for step in steps:
+        print(("would " if args.dry_run else "") + step)
+    print("Schema is up to date." if not steps else f"{len(steps)} changes{' pending' if args.dry_run else ''}.")
+
+
+if __name__ == "__main__":
+    main()
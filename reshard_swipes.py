@@ -0,0 +1,42 @@
+"""
+Move swipe rows between shard layouts.
+
+Usage:
+  python reshard_swipes.py --from sqlite:///./s0.db,sqlite:///./s1.db \\
+                           --to sqlite:///./s0.db,sqlite:///./s1.db,sqlite:///./s2.db
+
+Shards are assigned with jump consistent hashing, so appending one shard moves
+only about 1/N of the rows. Set SWIPE_SHARD_URLS to the --to list once done.
+"""
+import argparse
+
+from sqlalchemy import create_engine
+
+from app.database import connect_args_for
+from app.sharding import ShardRouter, rebalance
+
+
+def _router(urls: str) -> ShardRouter:
+    return ShardRouter([
+        create_engine(url, connect_args=connect_args_for(url))
+        for url in (u.strip() for u in urls.split(","))
+        if url
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from", dest="source", required=True, help="current SWIPE_SHARD_URLS")
+    parser.add_argument("--to", dest="target", required=True, help="new SWIPE_SHARD_URLS")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--dry-run", action="store_true", help="count rows that would move")
+    args = parser.parse_args()
+
+    moved = rebalance(_router(args.source), _router(args.target),
+                      batch_size=args.batch_size, dry_run=args.dry_run)
+    verb = "Would move" if args.dry_run else "Moved"
+    print(f"{verb} {moved} swipe rows.")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,6 @@ Run: python seed_data.py
 
 import sys
 import os
-import secrets
 import urllib.request
 
 sys.path.insert(0, os.path.dirname(__file__))
@@ -13,8 +12,8 @@ sys.path.insert(0, os.path.dirname(__file__))
 from app.database import SessionLocal, engine, Base
 from app.models import User, UserPhoto, Agent, GenderEnum, IncomeRangeEnum, EducationEnum, IndustryEnum, AgentStatusEnum
 from app.auth import hash_password
-
-UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
+from app import photo_store
+from app.storage import get_storage
 
 Base.metadata.create_all(bind=engine)
 
@@ -267,10 +266,7 @@ USERS = [
 
 
 def download_photo(user_id: int, gender: str):
-    """Download a fake-person portrait photo from randomuser.me."""
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    filename = f"user_{user_id}_{secrets.token_hex(4)}.jpg"
-    filepath = os.path.join(UPLOAD_DIR, filename)
+    """Download a fake-person portrait photo from randomuser.me into the photo store."""
     try:
         api_url = f"https://randomuser.me/api/?gender={gender}&nat=au"
         req = urllib.request.Request(api_url, headers={"User-Agent": "Mozilla/5.0"})
@@ -278,8 +274,8 @@ def download_photo(user_id: int, gender: str):
             import json
             data = json.loads(resp.read())
             photo_url = data["results"][0]["picture"]["large"]
-        urllib.request.urlretrieve(photo_url, filepath)
-        return filename
+        with urllib.request.urlopen(photo_url) as photo:
+            return photo_store.put_bytes(get_storage(), photo.read(), "jpg")
     except Exception as e:
         print(f"  Warning: could not download photo for user {user_id}: {e}")
         return None
@@ -304,11 +300,12 @@ def seed():
             ))
             # Download and attach a profile photo
             print(f"  Downloading photo for {data['name']}...")
-            filename = download_photo(user.id, data["gender"].value)
-            if filename:
+            stored = download_photo(user.id, data["gender"].value)
+            if stored:
                 db.add(UserPhoto(
                     user_id=user.id,
-                    filename=filename,
+                    filename=stored.filename,
+                    content_hash=stored.content_hash,
                     display_order=0,
                 ))
 
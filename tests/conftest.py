@@ -1,13 +1,21 @@
+import os
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
-from app.main import app
-from app.database import Base
-from app.dependencies import get_db
-from app import models
+# Tests use their own in-memory engine; don't connect to the default database.
+os.environ.setdefault("POOL_WARMUP_CONNECTIONS", "0")
+# That engine is one shared connection, so photo processing can't run on a
+# worker thread next to the request; do it inline.
+os.environ.setdefault("IMAGE_WORKERS", "0")
+
+from app.main import app  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.dependencies import get_db  # noqa: E402
+from app import auth, models, similarity, versions  # noqa: E402
 
 # StaticPool forces SQLAlchemy to reuse the same in-memory connection
 # so tables created by create_all are visible to all sessions.
@@ -23,10 +31,19 @@ TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engin
 def setup_database():
     """Create all tables before each test, drop after."""
     Base.metadata.create_all(bind=engine)
+    versions.tracker.reset()
+    if similarity.index is not None:
+        similarity.index.reset()
     yield
     Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture()
+def etags(monkeypatch):
+    """Turn on conditional GETs, which are off by default."""
+    monkeypatch.setattr(versions.tracker, "enabled", True)
+
+
 @pytest.fixture()
 def db():
     session = TestingSessionLocal()
@@ -83,3 +100,28 @@ def seed_candidate(db, name="Alice", gender="female", age=26,
     db.commit()
     db.refresh(c)
     return c
+
+
+_SEED_PASSWORD_HASH = None
+
+
+def seed_user(db, email="seed@test.com", name="Seed User", gender="female", age=26,
+              location="SF", bio="Hi", tags="hiking,coffee", **fields):
+    """Insert a user (and their Agent) directly, bypassing the rate-limited register route."""
+    global _SEED_PASSWORD_HASH
+    if _SEED_PASSWORD_HASH is None:
+        _SEED_PASSWORD_HASH = auth.hash_password("pass123")
+    user = models.User(
+        email=email, password_hash=_SEED_PASSWORD_HASH, name=name, gender=gender,
+        age=age, location=location, bio=bio, tags=tags, **fields,
+    )
+    db.add(user)
+    db.flush()
+    db.add(models.Agent(user_id=user.id, name=f"{name}'s Agent"))
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+def user_headers(user):
+    return auth_headers(auth.create_access_token(user.id))
@@ -0,0 +1,108 @@
+import pytest
+from sqlalchemy import event, func, select
+
+np = pytest.importorskip("numpy")
+
+from app import agent_engine, models  # noqa: E402
+from app.agent_engine import Preferences, parse_notes  # noqa: E402
+from app.sharding import ShardRouter  # noqa: E402
+from tests.conftest import engine, seed_user, user_headers  # noqa: E402
+
+UNSHARDED = ShardRouter([])
+
+
+def activate(db, user, notes=None):
+    user.agent.status = models.AgentStatusEnum.active
+    user.agent.notes = notes
+    db.commit()
+
+
+def right_swipes(db, user):
+    return set(db.scalars(select(models.Swipe.target_user_id).where(
+        models.Swipe.user_id == user.id, models.Swipe.direction == models.SwipeDirectionEnum.right)))
+
+
+class TestParseNotes:
+    def test_generated_format(self):
+        prefs = parse_notes("gender: male; age: 25-35; tags: Hiking, coffee")
+        assert prefs == Preferences(frozenset({models.GenderEnum.male}), 25, 35, ("hiking", "coffee"))
+
+    def test_lenient(self):
+        assert parse_notes(None) == Preferences()
+        assert parse_notes("likes long walks\nage: 30+\ngender: robot") == Preferences(min_age=30)
+        assert parse_notes("age: 28; location: Sydney") == Preferences(min_age=28, max_age=28, location="sydney")
+
+
+class TestAgentEngine:
+    def test_picks_follow_preferences(self, db):
+        me = seed_user(db, email="me@test.com", gender="female", age=30, tags="hiking,coffee")
+        best = seed_user(db, email="best@test.com", gender="male", age=31, tags="hiking,coffee,jazz")
+        ok = seed_user(db, email="ok@test.com", gender="male", age=33, tags="coffee")
+        seed_user(db, email="woman@test.com", gender="female", age=30, tags="hiking,coffee")
+        seed_user(db, email="old@test.com", gender="male", age=50, tags="hiking,coffee")
+        seed_user(db, email="poor@test.com", gender="male", age=40, location="Perth", tags="golf")
+        activate(db, me, "gender: male; age: 25-45")
+        seed_user(db, email="idle@test.com")  # pending agent: not run
+
+        stats = agent_engine.run(db, UNSHARDED, picks=5, min_score=0.3)
+        assert (stats["agents"], stats["swipes"]) == (1, 2)
+        assert right_swipes(db, me) == {best.id, ok.id}
+        queued = set(db.scalars(select(models.Matchmaker.target_user_id).where(
+            models.Matchmaker.agent_id == me.agent.id)))
+        assert queued == {best.id, ok.id}
+
+        scores = agent_engine.score_block(
+            agent_engine.Population(db.execute(select(*agent_engine.USER_COLUMNS).order_by(models.User.id)).all()),
+            np.array([0]), [parse_notes(me.agent.notes)],
+        )
+        assert scores[0, 1] > scores[0, 2]
+
+    def test_scores_only_candidate_buckets(self, db):
+        seed_user(db, email="me@test.com", gender="female", age=30, tags="hiking,coffee")
+        for i, (gender, age) in enumerate([("male", 26), ("male", 34), ("male", 50), ("female", 30), ("other", 30)]):
+            seed_user(db, email=f"u{i}@test.com", gender=gender, age=age, tags="coffee" if i % 2 else "hiking")
+        population = agent_engine.Population(
+            db.execute(select(*agent_engine.USER_COLUMNS).order_by(models.User.id)).all())
+        assert population.tags.dtype == np.uint8 and population.tags.shape == (6, 1)
+        assert population.tag_matrix(np.array([0])).tolist() == [[1.0, 1.0]]
+
+        prefs = [parse_notes("gender: male; age: 25-35")]
+        cols = population.candidates(prefs)
+        assert cols.tolist() == [1, 2]
+        assert population.candidates(prefs + [Preferences()]).tolist() == list(range(6))
+        everyone = agent_engine.score_block(population, np.array([0]), prefs)
+        assert np.array_equal(agent_engine.score_block(population, np.array([0]), prefs, cols), everyone[:, cols])
+        assert np.isinf(np.delete(everyone, cols, axis=1)).all()
+
+    def test_skips_seen_and_matches_mutual_likes(self, client, db, etags):
+        me = seed_user(db, email="me@test.com", gender="female")
+        seen = seed_user(db, email="seen@test.com", gender="male")
+        fan = seed_user(db, email="fan@test.com", gender="male")
+        client.post(f"/swipes/{seen.id}", json={"direction": "left"}, headers=user_headers(me))
+        client.post(f"/swipes/{me.id}", json={"direction": "right"}, headers=user_headers(fan))
+        activate(db, me, "gender: male")
+        etag = client.get("/swipes/matches", headers=user_headers(fan)).headers["etag"]
+
+        stats = agent_engine.run(db, UNSHARDED, picks=5, min_score=0.0)
+        assert stats["matches"] == 1
+        assert right_swipes(db, me) == {fan.id}
+        assert db.scalar(select(func.count()).select_from(models.Match)) == 1
+        resp = client.get("/swipes/matches", headers={**user_headers(fan), "If-None-Match": etag})
+        assert resp.status_code == 200
+
+        assert agent_engine.run(db, UNSHARDED, picks=5, min_score=0.0)["swipes"] == 0
+
+    def test_queries_per_block_not_per_agent(self, db):
+        users = [seed_user(db, email=f"u{i}@test.com", gender="female" if i % 2 else "male") for i in range(40)]
+        for user in users:
+            user.agent.status = models.AgentStatusEnum.active
+        db.commit()
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            stats = agent_engine.run(db, UNSHARDED, picks=3, min_score=0.0, block_size=20)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert stats["agents"] == 40 and stats["swipes"] == 120
+        assert len(statements) < 25
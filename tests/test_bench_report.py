@@ -0,0 +1,79 @@
+import math
+
+from bench import micro
+from bench.report import compare, mann_whitney_p, percentile, summarize_latencies, summarize_timings
+
+
+class TestPercentile:
+    def test_interpolates(self):
+        values = [10.0, 20.0, 30.0, 40.0]
+        assert percentile(values, 0) == 10.0
+        assert percentile(values, 50) == 25.0
+        assert percentile(values, 100) == 40.0
+
+    def test_empty_and_single(self):
+        assert math.isnan(percentile([], 50))
+        assert percentile([7.0], 99) == 7.0
+
+    def test_summary_in_milliseconds(self):
+        stats = summarize_latencies([0.001 * i for i in range(1, 101)], errors=2, elapsed=10.0)
+        assert stats["count"] == 100
+        assert stats["errors"] == 2
+        assert stats["rps"] == 10.0
+        assert round(stats["p50_ms"], 2) == 50.5
+        assert stats["max_ms"] == 100.0
+
+
+class TestCompare:
+    BASE = {"GET /x": {"p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 30.0, "rps": 100.0}}
+
+    def test_no_regression_within_threshold(self):
+        current = {"GET /x": {"p50_ms": 10.5, "p95_ms": 21.0, "p99_ms": 31.0, "rps": 95.0}}
+        assert compare(current, self.BASE) == []
+
+    def test_latency_and_throughput_regressions(self):
+        current = {"GET /x": {"p50_ms": 10.0, "p95_ms": 40.0, "p99_ms": 30.0, "rps": 50.0}}
+        regressions = compare(current, self.BASE)
+        assert len(regressions) == 2
+        assert any("p95_ms" in r for r in regressions)
+        assert any("rps" in r for r in regressions)
+
+    def test_small_absolute_changes_ignored(self):
+        base = {"GET /fast": {"p95_ms": 0.2}}
+        assert compare({"GET /fast": {"p95_ms": 0.9}}, base) == []
+
+    def test_missing_endpoint_ignored(self):
+        assert compare({}, self.BASE) == []
+
+
+class TestTimings:
+    def test_summary_and_median_interval(self):
+        stats = summarize_timings([float(i) for i in range(20, 0, -1)])
+        assert stats["median"] == 10.5 and stats["mean"] == 10.5 and stats["min"] == 1.0
+        assert stats["ci_low"] == 5.0 and stats["ci_high"] == 16.0
+        assert round(stats["stdev"], 3) == 5.916
+
+    def test_mann_whitney(self):
+        assert round(mann_whitney_p(range(1, 11), range(11, 21)), 5) == 0.00018
+        assert mann_whitney_p([1, 2, 3] * 4, [3, 2, 1] * 4) == 1.0
+        assert mann_whitney_p([5.0] * 8, [5.0] * 8) == 1.0
+        assert math.isnan(mann_whitney_p([], [1.0]))
+
+
+class TestMicro:
+    def test_runs_and_flags_significant_slowdowns(self):
+        results = micro.run(users=40, swipes_per_user=3, photos=1, page=5, samples=8, min_time=0.0005, seed_value=1)
+        assert set(results) == set(micro.benchmarks(None))
+        assert all(r["median_us"] > 0 and len(r["samples_us"]) == 8 for r in results.values())
+        assert micro.regressions(results, results, 0.1, 0.01, 0.0) == []
+
+        # Measured samples can hold an outlier that overlaps the halved ones; use steady ones.
+        results = {name: {**r, "samples_us": [r["median_us"] * (1 + i / 100) for i in range(8)]}
+                   for name, r in results.items()}
+        faster = {name: {**r, "median_us": r["median_us"] / 2, "samples_us": [t / 2 for t in r["samples_us"]]}
+                  for name, r in results.items()}
+        problems = micro.regressions(results, faster, 0.1, 0.01, 0.0)
+        assert len(problems) == len(results) and all("median_us" in p for p in problems)
+        # A big change with too few samples to tell from noise isn't reported.
+        few = {name: {**r, "samples_us": r["samples_us"][:2]} for name, r in faster.items()}
+        assert micro.regressions(results, few, 0.1, 0.01, 0.0) == []
@@ -0,0 +1,96 @@
+import asyncio
+import gzip
+
+from app import compression
+from app.compression import CompressionMiddleware, choose_encoding
+from tests.conftest import seed_user, user_headers
+
+
+def run(app, headers=(), method="GET"):
+    scope = {"type": "http", "method": method, "headers": [(k.encode(), v.encode()) for k, v in headers]}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start = sent[0]
+    body = b"".join(m.get("body", b"") for m in sent[1:])
+    return {k.decode(): v.decode() for k, v in start["headers"]}, body
+
+
+def responder(body, content_type="application/json", chunks=1, extra=()):
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode()),
+                   *extra]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        step = len(body) // chunks
+        for i in range(chunks):
+            part = body[i * step:] if i == chunks - 1 else body[i * step:(i + 1) * step]
+            await send({"type": "http.response.body", "body": part, "more_body": i < chunks - 1})
+    return app
+
+
+BODY = b'{"name":"Alice","bio":"Weekend surfer"},' * 200
+
+
+class TestChooseEncoding:
+    def test_negotiation(self, monkeypatch):
+        monkeypatch.setattr(compression, "brotli", None)
+        assert choose_encoding("gzip, deflate, br") == "gzip"
+        assert choose_encoding("br;q=1.0, gzip;q=0") is None
+        assert choose_encoding("*") == "gzip"
+        assert choose_encoding("") is None
+        assert choose_encoding("identity") is None
+
+    def test_prefers_brotli_when_available(self, monkeypatch):
+        monkeypatch.setattr(compression, "brotli", object())
+        assert choose_encoding("gzip, br") == "br"
+        assert choose_encoding("gzip, br;q=0") == "gzip"
+
+
+class TestCompressionMiddleware:
+    def test_compresses_large_json(self):
+        headers, body = run(CompressionMiddleware(responder(BODY)), [("accept-encoding", "gzip")])
+        assert headers["content-encoding"] == "gzip"
+        assert headers["content-length"] == str(len(body))
+        assert headers["vary"] == "Accept-Encoding"
+        assert gzip.decompress(body) == BODY
+        assert len(body) * 10 < len(BODY)
+
+    def test_leaves_small_streamed_binary_and_unaccepted_alone(self):
+        for sent, app, accept in [
+            (BODY[:100], responder(BODY[:100]), "gzip"),
+            (BODY, responder(BODY, chunks=3), "gzip"),
+            (BODY, responder(BODY, content_type="image/png"), "gzip"),
+            (BODY, responder(BODY, extra=[(b"content-encoding", b"br")]), "gzip"),
+            (BODY, responder(BODY), "identity"),
+        ]:
+            headers, body = run(CompressionMiddleware(app), [("accept-encoding", accept)])
+            assert headers.get("content-encoding") in (None, "br")
+            assert body == sent
+
+    def test_large_bodies_compress_in_threadpool(self, monkeypatch):
+        calls = []
+        real = compression.anyio.to_thread.run_sync
+
+        async def spy(fn, *args):
+            calls.append(fn)
+            return await real(fn, *args)
+
+        monkeypatch.setattr(compression.anyio.to_thread, "run_sync", spy)
+        run(CompressionMiddleware(responder(BODY), thread_size=len(BODY) + 1), [("accept-encoding", "gzip")])
+        assert calls == []
+        run(CompressionMiddleware(responder(BODY), thread_size=1024), [("accept-encoding", "gzip")])
+        assert calls == [compression.compress]
+
+    def test_api_responses_are_compressed(self, client, db):
+        me = seed_user(db, email="me@test.com")
+        for i in range(30):
+            seed_user(db, email=f"u{i}@test.com", bio="Lifelong runner and amateur chef. " * 3)
+        resp = client.post("/candidates/search", json={}, headers={**user_headers(me), "Accept-Encoding": "gzip"})
+        assert resp.headers["content-encoding"] == "gzip"
+        assert len(resp.json()) == 30
@@ -0,0 +1,164 @@
+import pytest
+from sqlalchemy import event, select
+
+from app import models, versions
+from app.versions import MATCHES, PROFILE, SWIPES, VersionTracker
+from tests.conftest import engine, seed_user, user_headers
+
+pytestmark = pytest.mark.usefixtures("etags")
+
+
+@pytest.fixture()
+def queries():
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def revalidate(client, url, headers, etag):
+    return client.get(url, headers={**headers, "If-None-Match": etag})
+
+
+class TestConditionalGet:
+    def test_me_304_only_looks_up_the_user(self, client, db, queries):
+        user = seed_user(db)
+        headers = user_headers(user)
+        resp = client.get("/auth/me", headers=headers)
+        etag = resp.headers["etag"]
+        assert etag.startswith('W/"')
+        assert resp.headers["cache-control"] == "private, no-cache"
+
+        queries.clear()
+        resp = revalidate(client, "/auth/me", headers, etag)
+        assert resp.status_code == 304
+        assert resp.headers["etag"] == etag
+        assert len(queries) == 1 and "FROM users" in queries[0]
+
+        client.patch("/users/me", json={"bio": "new"}, headers=headers)
+        resp = revalidate(client, "/auth/me", headers, etag)
+        assert resp.status_code == 200
+        assert resp.json()["bio"] == "new"
+        assert resp.headers["etag"] != etag
+
+    def test_history_tracks_swipes_and_target_profiles(self, client, db):
+        me = seed_user(db, email="me@test.com")
+        alice = seed_user(db, email="alice@test.com")
+        bob = seed_user(db, email="bob@test.com")
+        headers = user_headers(me)
+        client.post(f"/swipes/{alice.id}", json={"direction": "left"}, headers=headers)
+        etag = client.get("/swipes", headers=headers).headers["etag"]
+        assert revalidate(client, "/swipes", headers, etag).status_code == 304
+
+        # Someone else's swipe changes nothing for me.
+        client.post(f"/swipes/{bob.id}", json={"direction": "left"}, headers=user_headers(alice))
+        assert revalidate(client, "/swipes", headers, etag).status_code == 304
+
+        alice.bio = "updated"
+        db.commit()
+        resp = revalidate(client, "/swipes", headers, etag)
+        assert resp.status_code == 200
+        assert resp.json()[0]["target_user"]["bio"] == "updated"
+
+        etag = resp.headers["etag"]
+        client.post(f"/swipes/{bob.id}", json={"direction": "right"}, headers=headers)
+        assert revalidate(client, "/swipes", headers, etag).status_code == 200
+
+    def test_new_match_invalidates_both_sides(self, client, db):
+        alice = seed_user(db, email="alice@test.com")
+        bob = seed_user(db, email="bob@test.com")
+        etags = {u.id: client.get("/swipes/matches", headers=user_headers(u)).headers["etag"] for u in (alice, bob)}
+        client.post(f"/swipes/{bob.id}", json={"direction": "right"}, headers=user_headers(alice))
+        for user in (alice, bob):
+            assert revalidate(client, "/swipes/matches", user_headers(user), etags[user.id]).status_code == 304
+        client.post(f"/swipes/{alice.id}", json={"direction": "right"}, headers=user_headers(bob))
+        for user in (alice, bob):
+            resp = revalidate(client, "/swipes/matches", user_headers(user), etags[user.id])
+            assert resp.status_code == 200
+            assert len(resp.json()) == 1
+
+    def test_matchmaker_status_change(self, client, db, queries):
+        me = seed_user(db, email="me@test.com")
+        alice = seed_user(db, email="alice@test.com")
+        headers = user_headers(me)
+        client.post(f"/swipes/{alice.id}", json={"direction": "right"}, headers=headers)
+        etag = client.get("/matchmaker", headers=headers).headers["etag"]
+        queries.clear()
+        assert revalidate(client, "/matchmaker", headers, etag).status_code == 304
+        assert len(queries) == 1
+
+        entry = db.scalar(select(models.Matchmaker))
+        entry.status = models.MatchmakerStatusEnum.contacted
+        db.commit()
+        resp = revalidate(client, "/matchmaker", headers, etag)
+        assert resp.status_code == 200
+        assert resp.json()[0]["status"] == "contacted"
+
+    def test_fields_get_their_own_etag(self, client, db):
+        user = seed_user(db)
+        headers = user_headers(user)
+        full = client.get("/swipes/matches", headers=headers).headers["etag"]
+        sparse = client.get("/swipes/matches?fields=name,id", headers=headers).headers["etag"]
+        assert sparse != full
+        assert revalidate(client, "/swipes/matches?fields=id,name", headers, sparse).status_code == 304
+        assert revalidate(client, "/swipes/matches", headers, sparse).status_code == 200
+
+    def test_deleted_user_is_not_revalidated(self, client, db):
+        user = seed_user(db)
+        headers = user_headers(user)
+        etag = client.get("/swipes", headers=headers).headers["etag"]
+        # Deleted by another process, so this one's counters never heard of it.
+        db.execute(models.User.__table__.delete().where(models.User.id == user.id))
+        db.commit()
+        assert revalidate(client, "/swipes", headers, etag).status_code == 401
+
+    def test_rolled_back_writes_bump_nothing(self, db):
+        user = seed_user(db)
+        before = versions.tracker.version((PROFILE, user.id))
+        user.bio = "never committed"
+        db.flush()
+        db.rollback()
+        assert versions.tracker.version((PROFILE, user.id)) == before
+
+    def test_disabled(self, client, db, monkeypatch):
+        monkeypatch.setattr(versions.tracker, "enabled", False)
+        user = seed_user(db)
+        resp = client.get("/auth/me", headers=user_headers(user))
+        assert "etag" not in resp.headers
+
+
+class TestVersionTracker:
+    def test_member_change_during_read_withholds_etag(self):
+        tracker = VersionTracker()
+        snapshot = tracker.snapshot((SWIPES, 1))
+        tracker.bump([(PROFILE, 2)])
+        assert not tracker.watch(snapshot, [2])
+        assert tracker.watch(tracker.snapshot((SWIPES, 1)), [2])
+
+    def test_profile_change_bumps_watchers(self):
+        tracker = VersionTracker()
+        snapshot = tracker.snapshot((MATCHES, 1))
+        assert tracker.watch(snapshot, [1, 2])
+        tracker.bump([(PROFILE, 2)])
+        assert tracker.snapshot((MATCHES, 1)).etag != snapshot.etag
+        assert tracker.snapshot((MATCHES, 3)).etag == tracker.snapshot((MATCHES, 3)).etag
+
+    def test_replica_window(self):
+        now = [100.0]
+        tracker = VersionTracker(clock=lambda: now[0])
+        tracker.bump([(PROFILE, 2)])
+        snapshot = tracker.snapshot((SWIPES, 1))
+        assert not tracker.watch(snapshot, [2], stale_window=5.0)
+        now[0] += 6
+        assert tracker.watch(snapshot, [2], stale_window=5.0)
+
+    def test_overflow_starts_a_new_epoch(self):
+        tracker = VersionTracker(max_watches=2)
+        assert tracker.watch(tracker.snapshot((SWIPES, 1)), [2, 3])
+        old = tracker.snapshot((SWIPES, 1))
+        assert not tracker.watch(old, [4])
+        assert tracker.snapshot((SWIPES, 1)).etag != old.etag
@@ -0,0 +1,47 @@
+import zlib
+
+from generate_data import Config, generate_chunk, placeholder_png
+
+
+def config(**overrides):
+    fields = dict(users=200, swipes=4000, right_ratio=0.4, reciprocal_rate=0.5,
+                  photo_ratio=0.5, photo_variants=4, chunk_size=50, seed=7)
+    fields.update(overrides)
+    return Config(**fields)
+
+
+def all_chunks(cfg):
+    return [generate_chunk((cfg, start, min(start + cfg.chunk_size, cfg.users + 1)))
+            for start in range(1, cfg.users + 1, cfg.chunk_size)]
+
+
+class TestGenerateData:
+    def test_chunks_are_deterministic(self):
+        cfg = config()
+        assert generate_chunk((cfg, 1, 51)) == generate_chunk((cfg, 1, 51))
+        assert generate_chunk((cfg, 1, 51)) != generate_chunk((config(seed=8), 1, 51))
+
+    def test_each_pair_swiped_at_most_once_per_direction(self):
+        swipes = [s for chunk in all_chunks(config()) for s in chunk.swipes]
+        keys = [(s[0], s[1]) for s in swipes]
+        assert len(keys) == len(set(keys))
+        assert all(user != target for user, target in keys)
+
+    def test_matches_are_reciprocal_right_swipes(self):
+        chunks = all_chunks(config())
+        rights = {(s[0], s[1]) for c in chunks for s in c.swipes if s[2] == "right"}
+        matches = [m for c in chunks for m in c.matches]
+        assert matches
+        for u1, u2, _ in matches:
+            assert u1 < u2
+            assert (u1, u2) in rights and (u2, u1) in rights
+
+    def test_volume_close_to_requested(self):
+        total = sum(len(c.swipes) for c in all_chunks(config(users=1000, swipes=50_000, chunk_size=250)))
+        assert 40_000 < total < 60_000
+
+    def test_placeholder_png(self):
+        png = placeholder_png(8, (200, 100, 50))
+        assert png.startswith(b"\x89PNG\r\n\x1a\n")
+        idat = png[png.index(b"IDAT") + 4:png.index(b"IEND") - 8]
+        assert len(zlib.decompress(idat)) == 8 * (1 + 8 * 3)
@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, text
+
+from app import models, pagination, serialization
+from app.sharding import ShardRouter, SwipeStore
+from tests.conftest import engine, seed_user, user_headers
+from tests.test_sharding import shard_router
+
+EPOCH = datetime(2026, 1, 1)
+
+
+def swipe(client, user, target, direction="right"):
+    resp = client.post(f"/swipes/{target.id}", json={"direction": direction}, headers=user_headers(user))
+    assert resp.status_code == 201
+
+
+def pages(client, user, url="/swipes/likes-received?limit=2"):
+    """Liker ids on each page, and the first page's X-Total-Count."""
+    seen, total, cursor = [], None, None
+    while True:
+        resp = client.get(f"{url}&cursor={cursor}" if cursor else url, headers=user_headers(user))
+        assert resp.status_code == 200
+        if total is None:
+            total = int(resp.headers[pagination.TOTAL_COUNT_HEADER])
+        else:
+            assert pagination.TOTAL_COUNT_HEADER not in resp.headers
+        seen.append([like["user_id"] for like in resp.json()])
+        cursor = resp.headers.get(pagination.NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return seen, total
+
+
+@pytest.fixture()
+def inbox(db):
+    """``me`` with likes from users 2..6 (some at the same instant), plus a left swipe from 7."""
+    me = seed_user(db, email="me@test.com")
+    others = [seed_user(db, email=f"u{i}@test.com", name=f"User {i}") for i in range(6)]
+    for i, other in enumerate(others):
+        direction = models.SwipeDirectionEnum.left if i == 5 else models.SwipeDirectionEnum.right
+        db.add(models.Swipe(user_id=other.id, target_user_id=me.id, direction=direction,
+                            swiped_at=EPOCH + timedelta(minutes=i // 2)))
+    db.commit()
+    return me, others
+
+
+class TestLikesReceived:
+    def test_pages_newest_first_with_count(self, client, db, inbox):
+        me, others = inbox
+        # minutes: users 2,3 -> 0; 4,5 -> 1; 6 -> 2 (7 swiped left)
+        assert pages(client, me) == ([[6, 5], [4, 3], [2]], 5)
+        like = client.get("/swipes/likes-received?limit=1", headers=user_headers(me)).json()[0]
+        assert like["user"]["name"] == "User 4" and like["liked_at"].startswith("2026-01-01T00:02")
+
+    def test_answered_likes_drop_out(self, client, db, inbox):
+        me, others = inbox
+        swipe(client, me, others[4])              # like back: a match
+        swipe(client, me, others[2], "left")
+        swipe(client, me, others[5])              # they swiped left; not a like to answer
+        assert pages(client, me) == ([[5, 3], [2]], 3)
+        assert pages(client, others[4], "/swipes/likes-received?fields=id") == ([[]], 0)
+
+    def test_conditional_get(self, client, db, inbox, etags):
+        me, others = inbox
+        headers = user_headers(me)
+        etag = client.get("/swipes/likes-received", headers=headers).headers["etag"]
+        assert client.get("/swipes/likes-received", headers={**headers, "If-None-Match": etag}).status_code == 304
+        swipe(client, me, others[0], "left")
+        resp = client.get("/swipes/likes-received", headers={**headers, "If-None-Match": etag})
+        assert resp.status_code == 200 and len(resp.json()) == 4
+        etag = resp.headers["etag"]
+        newcomer = seed_user(db, email="new@test.com")
+        swipe(client, newcomer, me)
+        resp = client.get("/swipes/likes-received", headers={**headers, "If-None-Match": etag})
+        assert resp.status_code == 200 and resp.json()[0]["user_id"] == newcomer.id
+
+    def test_validation(self, client, db, inbox):
+        headers = user_headers(inbox[0])
+        assert client.get("/swipes/likes-received?cursor=nope", headers=headers).status_code == 400
+        assert client.get("/swipes/likes-received?limit=0", headers=headers).status_code == 422
+        assert client.get("/swipes/likes-received").status_code == 403
+
+    def test_likes_first_in_search(self, client, db, inbox):
+        me, others = inbox
+        swipe(client, me, others[4], "left")
+        ids = [p["id"] for p in client.post("/candidates/search", json={"likes_first": True},
+                                              headers=user_headers(me)).json()]
+        assert set(ids[:4]) == {2, 3, 4, 5} and ids[4:] == [7]  # 6 was swiped on
+
+    def test_query_uses_index(self, db, inbox):
+        store = SwipeStore(db, ShardRouter([]))
+        stmt = pagination.paginate(
+            store._likes(1, serialization.LIKE_COLUMNS).where(~store._answered(1)),
+            models.Swipe.swiped_at, models.Swipe.user_id, pagination.Cursor(EPOCH, 5), 10,
+        )
+        compiled = stmt.compile(engine, compile_kwargs={"literal_binds": True})
+        with engine.connect() as conn:
+            plan = " ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+        assert "ix_swipes_target_direction_swiped" in plan
+        assert "(user_id=? AND target_user_id=?)" in plan  # the unique constraint's index
+        assert "TEMP B-TREE" not in plan
+
+
+class TestShardedLikesReceived:
+    def test_gathered_from_every_shard(self, tmp_path, db):
+        router = shard_router(tmp_path, 3)
+        router.create_all()
+        me = seed_user(db, email="me@test.com")
+        others = [seed_user(db, email=f"u{i}@test.com") for i in range(12)]
+        assert len({router.shard_for_user(u.id) for u in others}) == 3
+        store = SwipeStore(db, router)
+        for i, other in enumerate(others):
+            store.add(models.Swipe(user_id=other.id, target_user_id=me.id, direction=models.SwipeDirectionEnum.right,
+                                   swiped_at=EPOCH + timedelta(minutes=i // 3)))
+        for other in others[5:11]:  # me answered most of the newest
+            store.add(models.Swipe(user_id=me.id, target_user_id=other.id, direction=models.SwipeDirectionEnum.left))
+        store.commit()
+
+        expected = [13, 6, 5, 4, 3, 2]
+        seen, cursor = [], None
+        while True:
+            rows = store.likes_received(me.id, serialization.LIKE_COLUMNS, cursor, 2)
+            page, token = pagination.split_page(rows, 2, key=lambda row: (row.swiped_at, row.user_id))
+            seen += [row.user_id for row in page]
+            if token is None:
+                break
+            cursor = pagination.decode_cursor(token)
+        assert seen == expected
+        assert store.count_likes_received(me.id) == len(expected)
+        assert db.scalar(select(models.Swipe.id).limit(1)) is None  # nothing on the primary
+        store.close()
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app import matchmaker_queue, models
+from app.matchmaker_queue import MatchmakerQueue, WorkerPool
+from tests.conftest import engine, seed_user, user_headers
+
+
+@pytest.fixture()
+def now():
+    return [datetime(2026, 1, 1, 12, 0, 0)]
+
+
+@pytest.fixture()
+def queue(now):
+    return MatchmakerQueue(batch_size=2, lease_seconds=30, max_attempts=2, retry_base_seconds=10,
+                           clock=lambda: now[0])
+
+
+@pytest.fixture()
+def backlog(db):
+    """Three queued targets for one agent; returns (agent, user, targets)."""
+    user = seed_user(db, email="me@test.com")
+    targets = [seed_user(db, email=f"t{i}@test.com") for i in range(3)]
+    for target in targets:
+        matchmaker_queue.enqueue(db, user.agent.id, target.id)
+    db.commit()
+    return user.agent, user, targets
+
+
+def statuses(db):
+    db.expire_all()
+    return {m.target_user_id: m.status.value for m in db.scalars(select(models.Matchmaker))}
+
+
+class TestMatchmakerQueue:
+    def test_enqueue_is_idempotent(self, client, db):
+        me = seed_user(db, email="me@test.com")
+        alice = seed_user(db, email="alice@test.com")
+        matchmaker_queue.enqueue(db, me.agent.id, alice.id)
+        matchmaker_queue.enqueue(db, me.agent.id, alice.id)
+        db.commit()
+        assert db.scalar(select(func.count()).select_from(models.Matchmaker)) == 1
+
+        bob = seed_user(db, email="bob@test.com")
+        resp = client.post(f"/swipes/{bob.id}", json={"direction": "right"}, headers=user_headers(me))
+        assert resp.status_code == 201
+        assert db.scalar(select(func.count()).select_from(models.Matchmaker)) == 2
+
+    def test_claims_are_disjoint_batches(self, db, queue, backlog):
+        first = queue.claim(db)
+        second = queue.claim(db)
+        db.commit()
+        assert len(first) == 2 and len(second) == 1
+        assert not {j.id for j in first} & {j.id for j in second}
+        assert queue.claim(db) == []
+        assert queue.backlog(db) == {"ready": 0, "leased": 3, "waiting": 0, "failed": 0}
+
+    def test_expired_lease_is_reclaimed_and_fences_the_old_worker(self, db, queue, now, backlog):
+        stale = queue.claim(db, limit=1)[0]
+        db.commit()
+        now[0] += timedelta(seconds=31)
+        fresh = queue.claim(db, limit=1)[0]
+        assert fresh.id == stale.id and fresh.attempts == 2
+        assert not queue.complete(db, stale, models.MatchmakerStatusEnum.contacted)
+        assert queue.complete(db, fresh, models.MatchmakerStatusEnum.rejected, "not a fit")
+        db.commit()
+        assert statuses(db)[fresh.target_user_id] == "rejected"
+
+    def test_failures_back_off_then_stop(self, db, queue, now, backlog):
+        job = queue.claim(db, limit=1)[0]
+        assert queue.retry(db, job, RuntimeError("agent offline"))
+        db.commit()
+        assert job.id not in {j.id for j in queue.claim(db, limit=3)}
+        db.rollback()
+
+        now[0] += timedelta(seconds=10)
+        job = queue.claim(db, limit=1)[0]
+        assert job.attempts == 2
+        assert not queue.retry(db, job, RuntimeError("agent offline"))
+        db.commit()
+        now[0] += timedelta(hours=1)
+        assert job.id not in {j.id for j in queue.claim(db, limit=3)}
+        db.rollback()
+        assert queue.backlog(db)["failed"] == 1
+        assert db.get(models.Matchmaker, job.id).last_error == "RuntimeError: agent offline"
+
+    def test_pool_processes_backlog(self, client, db, backlog, etags):
+        agent, user, targets = backlog
+        u1, u2 = sorted((user.id, targets[0].id))
+        db.add(models.Match(user1_id=u1, user2_id=u2))
+        db.commit()
+        headers = user_headers(user)
+        etag = client.get("/matchmaker", headers=headers).headers["etag"]
+
+        pool = WorkerPool(MatchmakerQueue(batch_size=2), concurrency=1)
+        assert pool.run_once(engine) == 2
+        assert pool.run_once(engine) == 1
+        assert pool.run_once(engine) == 0
+        assert statuses(db) == {targets[0].id: "matched", targets[1].id: "contacted", targets[2].id: "contacted"}
+        stats = pool.metrics.snapshot()
+        assert (stats["batches"], stats["claimed"], stats["completed"]) == (2, 3, 3)
+        resp = client.get("/matchmaker", headers={**headers, "If-None-Match": etag})
+        assert resp.status_code == 200
+
+    def test_handler_errors_are_retried(self, db, backlog):
+        def broken(db, job):
+            db.add(models.Match(user1_id=job.target_user_id, user2_id=job.target_user_id))
+            raise ValueError("boom")
+
+        pool = WorkerPool(MatchmakerQueue(batch_size=5), concurrency=1, handler=broken)
+        assert pool.run_once(engine) == 3
+        assert pool.metrics.snapshot()["retried"] == 3
+        assert set(statuses(db).values()) == {"pending"}
+        assert db.scalar(select(func.count()).select_from(models.Match)) == 0
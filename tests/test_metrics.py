@@ -0,0 +1,80 @@
+import logging
+import re
+
+from sqlalchemy import create_engine, text
+
+from app import metrics
+from tests.conftest import seed_user, user_headers
+
+
+def sample(body, name, **labels):
+    """The value of one series in a /metrics body, or None."""
+    for line in body.splitlines():
+        match = re.fullmatch(rf"{name}(?:\{{(.*)\}})? (\S+)", line)
+        if match and dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(1) or "")) == labels:
+            return float(match.group(2))
+    return None
+
+
+class TestHistogram:
+    def test_text_format(self):
+        histogram = metrics.Histogram("demo_seconds", "Demo.", ("route",), (0.1, 1))
+        for value in (0.05, 0.1, 0.5, 7):
+            histogram.observe(value, '/a"b')
+        body = "\n".join(histogram.render())
+        assert "# TYPE demo_seconds histogram" in body
+        assert 'demo_seconds_bucket{route="/a\\"b",le="0.1"} 2' in body
+        assert 'demo_seconds_bucket{route="/a\\"b",le="1"} 3' in body
+        assert 'demo_seconds_bucket{route="/a\\"b",le="+Inf"} 4' in body
+        assert sample(body, "demo_seconds_sum", route='/a\\"b') == 7.65
+        assert sample(body, "demo_seconds_count", route='/a\\"b') == 4
+
+
+class TestMetricsEndpoint:
+    def test_per_route_latency_and_sql(self, client, db):
+        user = seed_user(db)
+        before = client.get("/metrics").text
+        count = sample(before, "http_request_duration_seconds_count",
+                       method="GET", route="/swipes/matches", status="200") or 0
+        statements = sample(before, "http_request_sql_statements_sum", route="/swipes/matches") or 0
+        for _ in range(3):
+            assert client.get("/swipes/matches", headers=user_headers(user)).status_code == 200
+        assert client.get("/users/12345/nope").status_code == 404
+
+        resp = client.get("/metrics")
+        assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = resp.text
+        assert sample(body, "http_request_duration_seconds_count",
+                      method="GET", route="/swipes/matches", status="200") == count + 3
+        # Sync endpoints run in the threadpool; their SQL still counts against the route.
+        assert sample(body, "http_request_sql_statements_sum", route="/swipes/matches") >= statements + 3
+        assert sample(body, "http_request_db_seconds_count", route="/swipes/matches") is not None
+        assert sample(body, "http_request_duration_seconds_count",
+                      method="GET", route=metrics.UNMATCHED, status="404") >= 1
+        assert sample(body, "db_query_duration_seconds_count") > 0
+        assert sample(body, "threadpool_threads", state="max") > 0
+        assert sample(body, "matchmaker_jobs_total", event="completed") is not None
+
+    def test_slow_query_log(self, client, db, monkeypatch, caplog):
+        user = seed_user(db)
+        monkeypatch.setattr(metrics, "SLOW_QUERY_SECONDS", 1e-9)
+        with caplog.at_level(logging.WARNING, logger="app.slow_query"):
+            client.get("/swipes/matches", headers=user_headers(user))
+        messages = [r.getMessage() for r in caplog.records if r.name == "app.slow_query"]
+        assert any(" /swipes/matches " in m and "FROM matches" in m for m in messages)
+
+
+class TestPoolInstrumentation:
+    def test_pool_wait_and_gauges(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", pool_size=2)
+        metrics.instrument(engine, "test_pool")
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            body = metrics.render()
+            assert sample(body, "db_pool_checked_out", engine="test_pool") == 1
+            assert sample(body, "db_pool_size", engine="test_pool") == 2
+        engine.dispose()
+        with engine.connect():
+            pass
+        assert sample(metrics.render(), "db_pool_wait_seconds_count", engine="test_pool") == 2
+        metrics._engines.pop("test_pool")
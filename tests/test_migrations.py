@@ -0,0 +1,72 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from app import matchmaker_queue, models
+from app.schema import upgrade
+
+# The tables as the first release created them.
+OLD_SWIPES = [
+    "CREATE TABLE swipes (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, target_user_id INTEGER NOT NULL, "
+    "direction VARCHAR(5) NOT NULL, swiped_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, "
+    "CONSTRAINT uq_swipe_user_target UNIQUE (user_id, target_user_id))",
+    "CREATE INDEX ix_swipes_id ON swipes (id)",
+    "CREATE INDEX ix_swipes_user_id ON swipes (user_id)",
+    "CREATE INDEX ix_swipes_target_user_id ON swipes (target_user_id)",
+]
+OLD_SCHEMA = OLD_SWIPES + [
+    "CREATE TABLE user_photos (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, filename VARCHAR(255) NOT NULL, "
+    "display_order INTEGER, created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL)",
+    "CREATE INDEX ix_user_photos_id ON user_photos (id)",
+    "CREATE INDEX ix_user_photos_user_id ON user_photos (user_id)",
+    "CREATE TABLE matchmakers (id INTEGER PRIMARY KEY, agent_id INTEGER NOT NULL, target_user_id INTEGER NOT NULL, "
+    "status VARCHAR(9) NOT NULL, contact_notes TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL)",
+    "CREATE INDEX ix_matchmakers_id ON matchmakers (id)",
+    "CREATE INDEX ix_matchmakers_agent_id ON matchmakers (agent_id)",
+    "CREATE INDEX ix_matchmakers_target_user_id ON matchmakers (target_user_id)",
+]
+
+
+def old_database(path, statements):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+    return engine
+
+
+def index_names(engine, table):
+    return {index["name"] for index in inspect(engine).get_indexes(table)}
+
+
+class TestUpgrade:
+    def test_brings_old_tables_up_to_the_models(self, tmp_path):
+        engine = old_database(tmp_path / "primary.db", OLD_SCHEMA)
+        shard = old_database(tmp_path / "shard.db", OLD_SWIPES)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO matchmakers (id, agent_id, target_user_id, status) VALUES "
+                              "(1, 1, 2, 'pending'), (2, 1, 2, 'contacted'), (3, 1, 2, 'pending'), "
+                              "(4, 1, 3, 'pending'), (5, 1, 3, 'pending'), (6, 2, 3, 'pending')"))
+
+        planned = upgrade(engine, [shard], dry_run=True)
+        assert "delete 3 duplicate matchmaker rows" in planned
+        assert "ix_matchmakers_agent_id" in index_names(engine, "matchmakers")
+
+        assert upgrade(engine, [shard]) == planned
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT id FROM matchmakers ORDER BY id")).scalars().all() == [2, 4, 6]
+        columns = {column["name"] for column in inspect(engine).get_columns("user_photos")}
+        assert {"content_hash", "variants", "placeholder"} <= columns
+        for table in ("user_photos", "swipes", "matchmakers"):
+            model = models.Base.metadata.tables[table]
+            assert {index.name for index in model.indexes} <= index_names(engine, table)
+        assert "uq_matchmaker_agent_target" in index_names(engine, "matchmakers")
+        assert "ix_matchmakers_agent_id" not in index_names(engine, "matchmakers")
+        for db in (engine, shard):
+            assert "ix_swipes_target_direction_swiped" in index_names(db, "swipes")
+            assert "ix_swipes_target_user_id" not in index_names(db, "swipes")
+        assert upgrade(engine, [shard]) == []
+
+        with Session(engine) as db:
+            matchmaker_queue.enqueue(db, 1, 2)
+            db.commit()
+            assert db.query(models.Matchmaker).filter_by(agent_id=1, target_user_id=2).one().attempts == 0
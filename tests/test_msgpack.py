@@ -0,0 +1,116 @@
+import pytest
+
+from app import serialization, storage
+from app.storage import LocalStorage
+from tests.conftest import seed_user, user_headers
+
+msgpack = serialization.msgpack
+needs_msgpack = pytest.mark.skipif(msgpack is None, reason="msgpack is not installed")
+MSGPACK = {"Accept": "application/msgpack"}
+
+
+@pytest.fixture(autouse=True)
+def local(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", LocalStorage(str(tmp_path)))
+
+
+def undedupe(payload, profile_keys):
+    """The JSON list a deduped MessagePack payload stands for."""
+    profiles = {p["id"]: p for p in payload["profiles"]}
+    items = []
+    for item in payload["items"]:
+        item = dict(item)
+        for key in profile_keys:
+            item[key] = profiles[item[f"{key}_id"]]
+        items.append(item)
+    return items
+
+
+@pytest.fixture()
+def matched(client, db):
+    me = seed_user(db, email="me@test.com")
+    others = [seed_user(db, email=f"u{i}@test.com") for i in range(3)]
+    for other in others:
+        client.post(f"/swipes/{other.id}", json={"direction": "right"}, headers=user_headers(me))
+        client.post(f"/swipes/{me.id}", json={"direction": "right"}, headers=user_headers(other))
+    return me, others
+
+
+class TestNegotiation:
+    @needs_msgpack
+    def test_wants_msgpack(self):
+        assert serialization.wants_msgpack("application/msgpack")
+        assert serialization.wants_msgpack("application/json;q=0.5, application/x-msgpack")
+        assert not serialization.wants_msgpack("application/json, application/msgpack;q=0.5")
+        assert not serialization.wants_msgpack("*/*")
+        assert not serialization.wants_msgpack(None)
+
+    def test_json_when_msgpack_is_missing(self, client, db, monkeypatch):
+        monkeypatch.setattr(serialization, "msgpack", None)
+        user = seed_user(db)
+        resp = client.get("/swipes", headers={**user_headers(user), **MSGPACK})
+        assert resp.headers["content-type"] == "application/json"
+        assert resp.json() == []
+        resp = client.post(f"/swipes/{user.id + 1}", content=b"\x81",
+                           headers={**user_headers(user), "Content-Type": "application/msgpack"})
+        assert resp.status_code == 415
+
+    def test_dedupe(self):
+        me, alice = {"id": 1, "name": "Me"}, {"id": 2, "name": "Alice"}
+        items = [{"id": 9, "user1_id": 1, "user2_id": 2, "user1": me, "user2": alice},
+                 {"id": 8, "user1_id": 1, "user2_id": 1, "user1": me, "user2": me}]
+        payload = serialization.dedupe(items, ("user1", "user2"))
+        assert payload == {"items": [{"id": 9, "user1_id": 1, "user2_id": 2}, {"id": 8, "user1_id": 1, "user2_id": 1}],
+                           "profiles": [me, alice]}
+        assert undedupe(payload, ("user1", "user2")) == items
+
+
+@needs_msgpack
+class TestMsgPackApi:
+    def test_matches_send_each_profile_once(self, client, db, matched):
+        me, others = matched
+        json_body = client.get("/swipes/matches", headers=user_headers(me)).json()
+        resp = client.get("/swipes/matches", headers={**user_headers(me), **MSGPACK})
+        assert resp.headers["content-type"] == "application/msgpack"
+        assert "Accept" in resp.headers["vary"]
+        payload = msgpack.unpackb(resp.content)
+        assert sorted(p["id"] for p in payload["profiles"]) == sorted([me.id, *(o.id for o in others)])
+        assert undedupe(payload, ("user1", "user2")) == json_body
+
+    def test_history_and_search_match_json(self, client, db, matched):
+        me, _ = matched
+        headers = user_headers(me)
+        resp = client.get("/swipes?fields=name", headers={**headers, **MSGPACK})
+        assert undedupe(msgpack.unpackb(resp.content), ("target_user",)) == \
+            client.get("/swipes?fields=name", headers=headers).json()
+        extra = seed_user(db, email="new@test.com")
+        resp = client.post("/candidates/search", json={}, headers={**headers, **MSGPACK})
+        assert [p["id"] for p in msgpack.unpackb(resp.content)] == [extra.id]
+
+    def test_msgpack_request_body_and_transcoded_response(self, client, db):
+        me = seed_user(db, email="me@test.com")
+        alice = seed_user(db, email="alice@test.com")
+        resp = client.post(f"/swipes/{alice.id}", content=msgpack.packb({"direction": "left"}),
+                           headers={**user_headers(me), **MSGPACK, "Content-Type": "application/msgpack"})
+        assert resp.status_code == 201
+        assert resp.headers["content-type"] == "application/msgpack"
+        body = msgpack.unpackb(resp.content)
+        assert body["direction"] == "left"
+        assert body["target_user"]["id"] == alice.id
+
+        resp = client.post(f"/swipes/{alice.id}", content=msgpack.packb({"direction": "sideways"}),
+                           headers={**user_headers(me), "Content-Type": "application/msgpack"})
+        assert resp.status_code == 422
+        resp = client.post(f"/swipes/{alice.id}", content=b"\xc1",
+                           headers={**user_headers(me), "Content-Type": "application/msgpack"})
+        assert resp.status_code == 400
+
+    def test_encodings_get_their_own_etag(self, client, db, etags):
+        user = seed_user(db)
+        headers = user_headers(user)
+        json_etag = client.get("/auth/me", headers=headers).headers["etag"]
+        resp = client.get("/auth/me", headers={**headers, **MSGPACK})
+        assert msgpack.unpackb(resp.content)["id"] == user.id
+        assert resp.headers["etag"] != json_etag
+        resp = client.get("/auth/me", headers={**headers, **MSGPACK, "If-None-Match": json_etag})
+        assert resp.status_code == 200
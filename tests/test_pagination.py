@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, text
+
+from app import matchmaker_queue, models, pagination
+from tests.conftest import engine, seed_user, user_headers
+
+EPOCH = datetime(2026, 1, 1)
+
+
+@pytest.fixture()
+def queue(db):
+    """An agent with 7 entries: ids 1..7, created a minute apart, every third one contacted."""
+    me = seed_user(db, email="me@test.com")
+    other = seed_user(db, email="other@test.com")
+    targets = [seed_user(db, email=f"t{i}@test.com") for i in range(7)]
+    for i, target in enumerate(targets):
+        db.add(models.Matchmaker(
+            agent_id=me.agent.id, target_user_id=target.id, created_at=EPOCH + timedelta(minutes=i % 4),
+            status=models.MatchmakerStatusEnum.contacted if i % 3 == 0 else models.MatchmakerStatusEnum.pending,
+        ))
+    db.add(models.Matchmaker(agent_id=other.agent.id, target_user_id=me.id))
+    db.commit()
+    return me
+
+
+def pages(client, headers, url):
+    """Ids on each page, following X-Next-Cursor to the end."""
+    seen, cursor = [], None
+    while True:
+        resp = client.get(f"{url}{'&' if '?' in url else '?'}cursor={cursor}" if cursor else url, headers=headers)
+        assert resp.status_code == 200
+        seen.append([item["id"] for item in resp.json()])
+        cursor = resp.headers.get(pagination.NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return seen
+
+
+class TestCursor:
+    def test_round_trip(self):
+        cursor = pagination.Cursor(datetime(2026, 1, 1, 12, 30, 0, 123456), 42)
+        assert pagination.decode_cursor(pagination.encode_cursor(*cursor)) == cursor
+
+    def test_garbage(self):
+        for value in ("", "bm9wZQ", "!!"):
+            with pytest.raises(ValueError):
+                pagination.decode_cursor(value)
+
+
+class TestMatchmakerListing:
+    def test_pages_newest_first_with_ties(self, client, db, queue):
+        # created_at minutes: ids 1,5 -> 0; 2,6 -> 1; 3,7 -> 2; 4 -> 3
+        assert pages(client, user_headers(queue), "/matchmaker?limit=3") == [[4, 7, 3], [6, 2, 5], [1]]
+        assert pages(client, user_headers(queue), "/matchmaker") == [[4, 7, 3, 6, 2, 5, 1]]
+
+    def test_status_filter(self, client, db, queue):
+        headers = user_headers(queue)
+        assert pages(client, headers, "/matchmaker?status=contacted&limit=2") == [[4, 7], [1]]
+        assert pages(client, headers, "/matchmaker?status=matched") == [[]]
+        assert client.get("/matchmaker?status=bogus", headers=headers).status_code == 422
+
+    def test_bad_cursor_and_limits(self, client, db, queue):
+        headers = user_headers(queue)
+        assert client.get("/matchmaker?cursor=nope", headers=headers).status_code == 400
+        assert client.get("/matchmaker?limit=0", headers=headers).status_code == 422
+        assert client.get("/matchmaker?limit=1000", headers=headers).status_code == 422
+
+    def test_each_page_has_its_own_etag(self, client, db, queue, etags):
+        headers = user_headers(queue)
+        first = client.get("/matchmaker?limit=3", headers=headers)
+        cursor = first.headers[pagination.NEXT_CURSOR_HEADER]
+        second = client.get(f"/matchmaker?limit=3&cursor={cursor}", headers=headers)
+        assert first.headers["etag"] != second.headers["etag"]
+        again = client.get(f"/matchmaker?limit=3&cursor={cursor}",
+                           headers={**headers, "If-None-Match": second.headers["etag"]})
+        assert again.status_code == 304
+
+    def test_server_default_timestamps_page_without_repeats(self, client, db):
+        me = seed_user(db, email="me@test.com")
+        targets = [seed_user(db, email=f"t{i}@test.com") for i in range(5)]
+        for target in targets:
+            matchmaker_queue.enqueue(db, me.agent.id, target.id)
+        db.commit()
+        seen = [i for page in pages(client, user_headers(me), "/matchmaker?limit=2") for i in page]
+        assert sorted(seen) == [1, 2, 3, 4, 5]
+
+    def test_agentless_user_gets_404(self, client, db):
+        me = seed_user(db, email="me@test.com")
+        db.delete(me.agent)
+        db.commit()
+        assert client.get("/matchmaker", headers=user_headers(me)).status_code == 404
+
+    @pytest.mark.parametrize("status", [None, models.MatchmakerStatusEnum.pending])
+    def test_query_uses_composite_index(self, db, queue, status):
+        stmt = (
+            select(models.Matchmaker.id)
+            .join(models.Agent, models.Agent.id == models.Matchmaker.agent_id)
+            .where(models.Agent.user_id == queue.id)
+        )
+        if status is not None:
+            stmt = stmt.where(models.Matchmaker.status == status)
+        stmt = pagination.paginate(stmt, models.Matchmaker.created_at, models.Matchmaker.id,
+                                   pagination.Cursor(EPOCH, 5), 10)
+        compiled = stmt.compile(engine, compile_kwargs={"literal_binds": True})
+        with engine.connect() as conn:
+            plan = " ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+        expected = "ix_matchmakers_agent_status_created" if status else "ix_matchmakers_agent_created"
+        assert expected in plan
+        assert "TEMP B-TREE" not in plan
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from app import images, storage
+from app.routers import photos
+from app.storage import LocalStorage
+from generate_data import placeholder_png
+from tests.conftest import seed_user, user_headers
+
+PNG = placeholder_png(32, (200, 40, 90))
+
+
+@pytest.fixture()
+def local(tmp_path, monkeypatch):
+    backend = LocalStorage(str(tmp_path))
+    monkeypatch.setattr(storage, "_storage", backend)
+    monkeypatch.setattr(images.pipeline, "submit", lambda *args: None)
+    return backend
+
+
+@pytest.fixture()
+def photo_url(client, db, local):
+    user = seed_user(db)
+    resp = client.post("/users/me/photos", headers=user_headers(user),
+                       files=[("files", ("a.png", PNG, "image/png"))])
+    return resp.json()["photos"][0]["url"]
+
+
+class TestPhotoServing:
+    def test_serves_immutable_photo(self, client, photo_url):
+        resp = client.get(photo_url)
+        assert resp.status_code == 200
+        assert resp.content == PNG
+        assert resp.headers["content-type"] == "image/png"
+        assert resp.headers["content-length"] == str(len(PNG))
+        assert resp.headers["cache-control"] == "public, max-age=31536000, immutable"
+        assert resp.headers["accept-ranges"] == "bytes"
+        digest = photo_url.rsplit("/", 1)[-1].split(".")[0]
+        assert resp.headers["etag"] == f'"{digest}"'
+
+    def test_revalidation_skips_the_disk(self, client, photo_url, local, monkeypatch):
+        etag = client.get(photo_url).headers["etag"]
+        monkeypatch.setattr(local, "path", lambda key: pytest.fail("touched the disk for a 304"))
+        resp = client.get(photo_url, headers={"If-None-Match": f'W/"other", {etag}'})
+        assert resp.status_code == 304
+        assert resp.content == b""
+        assert resp.headers["etag"] == etag
+
+    def test_range_requests(self, client, photo_url):
+        resp = client.get(photo_url, headers={"Range": "bytes=0-9"})
+        assert resp.status_code == 206
+        assert resp.content == PNG[:10]
+        assert resp.headers["content-range"] == f"bytes 0-9/{len(PNG)}"
+
+        resp = client.get(photo_url, headers={"Range": "bytes=-5"})
+        assert resp.content == PNG[-5:]
+        resp = client.get(photo_url, headers={"Range": "bytes=10-"})
+        assert resp.content == PNG[10:]
+
+    def test_unsatisfiable_and_ignored_ranges(self, client, photo_url):
+        resp = client.get(photo_url, headers={"Range": f"bytes={len(PNG)}-"})
+        assert resp.status_code == 416
+        assert resp.headers["content-range"] == f"bytes */{len(PNG)}"
+
+        resp = client.get(photo_url, headers={"Range": "bytes=0-1,5-6"})
+        assert resp.status_code == 200
+        resp = client.get(photo_url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+        assert resp.status_code == 200
+        assert resp.content == PNG
+
+    def test_head(self, client, photo_url):
+        resp = client.head(photo_url)
+        assert resp.status_code == 200
+        assert resp.content == b""
+        assert resp.headers["content-length"] == str(len(PNG))
+
+    def test_rejects_traversal_hidden_and_missing(self, client, local):
+        with open(f"{local.root}/.upload_x.part", "wb") as f:
+            f.write(PNG)
+        assert client.get("/uploads/.upload_x.part").status_code == 404
+        assert client.get("/uploads/../conftest.py").status_code == 404
+        assert client.get("/uploads/ab/cd/missing.png").status_code == 404
+        assert client.get("/uploads/ab").status_code == 404
+
+    def test_flat_files_revalidate(self, client, local):
+        with open(f"{local.root}/user_1_abcd.png", "wb") as f:
+            f.write(PNG)
+        resp = client.get("/uploads/user_1_abcd.png")
+        assert resp.status_code == 200
+        assert resp.headers["cache-control"] == "no-cache"
+        resp = client.get("/uploads/user_1_abcd.png", headers={"If-None-Match": resp.headers["etag"]})
+        assert resp.status_code == 304
+
+    def test_accel_redirect(self, client, photo_url, monkeypatch):
+        monkeypatch.setattr(photos, "PHOTO_ACCEL_REDIRECT_PREFIX", "/_photos")
+        resp = client.get(photo_url)
+        assert resp.headers["x-accel-redirect"] == "/_photos/" + photo_url.removeprefix("/uploads/")
+        assert resp.content == b""
+
+
+class TestPhotoFileResponse:
+    def run(self, response, scope):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(response(scope, None, send))
+        return sent
+
+    def test_zero_copy_when_server_supports_it(self, tmp_path):
+        path = tmp_path / "a.png"
+        path.write_bytes(PNG)
+        sent = self.run(photos.PhotoFileResponse(str(path), 4, 10, 206, {}),
+                        {"type": "http", "extensions": {"http.response.zerocopysend": {}}})
+        assert sent[1]["type"] == "http.response.zerocopysend"
+        assert (sent[1]["offset"], sent[1]["count"]) == (4, 10)
+        assert sent[1]["file"].closed
+
+    def test_chunked_fallback(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(photos, "CHUNK_SIZE", 7)
+        path = tmp_path / "a.png"
+        path.write_bytes(PNG)
+        sent = self.run(photos.PhotoFileResponse(str(path), 3, 20, 206, {}), {"type": "http"})
+        bodies = [m for m in sent if m["type"] == "http.response.body"]
+        assert b"".join(m["body"] for m in bodies) == PNG[3:23]
+        assert [m["more_body"] for m in bodies] == [True, True, False]
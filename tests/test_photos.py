@@ -0,0 +1,315 @@
+import hashlib
+import io
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+from app import blurhash, images, models, photo_store, storage, uploads
+from app.storage import LocalStorage
+from generate_data import placeholder_png
+from tests.conftest import TestingSessionLocal, seed_user, user_headers
+
+PNG = placeholder_png(16, (10, 200, 30))
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 200
+GIF = b"GIF89a" + b"\x00" * 50
+
+
+@pytest.fixture()
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", LocalStorage(str(tmp_path)))
+    yield tmp_path
+    images.pipeline.drain()
+
+
+@pytest.fixture()
+def no_variants(monkeypatch):
+    monkeypatch.setattr(images.pipeline, "submit", lambda *args: None)
+
+
+def upload(client, headers, *files):
+    return client.post("/users/me/photos", headers=headers,
+                       files=[("files", f) for f in files])
+
+
+def stored_files(root):
+    return sorted(
+        os.path.relpath(os.path.join(d, f), root).replace(os.sep, "/")
+        for d, _, names in os.walk(root) for f in names
+    )
+
+
+def url_path(upload_dir, url):
+    return LocalStorage(str(upload_dir)).path(url.removeprefix("/uploads/"))
+
+
+class TestSniffImageType:
+    def test_known_formats(self):
+        assert uploads.sniff_image_type(PNG[:12]) == "png"
+        assert uploads.sniff_image_type(JPEG[:12]) == "jpg"
+        assert uploads.sniff_image_type(GIF[:12]) == "gif"
+        assert uploads.sniff_image_type(b"RIFF\x00\x00\x00\x00WEBP") == "webp"
+
+    def test_unknown(self):
+        assert uploads.sniff_image_type(b"<html><body>") is None
+        assert uploads.sniff_image_type(b"") is None
+
+
+class TestUploadPhotos:
+    def test_upload_streams_to_disk(self, client, db, upload_dir, no_variants):
+        user = seed_user(db)
+        resp = upload(client, user_headers(user), ("a.png", PNG, "image/png"), ("b.jpg", JPEG, "image/jpeg"))
+        assert resp.status_code == 201
+        photos = resp.json()["photos"]
+        assert [p["display_order"] for p in photos] == [0, 1]
+
+        files = stored_files(upload_dir)
+        assert len(files) == 2
+        assert sorted(p["url"].removeprefix("/uploads/") for p in photos) == files
+        with open(url_path(upload_dir, photos[0]["url"]), "rb") as f:
+            assert f.read() == PNG
+
+    def test_extension_follows_content_not_filename(self, client, db, upload_dir):
+        user = seed_user(db)
+        resp = upload(client, user_headers(user), ("photo.jpg", PNG, "image/jpeg"))
+        assert resp.status_code == 201
+        assert resp.json()["photos"][0]["url"].endswith(".png")
+
+    def test_rejects_non_image_bytes(self, client, db, upload_dir, no_variants):
+        user = seed_user(db)
+        resp = upload(client, user_headers(user), ("evil.png", b"<script>alert(1)</script>", "image/png"))
+        assert resp.status_code == 400
+        assert "not a supported image" in resp.json()["detail"]
+        assert stored_files(upload_dir) == []
+
+    def test_rejects_non_image_content_type(self, client, db, upload_dir):
+        user = seed_user(db)
+        resp = upload(client, user_headers(user), ("a.png", PNG, "text/plain"))
+        assert resp.status_code == 400
+
+    def test_rejects_oversized_file_and_cleans_up(self, client, db, upload_dir, no_variants, monkeypatch):
+        monkeypatch.setattr(uploads, "MAX_FILE_SIZE", 1024)
+        user = seed_user(db)
+        resp = upload(client, user_headers(user),
+                      ("ok.png", PNG, "image/png"), ("big.jpg", JPEG + b"\x00" * 2048, "image/jpeg"))
+        assert resp.status_code == 400
+        assert "exceeds" in resp.json()["detail"]
+        assert stored_files(upload_dir) == []
+        assert client.get("/auth/me", headers=user_headers(user)).json()["photos"] == []
+
+    def test_rejects_too_many_photos(self, client, db, upload_dir, no_variants):
+        user = seed_user(db)
+        headers = user_headers(user)
+        files = [(f"{i}.png", PNG, "image/png") for i in range(uploads.MAX_PHOTOS + 1)]
+        resp = upload(client, headers, *files)
+        assert resp.status_code == 400
+        assert "Cannot exceed" in resp.json()["detail"]
+        assert stored_files(upload_dir) == []
+
+    def test_rejects_declared_oversized_body_early(self, client, db, upload_dir):
+        user = seed_user(db)
+        headers = {**user_headers(user), "Content-Type": "multipart/form-data; boundary=x",
+                   "Content-Length": str(100 * 1024 * 1024)}
+        resp = client.post("/users/me/photos", headers=headers, content=b"")
+        assert resp.status_code == 413
+
+    def test_rejects_malformed_content_length(self, client, db, upload_dir):
+        user = seed_user(db)
+        headers = {**user_headers(user), "Content-Type": "multipart/form-data; boundary=x",
+                   "Content-Length": "lots"}
+        resp = client.post("/users/me/photos", headers=headers, content=b"")
+        assert resp.status_code == 400
+
+    def test_delete_photo_removes_file(self, client, db, upload_dir, no_variants):
+        user = seed_user(db)
+        headers = user_headers(user)
+        photo = upload(client, headers, ("a.png", PNG, "image/png")).json()["photos"][0]
+        resp = client.delete(f"/users/me/photos/{photo['id']}", headers=headers)
+        assert resp.status_code == 200
+        assert resp.json()["photos"] == []
+        assert stored_files(upload_dir) == []
+
+
+class TestImagePipeline:
+    def test_variants_generated_after_upload(self, client, db, upload_dir):
+        user = seed_user(db)
+        headers = user_headers(user)
+        big = placeholder_png(900, (90, 140, 220))
+        upload(client, headers, ("big.png", big, "image/png"))
+        images.pipeline.drain()
+
+        me = client.get("/auth/me", headers=headers).json()
+        photo = me["photos"][0]
+        assert photo["url"].endswith(".png")
+        for key, edge in (("thumbnail_url", 160), ("card_url", 640), ("full_url", 900)):
+            assert photo[key].endswith(".webp")
+            with Image.open(url_path(upload_dir, photo[key])) as img:
+                assert max(img.size) == edge
+
+    def test_profile_uses_card_and_thumbnail_variants(self, client, db, upload_dir):
+        owner = seed_user(db, email="owner@test.com")
+        viewer = seed_user(db, email="viewer@test.com")
+        upload(client, user_headers(owner), ("a.png", PNG, "image/png"))
+        images.pipeline.drain()
+
+        card = client.post("/candidates/search", json={}, headers=user_headers(viewer)).json()[0]
+        assert card["photo_url"] == card["photos"][0]["card_url"]
+        assert card["thumbnail_url"] == card["photos"][0]["thumbnail_url"]
+
+    def test_variant_urls_fall_back_to_original(self, client, db, upload_dir, no_variants):
+        user = seed_user(db)
+        photo = upload(client, user_headers(user), ("a.png", PNG, "image/png")).json()["photos"][0]
+        assert photo["thumbnail_url"] == photo["card_url"] == photo["url"]
+
+    def test_delete_removes_variants(self, client, db, upload_dir):
+        user = seed_user(db)
+        headers = user_headers(user)
+        photo = upload(client, headers, ("a.png", PNG, "image/png")).json()["photos"][0]
+        images.pipeline.drain()
+        assert len(stored_files(upload_dir)) == 1 + len(images.VARIANTS)
+
+        client.delete(f"/users/me/photos/{photo['id']}", headers=headers)
+        assert stored_files(upload_dir) == []
+
+
+class TestPhotoStore:
+    def test_key_is_sharded_by_content_hash(self, client, db, upload_dir):
+        user = seed_user(db)
+        photo = upload(client, user_headers(user), ("a.png", PNG, "image/png")).json()["photos"][0]
+        digest = hashlib.sha256(PNG).hexdigest()
+        assert photo["url"] == f"/uploads/{digest[:2]}/{digest[2:4]}/{digest}.png"
+        assert db.get(models.UserPhoto, photo["id"]).content_hash == digest
+
+    def test_identical_uploads_share_one_blob(self, client, db, upload_dir, no_variants):
+        alice = seed_user(db, email="alice@test.com")
+        bob = seed_user(db, email="bob@test.com")
+        a = upload(client, user_headers(alice), ("a.png", PNG, "image/png")).json()["photos"][0]
+        b = upload(client, user_headers(bob), ("b.png", PNG, "image/png")).json()["photos"][0]
+        assert a["url"] == b["url"]
+        assert len(stored_files(upload_dir)) == 1
+
+        client.delete(f"/users/me/photos/{a['id']}", headers=user_headers(alice))
+        assert len(stored_files(upload_dir)) == 1
+        client.delete(f"/users/me/photos/{b['id']}", headers=user_headers(bob))
+        assert stored_files(upload_dir) == []
+
+    def test_failed_upload_keeps_blobs_in_use(self, client, db, upload_dir, no_variants, monkeypatch):
+        owner = seed_user(db, email="owner@test.com")
+        other = seed_user(db, email="other@test.com")
+        upload(client, user_headers(owner), ("a.png", PNG, "image/png"))
+        monkeypatch.setattr(uploads, "MAX_FILE_SIZE", 1024)
+        resp = upload(client, user_headers(other),
+                      ("a.png", PNG, "image/png"), ("big.jpg", JPEG + b"\x00" * 2048, "image/jpeg"))
+        assert resp.status_code == 400
+        assert len(stored_files(upload_dir)) == 1
+
+    def test_release_waits_for_an_upload_of_the_same_blob(self, client, db, upload_dir, no_variants, monkeypatch):
+        alice = seed_user(db, email="alice@test.com")
+        bob = seed_user(db, email="bob@test.com")
+        photo = upload(client, user_headers(alice), ("a.png", PNG, "image/png")).json()["photos"][0]
+        digest = hashlib.sha256(PNG).hexdigest()
+        key = photo_store.blob_key(digest, "png")
+        db.delete(db.get(models.UserPhoto, photo["id"]))
+        db.commit()
+
+        local = storage.get_storage()
+        put_file = local.put_file
+        other = TestingSessionLocal()
+        released, threads = [], []
+
+        def put_then_release(source, target):
+            created = put_file(source, target)
+            # Alice's delete checks references after Bob's blob is in but before his row commits.
+            thread = threading.Thread(target=lambda: released.append(photo_store.release(other, local, key, digest)))
+            thread.start()
+            thread.join(0.2)
+            assert thread.is_alive()
+            threads.append(thread)
+            return created
+
+        monkeypatch.setattr(local, "put_file", put_then_release)
+        resp = upload(client, user_headers(bob), ("b.png", PNG, "image/png"))
+        threads[0].join()
+        other.close()
+        assert resp.status_code == 201 and released == [False]
+        assert stored_files(upload_dir) == [key]
+
+    def test_shared_blob_renders_variants_once(self, client, db, upload_dir, monkeypatch):
+        alice = seed_user(db, email="alice@test.com")
+        bob = seed_user(db, email="bob@test.com")
+        upload(client, user_headers(alice), ("a.png", PNG, "image/png"))
+        images.pipeline.drain()
+        monkeypatch.setattr(storage.get_storage(), "open", lambda key: pytest.fail("re-rendered"))
+        photo = upload(client, user_headers(bob), ("b.png", PNG, "image/png")).json()["photos"][0]
+        images.pipeline.drain()
+        db.expire_all()
+        assert db.get(models.UserPhoto, photo["id"]).variants["thumb"].endswith("_thumb.webp")
+
+
+class TestMigrateFlat:
+    def test_moves_and_deduplicates_flat_files(self, db, tmp_path):
+        user = seed_user(db)
+        for name in ("user_1_aaaa.png", "user_1_bbbb.png"):
+            (tmp_path / name).write_bytes(PNG)
+        (tmp_path / "user_1_aaaa_thumb.webp").write_bytes(b"thumb")
+        db.add_all([
+            models.UserPhoto(user_id=user.id, filename="user_1_aaaa.png",
+                             variants={"thumb": "user_1_aaaa_thumb.webp"}),
+            models.UserPhoto(user_id=user.id, filename="user_1_bbbb.png", display_order=1),
+            models.UserPhoto(user_id=user.id, filename="gone.png", display_order=2),
+        ])
+        db.commit()
+
+        assert photo_store.migrate_flat(db, str(tmp_path), LocalStorage(str(tmp_path)), dry_run=True)["files"] == 2
+        assert len(stored_files(tmp_path)) == 3
+
+        counts = photo_store.migrate_flat(db, str(tmp_path), LocalStorage(str(tmp_path)))
+        assert counts == {"files": 2, "photos": 2, "deduplicated": 1, "missing": 1}
+        digest = hashlib.sha256(PNG).hexdigest()
+        key = photo_store.blob_key(digest, "png")
+        assert stored_files(tmp_path) == [key, key.replace(".png", "_thumb.webp")]
+        first, second, _ = sorted(user.photos, key=lambda p: p.id)
+        assert first.filename == second.filename == key
+        assert first.content_hash == digest
+        assert first.thumbnail_url == f"/uploads/{key.replace('.png', '_thumb.webp')}"
+
+
+class TestPlaceholders:
+    def test_blurhash_of_solid_colour(self):
+        hash_ = blurhash.encode(bytes([200, 100, 50]) * 64, 8, 8, 4, 3)
+        assert len(hash_) == 1 + 1 + 4 + 2 * 11
+        assert hash_[0] == blurhash.BASE83[3 + 2 * 9]
+        dc = sum(blurhash.BASE83.index(c) * 83 ** (3 - i) for i, c in enumerate(hash_[2:6]))
+        assert (dc >> 16, (dc >> 8) & 255, dc & 255) == (200, 100, 50)
+
+    def test_upload_response_includes_placeholder(self, client, db, upload_dir, no_variants):
+        user = seed_user(db)
+        photo = upload(client, user_headers(user), ("a.png", PNG, "image/png")).json()["photos"][0]
+        assert len(photo["placeholder"]) == 28
+
+        viewer = seed_user(db, email="viewer@test.com")
+        card = client.post("/candidates/search", json={}, headers=user_headers(viewer)).json()[0]
+        assert card["photo_placeholder"] == photo["placeholder"]
+
+    def test_portrait_uses_more_vertical_components(self):
+        buf = io.BytesIO()
+        Image.new("RGB", (40, 90), (10, 20, 30)).save(buf, "PNG")
+        buf.seek(0)
+        assert images.make_placeholder(buf)[0] == blurhash.BASE83[2 + 3 * 9]
+
+    def test_undecodable_image_has_no_placeholder(self, client, db, upload_dir, no_variants):
+        user = seed_user(db)
+        photo = upload(client, user_headers(user), ("a.jpg", JPEG, "image/jpeg")).json()["photos"][0]
+        assert photo["placeholder"] is None
+
+    def test_pipeline_backfills_missing_placeholder(self, client, db, upload_dir, no_variants):
+        user = seed_user(db)
+        photo_id = upload(client, user_headers(user), ("a.png", PNG, "image/png")).json()["photos"][0]["id"]
+        photo = db.get(models.UserPhoto, photo_id)
+        expected, photo.placeholder = photo.placeholder, None
+        db.commit()
+
+        images.process_photo(photo_id, db.get_bind(), storage.get_storage())
+        db.expire_all()
+        assert db.get(models.UserPhoto, photo_id).placeholder == expected
@@ -0,0 +1,36 @@
+import pytest
+
+from app import models, profiles, storage
+from app.storage import LocalStorage
+from tests.conftest import seed_user
+
+
+@pytest.fixture(autouse=True)
+def local(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", LocalStorage(str(tmp_path)))
+
+
+@pytest.fixture()
+def users(db):
+    ids = [seed_user(db, email=f"u{i}@test.com", name=f"User {i}").id for i in range(5)]
+    for user_id in ids[:3]:
+        for order in (1, 0):
+            db.add(models.UserPhoto(user_id=user_id, filename=f"ab/cd/{user_id}_{order}.png", display_order=order))
+    db.commit()
+    db.expunge_all()
+    return ids
+
+
+class TestProfileCards:
+    def test_cards_skip_the_identity_map(self, db, users, monkeypatch):
+        monkeypatch.setattr(profiles, "BATCH_SIZE", 2)
+        cards = profiles.cards_by_id(db, users + [999])
+        assert sorted(cards) == users
+        assert len(db.identity_map) == 0
+        assert [p.filename for p in cards[users[0]].photos] == [f"ab/cd/{users[0]}_0.png", f"ab/cd/{users[0]}_1.png"]
+        assert cards[users[4]].photos == []
+        assert not hasattr(cards[users[0]], "__dict__")
+
+    def test_cards_keep_query_order(self, db, users):
+        stmt = profiles.card_query().where(models.User.id.in_(users[:3])).order_by(models.User.id.desc())
+        assert [c.id for c in profiles.cards(db, stmt)] == users[2::-1]
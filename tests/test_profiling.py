@@ -0,0 +1,139 @@
+import contextvars
+import logging
+import threading
+import time
+
+import anyio
+import anyio.to_thread
+import pytest
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app import profiling
+from app.dependencies import get_db
+from app.main import create_app
+from tests.conftest import TestingSessionLocal, engine, seed_user, user_headers
+
+TOKEN = "let-me-see"
+SLOW_SQL = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 300000) SELECT count(*) FROM n"
+
+
+def spin(seconds=0.05):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def slow_endpoint(db=Depends(get_db)):
+    spin()
+    return {"count": db.execute(text(SLOW_SQL)).scalar()}
+
+
+@pytest.fixture()
+def profiled_client(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", TOKEN)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_INTERVAL_SECONDS", 0.001)
+    app = create_app()
+    app.add_api_route("/slow", slow_endpoint, methods=["GET"])
+
+    def override_get_db():
+        session = TestingSessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    with TestClient(app) as c:
+        yield c
+
+
+def stacks(folded):
+    return [line.rsplit(" ", 1)[0].split(";") for line in folded.splitlines()]
+
+
+class TestProfile:
+    def test_samples_enlisted_threads_with_sql(self):
+        profile = profiling.Profile(interval=0.001)
+        token = profiling._current.set(profile)
+
+        def work():
+            profiling.enlist()
+            spin()
+            with engine.connect() as conn:
+                conn.execute(text(SLOW_SQL))
+
+        try:
+            profile.start()
+            # Like the threadpool, run the work in a copy of the request's context.
+            worker = threading.Thread(target=contextvars.copy_context().run, args=(work,))
+            worker.start()
+            worker.join()
+            spin(0.02)  # the caller isn't enlisted; none of this is sampled
+            profile.stop()
+        finally:
+            profiling._current.reset(token)
+
+        folded = stacks(profile.folded("demo"))
+        assert folded and all(stack[0] == "demo" for stack in folded)
+        assert any(any(f.startswith("spin (tests/test_profiling.py:") for f in s) for s in folded)
+        assert any(s[-1].startswith("SQL WITH RECURSIVE n(i) AS") for s in folded)
+        assert not any(f.startswith("pytest_pyfunc_call") for s in folded for f in s)
+        assert profile.statements == 1 and profile.sql_seconds > 0
+
+    def test_idle_workers_are_skipped(self):
+        profile = profiling.Profile()
+
+        async def main():
+            await anyio.to_thread.run_sync(profile.enlist)
+            # The worker is back in the pool, waiting for its next task.
+            await anyio.sleep(0.01)
+            profile.sample()
+
+        anyio.run(main)
+        assert len(profile.threads) == 1 and profile.samples == 1 and not profile.stacks
+
+
+class TestProfilingMiddleware:
+    def test_disabled_by_default(self):
+        assert not profiling.enabled()
+        assert profiling.ProfilingMiddleware not in [m.cls for m in create_app().user_middleware]
+
+    def test_header_writes_a_file(self, profiled_client, tmp_path, caplog):
+        with caplog.at_level(logging.INFO, logger="app.profiling"):
+            resp = profiled_client.get("/slow", headers={profiling.PROFILE_HEADER: TOKEN})
+        assert resp.status_code == 200 and resp.json() == {"count": 300000}
+        name = resp.headers["x-profile-file"]
+        assert name.endswith("-GET-slow-" + name.rsplit("-", 1)[1]) and name.endswith(".folded")
+        folded = stacks((tmp_path / name).read_text())
+        assert all(stack[0] == "GET /slow" for stack in folded)
+        assert any(s[-1].startswith("SQL WITH RECURSIVE") for s in folded)
+        assert any(any(f.startswith("slow_endpoint (tests/test_profiling.py:") for f in s) for s in folded)
+        assert any("GET /slow 200" in r.getMessage() and "1 SQL statements" in r.getMessage()
+                   for r in caplog.records)
+
+    def test_inline(self, profiled_client, tmp_path, db):
+        user = seed_user(db)
+        headers = {**user_headers(user), profiling.PROFILE_HEADER: TOKEN, profiling.OUTPUT_HEADER: "inline"}
+        resp = profiled_client.post("/candidates/search", json={"q": "hiking"}, headers=headers)
+        assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/plain")
+        assert resp.headers["x-profiled-status"] == "200"
+        assert int(resp.headers["x-profile-sql-statements"]) >= 1
+        assert all(stack[0] == "POST /candidates/search" for stack in stacks(resp.text))
+        resp = profiled_client.get("/slow", headers={**headers, "Accept-Encoding": "gzip"})
+        assert resp.headers["x-profiled-status"] == "200" and "slow_endpoint" in resp.text
+        assert list(tmp_path.iterdir()) == []
+
+    def test_wrong_or_missing_token(self, profiled_client, tmp_path):
+        for headers in ({profiling.PROFILE_HEADER: "guess"}, {}):
+            resp = profiled_client.get("/health", headers=headers)
+            assert resp.json() == {"status": "ok"} and "x-profile-file" not in resp.headers
+        assert list(tmp_path.iterdir()) == []
+
+    def test_sampling(self, profiled_client, tmp_path, monkeypatch):
+        monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+        resp = profiled_client.get("/health")
+        assert resp.json() == {"status": "ok"} and "x-profile-file" not in resp.headers
+        assert [p.name.split("-")[1:3] for p in tmp_path.iterdir()] == [["GET", "health"]]
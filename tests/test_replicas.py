@@ -0,0 +1,129 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app import models, replicas
+from app.database import Base
+from app.replicas import ReplicaRouter
+from tests.conftest import seed_user, user_headers
+
+
+def fake_engine(checked_out=0):
+    return SimpleNamespace(pool=SimpleNamespace(checkedout=lambda: checked_out))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestReplicaRouter:
+    def test_disabled_without_replicas(self):
+        assert not ReplicaRouter([]).enabled
+
+    def test_unknown_strategy_rejected(self):
+        with pytest.raises(ValueError):
+            ReplicaRouter([fake_engine()], strategy="random")
+
+    def test_round_robin_cycles(self):
+        router = ReplicaRouter([fake_engine(), fake_engine(), fake_engine()])
+        assert [router.pick() for _ in range(6)] == [0, 1, 2, 0, 1, 2]
+
+    def test_least_connections_prefers_idle_replica(self):
+        router = ReplicaRouter(
+            [fake_engine(5), fake_engine(0), fake_engine(3)],
+            strategy="least_connections",
+        )
+        assert {router.pick() for _ in range(5)} == {1}
+
+    def test_least_connections_spreads_ties(self):
+        router = ReplicaRouter([fake_engine(), fake_engine()], strategy="least_connections")
+        assert {router.pick() for _ in range(4)} == {0, 1}
+
+    def test_read_your_writes_window(self):
+        clock = FakeClock()
+        router = ReplicaRouter([fake_engine()], read_your_writes_seconds=5, clock=clock)
+        assert not router.recently_wrote(1)
+
+        router.record_write(1)
+        clock.now += 4
+        assert router.recently_wrote(1)
+        assert not router.recently_wrote(2)
+
+        clock.now += 2
+        assert not router.recently_wrote(1)
+
+    def test_old_writes_are_pruned(self):
+        clock = FakeClock()
+        router = ReplicaRouter([fake_engine()], read_your_writes_seconds=5, clock=clock)
+        for user_id in range(1000):
+            router.record_write(user_id)
+            clock.now += 1
+        assert list(router._last_write) == [995, 996, 997, 998, 999]
+        router.record_write(997)  # a second write moves to the back
+        clock.now += 4
+        router.record_write(5000)
+        assert list(router._last_write) == [997, 5000]
+
+
+@pytest.fixture()
+def replica_engine(monkeypatch):
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(replicas, "router", ReplicaRouter([engine]))
+    yield engine
+    Base.metadata.drop_all(bind=engine)
+
+
+def copy_to_replica(engine, user, **overrides):
+    with Session(engine) as replica:
+        fields = {c.name: getattr(user, c.name) for c in models.User.__table__.columns}
+        fields.update(overrides)
+        replica.add(models.User(**fields))
+        replica.commit()
+
+
+class TestReadRouting:
+    def test_reads_go_to_replica(self, client, db, replica_engine):
+        user = seed_user(db, name="Primary Name")
+        copy_to_replica(replica_engine, user, name="Replica Name")
+
+        resp = client.get("/auth/me", headers=user_headers(user))
+        assert resp.status_code == 200
+        assert resp.json()["name"] == "Replica Name"
+
+    def test_user_missing_on_replica_falls_back_to_primary(self, client, db, replica_engine):
+        user = seed_user(db)
+        resp = client.get("/auth/me", headers=user_headers(user))
+        assert resp.status_code == 200
+        assert resp.json()["id"] == user.id
+
+    def test_own_write_reads_from_primary(self, client, db, replica_engine):
+        user = seed_user(db, bio="old bio")
+        copy_to_replica(replica_engine, user)
+        headers = user_headers(user)
+
+        client.patch("/users/me", json={"bio": "new bio"}, headers=headers)
+
+        resp = client.get("/auth/me", headers=headers)
+        assert resp.json()["bio"] == "new bio"
+
+    def test_other_users_writes_do_not_pin_reader(self, client, db, replica_engine):
+        writer = seed_user(db, email="writer@test.com")
+        reader = seed_user(db, email="reader@test.com", name="Reader")
+        copy_to_replica(replica_engine, reader, name="Reader (replica)")
+
+        client.patch("/users/me", json={"bio": "changed"}, headers=user_headers(writer))
+
+        resp = client.get("/auth/me", headers=user_headers(reader))
+        assert resp.json()["name"] == "Reader (replica)"
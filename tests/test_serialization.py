@@ -0,0 +1,110 @@
+import json
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from app import models, schemas, serialization, storage
+from app.storage import LocalStorage
+from tests.conftest import seed_user, user_headers
+
+
+@pytest.fixture(autouse=True)
+def local(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", LocalStorage(str(tmp_path)))
+
+
+def add_photo(db, user, key, order=0, **fields):
+    db.add(models.UserPhoto(user_id=user.id, filename=key, display_order=order, **fields))
+    db.commit()
+
+
+def schema_json(response_type, objs):
+    """What the response_model path would send for ``objs``."""
+    adapter = serialization.adapter(response_type)
+    return json.loads(adapter.dump_json(adapter.validate_python(objs, from_attributes=True)))
+
+
+def by_id(items):
+    # Rows created within the same second have no defined order.
+    return sorted(items, key=lambda item: item["id"])
+
+
+@pytest.fixture()
+def people(client, db):
+    me = seed_user(db, email="me@test.com", name="Me")
+    alice = seed_user(db, email="alice@test.com", name="Alice", income_range=models.IncomeRangeEnum.k50_100,
+                      education=models.EducationEnum.phd, industry=models.IndustryEnum.legal)
+    bob = seed_user(db, email="bob@test.com", name="Bob", gender="male", bio=None)
+    add_photo(db, alice, "ab/cd/a.png", order=1)
+    add_photo(db, alice, "ab/cd/b.png", order=0, placeholder="LEHV6nWB2yk8pyo0adR*.7kCMdnj",
+              variants={"thumb": "ab/cd/b_thumb.webp", "card": "ab/cd/b_card.webp"})
+    for target in (alice, bob):
+        client.post(f"/swipes/{target.id}", json={"direction": "right"}, headers=user_headers(me))
+    client.post(f"/swipes/{me.id}", json={"direction": "right"}, headers=user_headers(alice))
+    db.expire_all()
+    return me, alice, bob
+
+
+class TestFastSerialization:
+    def test_history_matches_schema(self, client, db, people):
+        me, alice, bob = people
+        resp = client.get("/swipes", headers=user_headers(me))
+        assert resp.status_code == 200
+        swipes = db.scalars(
+            select(models.Swipe)
+            .options(joinedload(models.Swipe.target_user).joinedload(models.User.photos))
+            .where(models.Swipe.user_id == me.id)
+            .order_by(models.Swipe.swiped_at.desc())
+        ).unique().all()
+        assert by_id(resp.json()) == by_id(schema_json(list[schemas.SwipeResponse], swipes))
+
+        card = next(s["target_user"] for s in resp.json() if s["target_user_id"] == alice.id)
+        assert [p["url"] for p in card["photos"]] == ["/uploads/ab/cd/b.png", "/uploads/ab/cd/a.png"]
+        assert card["photo_url"] == "/uploads/ab/cd/b_card.webp"
+        assert card["photos"][0]["full_url"] == "/uploads/ab/cd/b.png"
+        assert card["income_range"] == "50K-100K"
+
+    def test_matches_and_matchmakers_match_schema(self, client, db, people):
+        me, alice, bob = people
+        resp = client.get("/swipes/matches", headers=user_headers(me))
+        assert resp.json() == schema_json(list[schemas.MatchResponse], db.scalars(select(models.Match)).all())
+        assert len(resp.json()) == 1
+
+        resp = client.get("/matchmaker", headers=user_headers(me))
+        rows = db.scalars(select(models.Matchmaker).order_by(models.Matchmaker.created_at.desc())).all()
+        assert by_id(resp.json()) == by_id(schema_json(list[schemas.MatchmakerResponse],
+                                                       [m for m in rows if m.agent.user_id == me.id]))
+
+    def test_search_matches_schema(self, client, db, people):
+        me, alice, bob = people
+        resp = client.post("/candidates/search", json={}, headers=user_headers(bob))
+        users = db.scalars(select(models.User).where(models.User.id != bob.id)).all()
+        assert resp.headers["content-type"] == "application/json"
+        assert by_id(resp.json()) == by_id(schema_json(list[schemas.ProfileResponse], users))
+
+    def test_sparse_fields(self, client, db, people):
+        me, alice, bob = people
+        resp = client.get("/swipes?fields=thumbnail_url,name", headers=user_headers(me))
+        cards = {s["target_user_id"]: s["target_user"] for s in resp.json()}
+        assert cards[alice.id] == {"id": alice.id, "name": "Alice", "thumbnail_url": "/uploads/ab/cd/b_thumb.webp"}
+        assert cards[bob.id] == {"id": bob.id, "name": "Bob", "thumbnail_url": None}
+
+        resp = client.post("/candidates/search?fields=id", json={}, headers=user_headers(bob))
+        assert sorted(resp.json(), key=lambda p: p["id"]) == [{"id": me.id}, {"id": alice.id}]
+        resp = client.get("/swipes/matches?fields=photos", headers=user_headers(me))
+        assert set(resp.json()[0]["user1"]) == {"id", "photos"}
+
+    def test_unknown_fields_rejected(self, client, db, people):
+        me, alice, bob = people
+        resp = client.get("/matchmaker?fields=id,email", headers=user_headers(me))
+        assert resp.status_code == 400
+        assert "email" in resp.json()["detail"]
+
+    def test_dumps_without_orjson(self, monkeypatch):
+        payload = {"gender": models.GenderEnum.female, "n": [1, None], "s": "é"}
+        fast = serialization.dumps(payload)
+        monkeypatch.setattr(serialization, "orjson", None)
+        assert json.loads(serialization.dumps(payload)) == json.loads(fast) == {
+            "gender": "female", "n": [1, None], "s": "é",
+        }
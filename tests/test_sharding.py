@@ -0,0 +1,153 @@
+import pytest
+from sqlalchemy import create_engine, func, inspect, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app import models, sharding
+from app.sharding import ShardRouter, jump_hash, rebalance
+from tests.conftest import seed_user, user_headers
+
+
+def shard_router(tmp_path, n, prefix="shard"):
+    return ShardRouter([
+        create_engine(f"sqlite:///{tmp_path / f'{prefix}{i}.db'}") for i in range(n)
+    ])
+
+
+def swipe_count(engine, **filters):
+    with Session(engine) as s:
+        stmt = select(func.count()).select_from(models.Swipe)
+        for column, value in filters.items():
+            stmt = stmt.where(getattr(models.Swipe, column) == value)
+        return s.scalar(stmt)
+
+
+@pytest.fixture()
+def shards(tmp_path, monkeypatch):
+    router = shard_router(tmp_path, 2)
+    router.create_all()
+    monkeypatch.setattr(sharding, "router", router)
+    return router
+
+
+def users_on_different_shards(db, router):
+    users = [seed_user(db, email=f"u{i}@test.com", name=f"User {i}") for i in range(6)]
+    first = users[0]
+    other = next(u for u in users if router.shard_for_user(u.id) != router.shard_for_user(first.id))
+    return first, other, users
+
+
+class TestJumpHash:
+    def test_deterministic_and_in_range(self):
+        for key in range(1000):
+            assert jump_hash(key, 7) == jump_hash(key, 7)
+            assert 0 <= jump_hash(key, 7) < 7
+
+    def test_single_bucket(self):
+        assert {jump_hash(k, 1) for k in range(100)} == {0}
+
+    def test_growing_moves_only_to_new_bucket(self):
+        moved = [k for k in range(10_000) if jump_hash(k, 4) != jump_hash(k, 5)]
+        assert all(jump_hash(k, 5) == 4 for k in moved)
+        assert 1500 < len(moved) < 2500
+
+
+class TestUnsharded:
+    def test_swipes_stay_on_primary(self, client, db):
+        alice = seed_user(db, email="a@test.com")
+        bob = seed_user(db, email="b@test.com")
+        client.post(f"/swipes/{bob.id}", json={"direction": "right"}, headers=user_headers(alice))
+        client.post(f"/swipes/{alice.id}", json={"direction": "right"}, headers=user_headers(bob))
+
+        assert db.scalar(select(func.count()).select_from(models.Swipe)) == 2
+        assert len(client.get("/swipes", headers=user_headers(alice)).json()) == 1
+        assert len(client.get("/swipes/matches", headers=user_headers(alice)).json()) == 1
+
+
+class TestShardedSwipes:
+    def test_swipe_stored_on_swipers_shard(self, client, db, shards):
+        alice, bob, _ = users_on_different_shards(db, shards)
+        resp = client.post(f"/swipes/{bob.id}", json={"direction": "left"},
+                           headers=user_headers(alice))
+        assert resp.status_code == 201
+        assert resp.json()["target_user"]["id"] == bob.id
+
+        home = shards.engines[shards.shard_for_user(alice.id)]
+        away = shards.engines[shards.shard_for_user(bob.id)]
+        assert swipe_count(home, user_id=alice.id) == 1
+        assert swipe_count(away) == 0
+
+    def test_duplicate_swipe_rejected(self, client, db, shards):
+        alice, bob, _ = users_on_different_shards(db, shards)
+        client.post(f"/swipes/{bob.id}", json={"direction": "right"}, headers=user_headers(alice))
+        resp = client.post(f"/swipes/{bob.id}", json={"direction": "left"},
+                           headers=user_headers(alice))
+        assert resp.status_code == 409
+
+    def test_reciprocal_match_across_shards(self, client, db, shards):
+        alice, bob, _ = users_on_different_shards(db, shards)
+        client.post(f"/swipes/{bob.id}", json={"direction": "right"}, headers=user_headers(alice))
+        client.post(f"/swipes/{alice.id}", json={"direction": "right"}, headers=user_headers(bob))
+
+        resp = client.get("/swipes/matches", headers=user_headers(alice))
+        assert len(resp.json()) == 1
+
+    def test_history_and_search_exclusion(self, client, db, shards):
+        alice, bob, users = users_on_different_shards(db, shards)
+        headers = user_headers(alice)
+        client.post(f"/swipes/{bob.id}", json={"direction": "right"}, headers=headers)
+
+        history = client.get("/swipes", headers=headers).json()
+        assert [s["target_user"]["name"] for s in history] == [bob.name]
+
+        found = {p["id"] for p in client.post("/candidates/search", json={}, headers=headers).json()}
+        assert bob.id not in found
+        assert found == {u.id for u in users} - {alice.id, bob.id}
+
+    def test_shard_tables_have_no_user_foreign_keys(self, shards):
+        for engine in shards.engines:
+            assert inspect(engine).get_table_names() == ["swipes"]
+            assert inspect(engine).get_foreign_keys("swipes") == []
+            assert "ix_swipes_target_direction_swiped" in {i["name"] for i in inspect(engine).get_indexes("swipes")}
+
+    def test_failed_primary_commit_removes_shard_swipes(self, db, shards, monkeypatch):
+        alice, bob, _ = users_on_different_shards(db, shards)
+        store = sharding.SwipeStore(db, shards)
+        store.add(models.Swipe(user_id=alice.id, target_user_id=bob.id, direction=models.SwipeDirectionEnum.right))
+        db.add(models.Match(user1_id=alice.id, user2_id=bob.id))
+
+        def fail():
+            raise OperationalError("COMMIT", {}, Exception("primary went away"))
+
+        monkeypatch.setattr(db, "commit", fail)
+        with pytest.raises(OperationalError):
+            store.commit()
+        store.close()
+        assert swipe_count(shards.engines[shards.shard_for_user(alice.id)]) == 0
+
+
+class TestRebalance:
+    def _seed(self, router, pairs):
+        for user_id, target_id in pairs:
+            with router.session(router.shard_for_user(user_id)) as s:
+                s.add(models.Swipe(user_id=user_id, target_user_id=target_id,
+                                   direction=models.SwipeDirectionEnum.right))
+                s.commit()
+
+    def test_grow_from_two_to_three_shards(self, tmp_path):
+        source = shard_router(tmp_path, 2)
+        source.create_all()
+        target = ShardRouter(source.engines + [create_engine(f"sqlite:///{tmp_path / 'shard2.db'}")])
+        pairs = [(u, t) for u in range(1, 31) for t in (100, 101)]
+        self._seed(source, pairs)
+
+        expected = sum(1 for u, _ in pairs if target.shard_for_user(u) == 2)
+        assert rebalance(source, target, batch_size=7, dry_run=True) == expected
+        assert rebalance(source, target, batch_size=7) == expected
+
+        for user_id in range(1, 31):
+            home = target.engines[target.shard_for_user(user_id)]
+            assert swipe_count(home, user_id=user_id) == 2
+        assert sum(swipe_count(e) for e in target.engines) == len(pairs)
+
+        assert rebalance(source, target) == 0
@@ -0,0 +1,167 @@
+import pytest
+from sqlalchemy import select, update
+
+np = pytest.importorskip("numpy")
+
+from app import models, similarity  # noqa: E402
+from app.similarity import IVFIndex, embed  # noqa: E402
+from tests.conftest import seed_user, user_headers  # noqa: E402
+
+HIKER = dict(gender="male", age=30, location="Denver", tags="hiking,camping,coffee",
+             bio="Weekends in the mountains, trail running and campfire coffee.")
+
+
+def clustered(n, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = similarity._normalized(rng.standard_normal((clusters, dim)).astype(np.float32))
+    points = centers[rng.integers(0, clusters, n)] + 0.1 * rng.standard_normal((n, dim)).astype(np.float32)
+    return np.arange(1, n + 1), similarity._normalized(points).astype(np.float16)
+
+
+def exact(ids, vectors, query, k):
+    scores = vectors.astype(np.float32) @ query
+    return set(ids[np.argsort(-scores)[:k]].tolist())
+
+
+class TestEmbedding:
+    def test_similar_profiles_score_higher(self, db):
+        me = seed_user(db, email="me@test.com", **HIKER)
+        alike = seed_user(db, email="alike@test.com", **{**HIKER, "age": 32, "tags": "hiking,coffee,climbing",
+                                                         "bio": "Trail running in the mountains."})
+        unlike = seed_user(db, email="unlike@test.com", gender="female", age=55, location="Paris",
+                           tags="opera,wine", bio="Gallery openings and late dinners.")
+        a, b, c = embed(me), embed(alike), embed(unlike)
+        assert np.linalg.norm(a) == pytest.approx(1.0, abs=1e-5)
+        assert a @ b > a @ c
+        assert np.array_equal(a, embed(me))
+
+    def test_encoding_is_compact(self, db):
+        vector = embed(seed_user(db, **HIKER))
+        blob = similarity.encode(vector)
+        assert len(blob) == 2 * similarity.SIMILARITY_DIM
+        assert np.allclose(similarity.decode(blob), vector, atol=1e-2)
+
+
+class TestIVFIndex:
+    def test_recall_against_exact_search(self):
+        ids, vectors = clustered(5000, 32, 50)
+        index = IVFIndex(dim=32, nprobe=8, min_train=1000)
+        index.build(ids, vectors)
+        assert len(index.lists) == 70 and len(index) == 5000
+        queries = vectors[:50].astype(np.float32)
+        recall = np.mean([len({i for i, _ in index.search(q, 10)} & exact(ids, vectors, q, 10)) / 10
+                          for q in queries])
+        assert recall >= 0.9
+
+    def test_add_update_remove(self):
+        ids, vectors = clustered(2000, 16, 10)
+        index = IVFIndex(dim=16, nprobe=2, min_train=500)
+        index.build(ids, vectors)
+        query = vectors[0].astype(np.float32)
+
+        index.add(9999, query)
+        assert index.search(query, 1)[0][0] in (1, 9999)
+        assert 9999 in {i for i, _ in index.search(query, 2)}
+        assert len(index) == 2001
+
+        index.add(9999, -query)  # update moves it to another list
+        assert 9999 not in {i for i, _ in index.search(query, 10)}
+        assert np.allclose(index.get(9999), -query, atol=1e-2)
+        assert len(index) == 2001
+
+        for user_id in (9999, 1, 2, 3):
+            index.remove(user_id)
+        assert index.get(1) is None and len(index) == 1997
+        assert all(index.get(int(i)) is not None for i in ids[3:])
+
+    def test_exclusions_widen_the_probe(self):
+        ids, vectors = clustered(2000, 16, 40)
+        index = IVFIndex(dim=16, nprobe=1, min_train=500)
+        index.build(ids, vectors)
+        query = vectors[0].astype(np.float32)
+        nearby = [i for i, _ in index.search(query, 200)]
+        hits = index.search(query, 5, exclude=nearby)
+        assert len(hits) == 5 and not set(nearby) & {i for i, _ in hits}
+        assert [s for _, s in hits] == sorted((s for _, s in hits), reverse=True)
+
+    def test_adds_during_a_build_are_kept(self):
+        ids, vectors = clustered(100, 8, 4)
+        index = IVFIndex(dim=8)
+        index.add(1, vectors[0])  # not built yet: ignored
+        with index.buffering():
+            index.add(500, vectors[1].astype(np.float32))
+            index.build(ids, vectors)
+        assert len(index) == 101 and index.get(500) is not None
+
+
+class TestSimilarEndpoint:
+    def test_most_similar_first(self, client, db):
+        me = seed_user(db, email="me@test.com", gender="female")
+        subject = seed_user(db, email="subject@test.com", **HIKER)
+        close = seed_user(db, email="close@test.com", **{**HIKER, "age": 31, "tags": "hiking,camping"})
+        closer = seed_user(db, email="closer@test.com", **HIKER)
+        far = seed_user(db, email="far@test.com", gender="female", age=60, location="Rome", tags="opera", bio=None)
+        swiped = seed_user(db, email="swiped@test.com", **HIKER)
+        assert similarity.backfill(db) == 6
+        client.post(f"/swipes/{swiped.id}", json={"direction": "left"}, headers=user_headers(me))
+
+        resp = client.get(f"/candidates/similar/{subject.id}?fields=id", headers=user_headers(me))
+        assert resp.status_code == 200
+        assert [p["id"] for p in resp.json()] == [closer.id, close.id, far.id]
+        resp = client.get(f"/candidates/similar/{subject.id}?limit=1", headers=user_headers(me))
+        assert [p["id"] for p in resp.json()] == [closer.id]
+
+    def test_profile_updates_reach_the_index(self, client, db):
+        me = seed_user(db, email="me@test.com", gender="female", tags="opera", bio="Opera nights")
+        subject = seed_user(db, email="subject@test.com", **HIKER)
+        other = seed_user(db, email="other@test.com", gender="male", age=40, tags="golf", bio="Golf")
+        similarity.backfill(db)
+        headers = user_headers(me)
+        assert client.get(f"/candidates/similar/{subject.id}", headers=headers).status_code == 200  # builds it
+
+        resp = client.patch("/users/me", json={"tags": HIKER["tags"], "bio": HIKER["bio"]},
+                            headers=user_headers(other))
+        assert resp.status_code == 200
+        stored = db.scalar(select(models.ProfileVector.vector).where(models.ProfileVector.user_id == other.id))
+        assert np.allclose(similarity.decode(stored), similarity.index.get(other.id), atol=1e-2)
+        hits = similarity.index.search(similarity.index.get(subject.id), 1, exclude={subject.id})
+        assert hits[0][0] == other.id
+
+    def test_refresh_picks_up_vectors_written_elsewhere(self, db, monkeypatch):
+        old = seed_user(db, email="old@test.com", **HIKER)
+        similarity.backfill(db)
+        index = similarity.get_index(db)
+        monkeypatch.setattr(similarity, "_synced_at", models.utcnow() - 2 * similarity.REFRESH_OVERLAP)
+        new = seed_user(db, email="new@test.com", **HIKER)
+        similarity.backfill(db)  # another process, as far as this index knows
+        assert index.get(new.id) is None
+
+        monkeypatch.setattr(similarity, "SIMILARITY_REFRESH_SECONDS", 0)
+        assert similarity.get_index(db).get(new.id) is None  # refreshing is off
+        monkeypatch.setattr(similarity, "SIMILARITY_REFRESH_SECONDS", 1e-9)
+        similarity.get_index(db)
+        assert index.get(new.id) is not None and index.get(old.id) is not None
+        db.execute(update(models.ProfileVector).where(models.ProfileVector.user_id == old.id)
+                   .values(updated_at=models.utcnow() - 2 * similarity.REFRESH_OVERLAP))
+        db.commit()
+        assert similarity.refresh(db) == 1  # rows updated since the last refresh, less the overlap
+
+    def test_rolled_back_changes_are_not_indexed(self, db):
+        user = seed_user(db, **HIKER)
+        similarity.get_index(db)
+        similarity.save_vector(db, user)
+        db.rollback()
+        assert similarity.index.get(user.id) is None
+        similarity.save_vector(db, user)
+        db.commit()
+        assert similarity.index.get(user.id) is not None
+
+    def test_subject_without_a_vector_and_unknown_users(self, client, db):
+        me = seed_user(db, email="me@test.com")
+        similarity.backfill(db)
+        subject = seed_user(db, email="subject@test.com", **HIKER)  # inserted after the backfill
+        headers = user_headers(me)
+        resp = client.get(f"/candidates/similar/{subject.id}", headers=headers)
+        assert resp.status_code == 200 and resp.json() == []
+        assert client.get("/candidates/similar/999", headers=headers).status_code == 404
+        assert client.get(f"/candidates/similar/{subject.id}?limit=0", headers=headers).status_code == 422
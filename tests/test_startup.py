@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+from fastapi import FastAPI
+
+from app.database import SessionLocal, get_engine
+from app.main import create_app
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generous enough for a cold CI box; a regression back to import-time DDL or
+# engine creation shows up as files in the working directory, not just time.
+IMPORT_TIME_BUDGET_SECONDS = float(os.getenv("IMPORT_TIME_BUDGET_SECONDS", "3.0"))
+
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import app.main
+import app.database
+print(time.perf_counter() - start)
+print(app.database._engine is None)
+"""
+
+
+def run_import(cwd):
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT}
+    env.pop("AUTO_CREATE_SCHEMA", None)
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    elapsed, engine_untouched = result.stdout.split()
+    return float(elapsed), engine_untouched == "True"
+
+
+class TestStartup:
+    def test_import_has_no_side_effects(self, tmp_path):
+        _, engine_untouched = run_import(tmp_path)
+        assert engine_untouched
+        assert os.listdir(tmp_path) == []
+
+    def test_import_within_budget(self, tmp_path):
+        elapsed, _ = run_import(tmp_path)
+        assert elapsed < IMPORT_TIME_BUDGET_SECONDS
+
+    def test_create_app_returns_fresh_instances(self):
+        first, second = create_app(), create_app()
+        assert isinstance(first, FastAPI)
+        assert first is not second
+        assert {r.path for r in first.routes} == {r.path for r in second.routes}
+
+    def test_session_binds_engine_on_first_use(self):
+        with SessionLocal() as session:
+            assert session.get_bind() is get_engine()
+
+    def test_health(self, client):
+        assert client.get("/health").json() == {"status": "ok"}
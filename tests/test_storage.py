@@ -0,0 +1,241 @@
+import base64
+import hashlib
+import io
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from app import images, models, photo_store, storage
+from app.storage import LocalStorage, S3Storage, StorageBackend
+from generate_data import placeholder_png
+from tests.conftest import seed_user, user_headers
+
+PNG = placeholder_png(16, (10, 200, 30))
+PNG_HASH = hashlib.sha256(PNG).hexdigest()
+
+
+class FakeClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3:
+    """In-process stand-in for the boto3 S3 client calls S3Storage makes."""
+
+    PAGE_SIZE = 2
+
+    def __init__(self):
+        self.objects: dict[tuple[str, str], tuple[bytes, dict]] = {}
+        self.presigned: dict[str, dict] = {}
+
+    def _get(self, bucket, key):
+        if (bucket, key) not in self.objects:
+            raise FakeClientError("404")
+        return self.objects[(bucket, key)]
+
+    def head_object(self, Bucket, Key):
+        data, meta = self._get(Bucket, Key)
+        return {"ContentLength": len(data), **meta}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        with open(Filename, "rb") as f:
+            self.objects[(Bucket, Key)] = (f.read(), dict(ExtraArgs or {}))
+
+    def get_object(self, Bucket, Key):
+        data, _ = self._get(Bucket, Key)
+        return {"Body": io.BytesIO(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None):
+        # Like S3, the continuation token marks a position in key order.
+        keys = sorted(k for b, k in self.objects
+                      if b == Bucket and k.startswith(Prefix) and k > (ContinuationToken or ""))
+        page = {"Contents": [{"Key": k} for k in keys[:self.PAGE_SIZE]]}
+        if len(keys) > self.PAGE_SIZE:
+            page.update(IsTruncated=True, NextContinuationToken=keys[self.PAGE_SIZE - 1])
+        return page
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn):
+        assert ClientMethod == "put_object"
+        signature = uuid.uuid4().hex
+        self.presigned[signature] = Params
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?X-Amz-Signature={signature}"
+
+    def http_put(self, url, data, headers):
+        """What S3 does with a client's PUT to a presigned URL; returns the status code."""
+        params = self.presigned.get(parse_qs(urlparse(url).query)["X-Amz-Signature"][0])
+        if params is None:
+            return 403
+        if headers.get("Content-Type") != params["ContentType"] or len(data) != params["ContentLength"]:
+            return 403
+        checksum = base64.b64encode(hashlib.sha256(data).digest()).decode()
+        if headers.get("x-amz-checksum-sha256") != checksum or checksum != params["ChecksumSHA256"]:
+            return 400
+        self.objects[(params["Bucket"], params["Key"])] = (data, {"ContentType": params["ContentType"]})
+        return 200
+
+
+@pytest.fixture()
+def s3(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(storage, "_storage", S3Storage(fake, "photos-bucket", "https://cdn.test/", prefix="photos/"))
+    yield fake
+    images.pipeline.drain()
+
+
+@pytest.fixture()
+def local(tmp_path, monkeypatch):
+    backend = LocalStorage(str(tmp_path))
+    monkeypatch.setattr(storage, "_storage", backend)
+    yield backend
+    images.pipeline.drain()
+
+
+def ticket(client, headers, data=PNG, content_type="image/png"):
+    return client.post("/users/me/photos/uploads", headers=headers, json={
+        "sha256": hashlib.sha256(data).hexdigest(), "content_type": content_type, "size": len(data),
+    })
+
+
+class TestStorageBackend:
+    def test_backends_must_implement_the_interface(self):
+        class Incomplete(StorageBackend):
+            def exists(self, key):
+                return False
+
+        for cls in (StorageBackend, Incomplete):
+            with pytest.raises(TypeError, match="abstract"):
+                cls()
+        assert isinstance(LocalStorage("uploads"), StorageBackend)
+
+
+class TestS3Storage:
+    def test_put_open_delete(self, tmp_path):
+        fake = FakeS3()
+        backend = S3Storage(fake, "b", "https://cdn.test", prefix="photos/")
+        staged = backend.staging_path()
+        with open(staged, "wb") as f:
+            f.write(PNG)
+        assert backend.put_file(staged, "ab/cd/x.png")
+        assert fake.objects[("b", "photos/ab/cd/x.png")][1]["ContentType"] == "image/png"
+        assert backend.exists("ab/cd/x.png")
+        with backend.open("ab/cd/x.png") as f:
+            assert f.read() == PNG
+        assert backend.url("ab/cd/x.png") == "https://cdn.test/photos/ab/cd/x.png"
+
+        backend.delete("ab/cd/x.png")
+        assert not backend.exists("ab/cd/x.png")
+
+    def test_delete_prefix_follows_pagination(self):
+        fake = FakeS3()
+        backend = S3Storage(fake, "b", "https://cdn.test")
+        for name in ("x_thumb.webp", "x_card.webp", "x_full.webp", "y.png"):
+            fake.objects[("b", name)] = (b"", {})
+        backend.delete_prefix("x_")
+        assert list(fake.objects) == [("b", "y.png")]
+
+    def test_other_errors_propagate(self):
+        fake = FakeS3()
+        fake.head_object = lambda **kw: (_ for _ in ()).throw(FakeClientError("403"))
+        with pytest.raises(FakeClientError):
+            S3Storage(fake, "b", "https://cdn.test").exists("k")
+
+
+class TestPresignedUploads:
+    def test_s3_direct_upload_and_confirm(self, client, db, s3):
+        user = seed_user(db)
+        headers = user_headers(user)
+        resp = ticket(client, headers)
+        assert resp.status_code == 200
+        upload = resp.json()
+        assert upload["key"] == photo_store.blob_key(PNG_HASH, "png")
+        assert upload["exists"] is False
+        assert s3.http_put(upload["upload_url"], PNG, upload["headers"]) == 200
+
+        resp = client.post("/users/me/photos/confirm", headers=headers, json={"key": upload["key"]})
+        assert resp.status_code == 201
+        photo = resp.json()["photos"][0]
+        assert photo["url"] == f"https://cdn.test/photos/{upload['key']}"
+
+        images.pipeline.drain()
+        assert ("photos-bucket", "photos/" + images.variant_filename(upload["key"], "thumb")) in s3.objects
+
+    def test_s3_rejects_bytes_not_matching_the_hash(self, client, db, s3):
+        user = seed_user(db)
+        upload = ticket(client, user_headers(user)).json()
+        tampered = PNG[:-1] + b"\x00"
+        assert s3.http_put(upload["upload_url"], tampered, upload["headers"]) == 400
+        resp = client.post("/users/me/photos/confirm", headers=user_headers(user), json={"key": upload["key"]})
+        assert resp.status_code == 400
+
+    def test_local_direct_upload_and_confirm(self, client, db, local):
+        user = seed_user(db)
+        headers = user_headers(user)
+        upload = ticket(client, headers).json()
+        assert upload["upload_url"].startswith("/storage/uploads/")
+        resp = client.put(upload["upload_url"], content=PNG, headers=upload["headers"])
+        assert resp.status_code == 204
+        assert local.exists(upload["key"])
+
+        resp = client.post("/users/me/photos/confirm", headers=headers, json={"key": upload["key"]})
+        assert resp.status_code == 201
+        assert resp.json()["photos"][0]["url"] == f"/uploads/{upload['key']}"
+
+    def test_local_put_checks_signed_checksum(self, client, db, local):
+        user = seed_user(db)
+        upload = ticket(client, user_headers(user)).json()
+        resp = client.put(upload["upload_url"], content=PNG[:-1] + b"\x00", headers=upload["headers"])
+        assert resp.status_code == 400
+        assert not local.exists(upload["key"])
+
+        resp = client.put(upload["upload_url"], content=PNG + b"\x00", headers=upload["headers"])
+        assert resp.status_code == 413
+
+    def test_local_put_rejects_bad_token(self, client, local):
+        resp = client.put("/storage/uploads/not-a-token", content=PNG, headers={"Content-Type": "image/png"})
+        assert resp.status_code == 403
+
+    def test_ticket_reports_existing_blob(self, client, db, local):
+        owner = seed_user(db, email="owner@test.com")
+        other = seed_user(db, email="other@test.com")
+        upload = ticket(client, user_headers(owner)).json()
+        client.put(upload["upload_url"], content=PNG, headers=upload["headers"])
+        client.post("/users/me/photos/confirm", headers=user_headers(owner), json={"key": upload["key"]})
+
+        upload = ticket(client, user_headers(other)).json()
+        assert upload["exists"] is True
+        resp = client.post("/users/me/photos/confirm", headers=user_headers(other), json={"key": upload["key"]})
+        assert resp.status_code == 201
+
+    def test_ticket_validation(self, client, db, local):
+        headers = user_headers(seed_user(db))
+        assert ticket(client, headers, content_type="text/html").status_code == 400
+        resp = client.post("/users/me/photos/uploads", headers=headers, json={
+            "sha256": PNG_HASH, "content_type": "image/png", "size": 50 * 1024 * 1024,
+        })
+        assert resp.status_code == 400
+        resp = client.post("/users/me/photos/uploads", headers=headers, json={
+            "sha256": "nothex", "content_type": "image/png", "size": 10,
+        })
+        assert resp.status_code == 422
+
+    def test_confirm_requires_uploaded_image(self, client, db, local):
+        user = seed_user(db)
+        headers = user_headers(user)
+        resp = client.post("/users/me/photos/confirm", headers=headers, json={"key": "../../etc/passwd"})
+        assert resp.status_code == 400
+        resp = client.post("/users/me/photos/confirm", headers=headers,
+                           json={"key": photo_store.blob_key(PNG_HASH, "png")})
+        assert resp.status_code == 400
+
+        html = b"<html>not an image</html>"
+        upload = ticket(client, headers, data=html).json()
+        client.put(upload["upload_url"], content=html, headers=upload["headers"])
+        resp = client.post("/users/me/photos/confirm", headers=headers, json={"key": upload["key"]})
+        assert resp.status_code == 400
+        assert not local.exists(upload["key"])
+        assert db.query(models.UserPhoto).count() == 0
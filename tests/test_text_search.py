@@ -0,0 +1,69 @@
+import re
+
+from sqlalchemy import text
+
+from app import models, profiles, text_search
+from tests.conftest import engine, seed_user, user_headers
+
+
+def search(client, user, **filters):
+    resp = client.post("/candidates/search", json=filters, headers=user_headers(user))
+    assert resp.status_code == 200
+    return [p["name"] for p in resp.json()]
+
+
+class TestTextSearch:
+    def test_ranked_and_stemmed(self, client, db):
+        me = seed_user(db, email="me@test.com", name="Me", bio="hiking every weekend")
+        seed_user(db, email="a@test.com", name="Bio", tags="coffee", bio="Hikes sometimes, mostly reading")
+        seed_user(db, email="b@test.com", name="Tagged", tags="hiking,coffee", bio="Outdoors")
+        seed_user(db, email="c@test.com", name="Neither", tags="golf", bio="Golf and gin")
+        assert search(client, me, q="hike") == ["Tagged", "Bio"]
+        assert search(client, me, q="Hiking!  coffee") == ["Tagged", "Bio"]
+        assert search(client, me, q="hiking golf") == []
+
+    def test_combined_with_filters(self, client, db):
+        me = seed_user(db, email="me@test.com", name="Me")
+        seed_user(db, email="a@test.com", name="Anna", gender="female", bio="jazz pianist")
+        seed_user(db, email="b@test.com", name="Ben", gender="male", bio="jazz drummer")
+        assert search(client, me, q="jazz", gender="male") == ["Ben"]
+        assert sorted(search(client, me, q="jazz")) == ["Anna", "Ben"]
+
+    def test_operators_are_plain_words(self, client, db):
+        me = seed_user(db, email="me@test.com", name="Me")
+        seed_user(db, email="a@test.com", name="Anna", bio="Rock AND roll, near the sea")
+        assert search(client, me, q='rock AND "roll') == ["Anna"]
+        assert search(client, me, q="NEAR(sea)") == ["Anna"]
+        assert len(search(client, me, q="?!")) == 1  # no words: no text filter
+        resp = client.post("/candidates/search", json={"q": "x" * 201}, headers=user_headers(me))
+        assert resp.status_code == 422
+
+    def test_follows_profile_writes(self, client, db):
+        me = seed_user(db, email="me@test.com", name="Me")
+        other = seed_user(db, email="a@test.com", name="Anna", bio="surfing")
+        resp = client.patch("/users/me", json={"bio": "pottery"}, headers=user_headers(other))
+        assert resp.status_code == 200
+        assert search(client, me, q="surfing") == []
+        assert search(client, me, q="pottery") == ["Anna"]
+        db.delete(db.get(models.User, other.id))
+        db.commit()
+        assert search(client, me, q="pottery") == []
+
+    def test_never_scans_users(self, db):
+        stmt = text_search.search(profiles.card_query().where(models.User.gender == "female"), "sqlite", "hiking")
+        compiled = stmt.compile(engine, compile_kwargs={"literal_binds": True})
+        with engine.connect() as conn:
+            plan = " ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+        assert "users_fts VIRTUAL TABLE" in plan
+        assert not re.search(r"SCAN users\b(?!_)", plan)
+
+    def test_install_indexes_existing_rows(self, client, db):
+        me = seed_user(db, email="me@test.com", name="Me")
+        seed_user(db, email="a@test.com", name="Anna", bio="sailing")
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE users_fts"))
+            conn.execute(text("DROP TRIGGER users_fts_insert"))
+        text_search.install(engine)
+        assert search(client, me, q="sailing") == ["Anna"]
+        seed_user(db, email="b@test.com", name="Ben", bio="sailing")
+        assert sorted(search(client, me, q="sailing")) == ["Anna", "Ben"]